@@ -0,0 +1,108 @@
+"""
+Admin listener of the load balancer, on its own port so that it never competes with proxied traffic.
+
+    GET /metrics   : Prometheus text exposition of the hot path counters (metrics.py)
+    GET /stats     : the same data as JSON (servers, per backend counters and latency percentiles, health, pool,
+                     response cache, circuit breakers / retries / hedges, admission control, PUSH heartbeats)
+    POST /register : backend registration, {"server_ip": "127.0.0.1", "server_port": 3000, "isAlive": 1,
+                     "weight": 1} (weight optional). weight in (0, MAX_WEIGHT] and isAlive 0 / 1, checked like a
+                     PUSH frame, 400 otherwise. Kept off the proxy port so that proxied requests are classified
+                     from their head alone and their bodies never have to be decoded.
+
+usage : LoadBalancer(..., admin_port=5002)  then  curl localhost:5002/metrics
+"""
+
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from log import get_logger
+from metrics import render_prometheus
+from push import check_alive, check_weight
+
+logger = get_logger("admin")
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+MAX_REGISTER_BODY = 4096
+
+
+class AdminRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        lb = self.server.lb
+        path = self.path.split('?', 1)[0]
+        if path == "/metrics":
+            self.reply(200, render_prometheus(lb).encode('utf-8'), PROMETHEUS_CONTENT_TYPE)
+        elif path == "/stats":
+            with lb.server_lock:
+                servers = {addr: dict(server_obj) for addr, server_obj in lb.servers.items()}
+            stats = {
+                "servers": servers,
+                "backends": lb.backend_stats(),
+                "health": lb.health_stats(),
+                "pool": lb.pool_stats(),
+                "cache": lb.cache_stats(),
+                "resilience": lb.resilience_stats(),
+                "admission": lb.admission_stats(),
+                "push": lb.push_stats(),
+            }
+            self.reply(200, json.dumps(stats).encode('utf-8'), "application/json")
+        else:
+            self.reply(404, json.dumps({"message": "Not found"}).encode('utf-8'), "application/json")
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        if path != "/register":
+            self.reply(404, json.dumps({"message": "Not found"}).encode('utf-8'), "application/json")
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            data = json.loads(self.rfile.read(length)) if 0 < length <= MAX_REGISTER_BODY else None
+            server_ip, server_port = data['server_ip'], int(data['server_port'])
+            # checked like a PUSH frame : a bad weight must never reach the registry, every later
+            # refresh_backends would fail on it
+            if not isinstance(server_ip, str) or not server_ip or not 0 < server_port < 65536:
+                raise ValueError(f"bad address {server_ip!r}:{server_port!r}")
+            isAlive = check_alive(data['isAlive'])
+            weight = check_weight(data.get('weight', 1))
+        except (ValueError, KeyError, TypeError):
+            self.reply(400, json.dumps({"message": "Invalid registration request"}).encode('utf-8'),
+                       "application/json")
+            return
+        self.server.lb.register_server(server_ip, server_port, isAlive, weight)
+        self.reply(200, json.dumps({"message": "Registered with load balancer"}).encode('utf-8'), "application/json")
+
+    def reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("admin %s - " + format, self.address_string(), *args)
+
+
+class AdminServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, lb, ip, port):
+        self.lb = lb
+        super().__init__((ip, port), AdminRequestHandler)
+        self.port = self.server_address[1]
+
+    def server_bind(self):
+        # multi process workers share the admin port like the proxy port
+        if self.lb.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="admin", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,230 @@
+"""
+Admission control of the load balancer : decide right after accept() whether a connection is served at all.
+
+    rate limit  : token bucket per client address (`rate` requests per second, bursts of `burst`).
+                  Over the limit -> 429 Too Many Requests with Retry-After.
+    concurrency : global limit on the connections being served. Over the limit -> 503 Service Unavailable.
+                  The limit adapts to the upstream latency the proxy path observes (limiter="gradient" or "aimd"),
+                  or stays at `initial_limit` (limiter="fixed").
+
+A rejection is a precomputed response written with one non blocking send, then the socket is closed : no thread,
+no parsing, no backend. Past saturation the load balancer keeps serving what the backends can take at a steady
+latency (goodput stays flat) and sheds the rest in microseconds, instead of queueing everything until clients
+time out. Admission control is off unless LoadBalancer(admission_options=...) is given.
+
+    limiter  "gradient" : limit = limit * clamp(tolerance * long_rtt / short_rtt, 0.5, 1) + sqrt(limit),
+                          smoothed. long_rtt is a slow moving average of the latency (what the backends do when
+                          they are not queueing), short_rtt a fast one : when requests start to queue upstream,
+                          short_rtt grows and the limit shrinks, when it goes back to normal the limit grows by
+                          sqrt(limit) per sample.
+             "aimd"     : additive increase (+1 per `limit` good samples) and multiplicative decrease (x backoff)
+                          on an error or a latency above `latency_threshold`.
+"""
+
+import math
+import socket
+import threading
+import time
+
+from httputil import build_response
+
+RATE_LIMITED = "rate_limited"
+OVERLOADED = "overloaded"
+
+
+class TokenBucketLimiter:
+    """Token bucket per key. Buckets idle for long enough to be full again are dropped when there are too many."""
+
+    def __init__(self, rate, burst=None, max_keys=100000):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> [tokens, last refill time]
+        self._lock = threading.Lock()
+
+    def allow(self, key, now=None) -> bool:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._sweep(now)
+                bucket = self._buckets[key] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return True
+            bucket[0] = tokens
+            return False
+
+    def retry_after(self) -> int:
+        # seconds until one token is back, for the Retry-After header
+        return max(1, math.ceil(1 / self.rate))
+
+    def _sweep(self, now):
+        # with the lock held : forget clients whose bucket would be full anyway
+        full_after = self.burst / self.rate
+        for key in [key for key, (_, last) in self._buckets.items() if now - last >= full_after]:
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class ConcurrencyLimiter:
+    """Fixed limit on the connections being served, subclasses adapt it from the observed latencies."""
+
+    def __init__(self, initial_limit=200, min_limit=8, max_limit=4000):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.inflight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.inflight >= int(self.limit):
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def observe(self, latency, ok):
+        # one upstream latency sample (None when the request failed before a response head)
+        with self._lock:
+            self._adjust(latency, ok)
+            self.limit = min(self.max_limit, max(self.min_limit, self.limit))
+
+    def _adjust(self, latency, ok):
+        pass
+
+
+class AIMDLimiter(ConcurrencyLimiter):
+
+    def __init__(self, latency_threshold=0.5, backoff_ratio=0.9, **options):
+        super().__init__(**options)
+        self.latency_threshold = latency_threshold
+        self.backoff_ratio = backoff_ratio
+
+    def _adjust(self, latency, ok):
+        if not ok or (latency is not None and latency > self.latency_threshold):
+            self.limit *= self.backoff_ratio
+        elif self.inflight * 2 >= self.limit:
+            # only grow when the limit is actually used
+            self.limit += 1 / self.limit
+
+
+class GradientLimiter(ConcurrencyLimiter):
+
+    def __init__(self, tolerance=1.5, smoothing=0.2, short_window=10, long_window=500, **options):
+        super().__init__(**options)
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.short_alpha = 2 / (short_window + 1)
+        self.long_alpha = 2 / (long_window + 1)
+        self.short_rtt = 0.0
+        self.long_rtt = 0.0
+
+    def _adjust(self, latency, ok):
+        if latency is None:
+            if not ok:
+                # failed before answering : back off like AIMD
+                self.limit *= 0.9
+            return
+        if not self.long_rtt:
+            self.short_rtt = self.long_rtt = latency
+            return
+        self.short_rtt += self.short_alpha * (latency - self.short_rtt)
+        self.long_rtt += self.long_alpha * (latency - self.long_rtt)
+        if self.long_rtt > self.short_rtt * 2:
+            # latency dropped for good (backends scaled up ...) : do not wait for the slow average to follow
+            self.long_rtt = self.short_rtt * 2
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+        if gradient == 1.0 and self.inflight * 2 < self.limit:
+            # the limit is not what holds the traffic back, growing it would not be tested by anything
+            return
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+
+
+LIMITERS = {"fixed": ConcurrencyLimiter, "aimd": AIMDLimiter, "gradient": GradientLimiter}
+
+
+class AdmissionControl:
+    """
+    admission_options of the LoadBalancer :
+        rate, burst : per client token bucket, no rate limit when rate is None
+        limiter     : "gradient" (default), "aimd", "fixed" or None for no concurrency limit
+        the other options go to the limiter (initial_limit, min_limit, max_limit, latency_threshold, tolerance ...)
+    """
+
+    def __init__(self, rate=None, burst=None, max_clients=100000, limiter="gradient", **limiter_options):
+        if limiter is not None and limiter not in LIMITERS:
+            raise ValueError(f"Unknown limiter {limiter!r}, expected one of {tuple(LIMITERS)}")
+        self.rate_limiter = TokenBucketLimiter(rate, burst, max_clients) if rate is not None else None
+        self.limiter = LIMITERS[limiter](**limiter_options) if limiter is not None else None
+        # rejections are built once, sending one is a single syscall
+        retry_after = self.rate_limiter.retry_after() if self.rate_limiter is not None else 1
+        self.responses = {
+            RATE_LIMITED: build_response(
+                429, b'{"message": "Too many requests"}', headers=(("Retry-After", str(retry_after)),)),
+            OVERLOADED: build_response(
+                503, b'{"message": "Load balancer overloaded"}', headers=(("Retry-After", "1"),)),
+        }
+        self.rejected = {RATE_LIMITED: 0, OVERLOADED: 0}
+        self.admitted = 0
+
+    def admit(self, client_ip):
+        """None when the connection may be served (then release() it), else the rejection response"""
+        reason = None
+        if self.rate_limiter is not None and not self.rate_limiter.allow(client_ip):
+            reason = RATE_LIMITED
+        elif self.limiter is not None and not self.limiter.acquire():
+            reason = OVERLOADED
+        # counters are only read for stats, a lost increment under a race does not matter
+        if reason is None:
+            self.admitted += 1
+            return None
+        self.rejected[reason] += 1
+        return self.responses[reason]
+
+    def release(self):
+        if self.limiter is not None:
+            self.limiter.release()
+
+    def observe(self, latency, ok):
+        if self.limiter is not None:
+            self.limiter.observe(latency, ok)
+
+    def stats(self) -> dict:
+        stats = {"admitted": self.admitted, "rejected": dict(self.rejected)}
+        if self.limiter is not None:
+            stats["limit"] = int(self.limiter.limit)
+            stats["inflight"] = self.limiter.inflight
+        if self.rate_limiter is not None:
+            stats["clients"] = len(self.rate_limiter)
+        return stats
+
+
+def reject(client_socket, response):
+    """
+    Fast rejection from the accept loop : drain what the client already sent (closing with unread data would
+    reset the connection before it reads the response), one non blocking send, close.
+    """
+    try:
+        client_socket.setblocking(False)
+        try:
+            while client_socket.recv(65536):
+                pass
+        except BlockingIOError:
+            pass
+        client_socket.send(response)
+        client_socket.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+    finally:
+        client_socket.close()
@@ -0,0 +1,338 @@
+"""
+Load balancing algorithms.
+
+Every algorithm is a small class behind one interface (BalancingAlgorithm) and is created by name through
+BalancingAlgorithmFactory, the same factory idea as PaymentFactoryMethod in
+LLD/Design_Patterns/creational_patterns/factory.py : the load balancer only knows the name it was configured with.
+
+Static algorithms :
+    - RoundRobin          : backends one after the other.
+    - random              : uniform random backend.
+    - WeightedRoundRobin  : smooth weighted round robin. Implemented as earliest-deadline-first (like Envoy) :
+                            a backend of weight w is due every 1/w, which interleaves backends the same way as
+                            nginx's smooth WRR but costs O(log n) per pick instead of O(n).
+Dynamic algorithms, driven by the live counters of LoadTracker which the proxy path updates :
+    - LeastOutstanding    : backend with the fewest in-flight requests, O(1) (see LoadTracker buckets).
+    - PowerOfTwoChoices   : two random backends, keep the one with fewer in-flight requests, O(1).
+    - EWMA                : power of two choices on peak-EWMA latency * (in-flight + 1), O(1).
+    Both also use the in-flight count and utilisation backends push in PUSH mode (push.py, LoadTracker.load_score).
+Sticky algorithms live in their own modules and plug themselves in with BalancingAlgorithmFactory.register :
+    - ConsistentHash      : hash ring with bounded loads (consistent_hash.py).
+
+update(backends, weights) is called whenever the set of healthy backends changes, with an immutable snapshot
+(tuple) of them. choose(request) is called once per request with a RouteContext and must stay cheap.
+"""
+
+import heapq
+import itertools
+import random
+import threading
+from abc import ABC, abstractmethod
+
+from metrics import LatencyHistogram
+
+# weight of a new latency sample in the EWMA
+EWMA_ALPHA = 0.3
+
+
+class RouteContext:
+    """What an algorithm may look at to route a request : head, client address and the small JSON body when the
+    algorithm reads_json."""
+
+    __slots__ = ("head", "client_ip", "json")
+
+    def __init__(self, head=None, client_ip=None, json=None):
+        self.head = head
+        self.client_ip = client_ip
+        self.json = json
+
+
+class BackendStats:
+    """Live counters of one backend, maintained by the proxy path."""
+
+    __slots__ = ("inflight", "ewma_latency", "requests", "errors", "latency", "reported_inflight", "reported_load")
+
+    def __init__(self):
+        self.inflight = 0
+        # pushed by the backend itself (push.py) : its in-flight requests from every client and its utilisation
+        self.reported_inflight = 0
+        self.reported_load = 0.0
+        self.ewma_latency = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()  # upstream latency (until the response head)
+
+    def as_dict(self, histogram=False):
+        stats = {
+            "inflight": self.inflight,
+            "ewma_latency": self.ewma_latency,
+            "requests": self.requests,
+            "errors": self.errors,
+            "p50": self.latency.percentile(50),
+            "p95": self.latency.percentile(95),
+            "p99": self.latency.percentile(99),
+            "reported_inflight": self.reported_inflight,
+            "reported_load": self.reported_load,
+        }
+        if histogram:
+            copy = LatencyHistogram()
+            copy.counts[:] = self.latency.counts
+            copy.sum, copy.count = self.latency.sum, self.latency.count
+            stats["latency"] = copy
+        return stats
+
+
+class LoadTracker:
+    """
+    Per backend in-flight / latency counters.
+
+    For least-outstanding picks the healthy backends are also kept in buckets keyed by their in-flight count,
+    with a pointer to the lowest non empty bucket. A request start / end only moves one backend to the next /
+    previous bucket, so both the update and the pick are O(1).
+    """
+
+    def __init__(self):
+        self._stats = {}      # backend -> BackendStats
+        self._buckets = {}    # in-flight count -> {backend: None} (insertion ordered set)
+        self._members = set() # healthy backends present in the buckets
+        self._min = 0
+        self.total_inflight = 0  # all backends together, for bounded load algorithms
+        self._lock = threading.Lock()
+
+    def _stats_for(self, backend):
+        stats = self._stats.get(backend)
+        if stats is None:
+            stats = self._stats[backend] = BackendStats()
+        return stats
+
+    def update(self, backends):
+        # healthy set changed
+        with self._lock:
+            backends = set(backends)
+            for backend in self._members - backends:
+                self._bucket_remove(backend, self._stats[backend].inflight)
+            for backend in backends - self._members:
+                self._bucket_add(backend, self._stats_for(backend).inflight)
+            self._members = backends
+            self._recompute_min()
+
+    def begin(self, backend):
+        with self._lock:
+            stats = self._stats_for(backend)
+            stats.inflight += 1
+            stats.requests += 1
+            self.total_inflight += 1
+            if backend in self._members:
+                self._move(backend, stats.inflight - 1, stats.inflight)
+
+    def end(self, backend, latency=None, ok=True):
+        with self._lock:
+            stats = self._stats_for(backend)
+            stats.inflight -= 1
+            self.total_inflight -= 1
+            if not ok:
+                stats.errors += 1
+            if latency is not None:
+                stats.latency.observe(latency)
+                # peak EWMA : react to a slow backend at once, forget it slowly
+                if latency > stats.ewma_latency:
+                    stats.ewma_latency = latency
+                else:
+                    stats.ewma_latency += EWMA_ALPHA * (latency - stats.ewma_latency)
+            if backend in self._members:
+                self._move(backend, stats.inflight + 1, stats.inflight)
+
+    def inflight(self, backend) -> int:
+        stats = self._stats.get(backend)
+        return stats.inflight if stats is not None else 0
+
+    def report(self, backend, inflight=None, load=None):
+        # live load signals pushed by the backend
+        with self._lock:
+            stats = self._stats_for(backend)
+            if inflight is not None:
+                stats.reported_inflight = inflight
+            if load is not None:
+                stats.reported_load = load
+
+    def load_score(self, backend) -> float:
+        # our in-flight requests, or what the backend reports when it is more (other load balancers send it
+        # traffic too), scaled up by the utilisation it reports. Without push reports it is just the in-flight count
+        stats = self._stats.get(backend)
+        if stats is None:
+            return 0
+        return max(stats.inflight, stats.reported_inflight) * (1 + stats.reported_load)
+
+    def ewma_latency(self, backend) -> float:
+        stats = self._stats.get(backend)
+        return stats.ewma_latency if stats is not None else 0.0
+
+    def least_loaded(self):
+        with self._lock:
+            bucket = self._buckets.get(self._min)
+            if not bucket:
+                return None
+            return next(iter(bucket))
+
+    def percentile(self, backend, pct, min_samples=0):
+        # None when fewer than min_samples latencies were recorded
+        stats = self._stats.get(backend)
+        if stats is None or stats.latency.count < min_samples:
+            return None if min_samples else 0.0
+        return stats.latency.percentile(pct)
+
+    def stats(self, histograms=False) -> dict:
+        with self._lock:
+            return {backend: stats.as_dict(histograms) for backend, stats in self._stats.items()}
+
+    # bucket helpers, called with the lock held
+    def _bucket_add(self, backend, count):
+        self._buckets.setdefault(count, {})[backend] = None
+
+    def _bucket_remove(self, backend, count):
+        bucket = self._buckets[count]
+        del bucket[backend]
+        if not bucket:
+            del self._buckets[count]
+
+    def _move(self, backend, old, new):
+        self._bucket_remove(backend, old)
+        self._bucket_add(backend, new)
+        if new < self._min:
+            self._min = new
+        elif old == self._min and old not in self._buckets:
+            # the lowest bucket emptied, the backend we moved is now in the next one
+            self._min = new
+
+    def _recompute_min(self):
+        self._min = min(self._buckets) if self._buckets else 0
+
+
+class BalancingAlgorithm(ABC):
+
+    # True when choose() looks at RouteContext.json : only then is a JSON body decoded before routing
+    reads_json = False
+
+    def __init__(self, tracker: LoadTracker):
+        self.tracker = tracker
+        self.backends = ()
+
+    def update(self, backends, weights=None):
+        # backends : healthy backends, weights : backend -> weight (default 1)
+        self.backends = tuple(backends)
+
+    @abstractmethod
+    def choose(self, request=None):
+        pass
+
+
+class RoundRobin(BalancingAlgorithm):
+    """
+    Lock free round robin : next() on itertools.count is a single C call, atomic under the GIL, and
+    self.backends is an immutable tuple replaced in one assignment by update(). A pick never builds a list,
+    never takes a lock and never waits for the heartbeat thread.
+    """
+
+    def __init__(self, tracker):
+        super().__init__(tracker)
+        self.counter = itertools.count()
+
+    def choose(self, request=None):
+        backends = self.backends
+        if not backends:
+            return None
+        # to keep index in bound or rotate the index
+        return backends[next(self.counter) % len(backends)]
+
+
+class RandomChoice(BalancingAlgorithm):
+
+    def choose(self, request=None):
+        backends = self.backends
+        return random.choice(backends) if backends else None
+
+
+class WeightedRoundRobin(BalancingAlgorithm):
+
+    def __init__(self, tracker):
+        super().__init__(tracker)
+        self.heap = []  # (next deadline, tie breaker, backend, 1 / weight)
+        self.lock = threading.Lock()
+
+    def update(self, backends, weights=None):
+        super().update(backends, weights)
+        weights = weights or {}
+        with self.lock:
+            self.heap = []
+            for order, backend in enumerate(self.backends):
+                step = 1.0 / max(weights.get(backend, 1), 1e-9)
+                self.heap.append((step, order, backend, step))
+            heapq.heapify(self.heap)
+
+    def choose(self, request=None):
+        with self.lock:
+            if not self.heap:
+                return None
+            deadline, order, backend, step = self.heap[0]
+            heapq.heapreplace(self.heap, (deadline + step, order, backend, step))
+            return backend
+
+
+class LeastOutstanding(BalancingAlgorithm):
+
+    def choose(self, request=None):
+        return self.tracker.least_loaded()
+
+
+class PowerOfTwoChoices(BalancingAlgorithm):
+
+    def score(self, backend):
+        return self.tracker.load_score(backend)
+
+    def choose(self, request=None):
+        backends = self.backends
+        count = len(backends)
+        if count < 2:
+            return backends[0] if backends else None
+        first = random.randrange(count)
+        # second index drawn among the count - 1 others
+        second = random.randrange(count - 1)
+        if second >= first:
+            second += 1
+        a, b = backends[first], backends[second]
+        return a if self.score(a) <= self.score(b) else b
+
+
+class EWMA(PowerOfTwoChoices):
+
+    def score(self, backend):
+        # expected wait : latency of the backend times the queue in front of us
+        return self.tracker.ewma_latency(backend) * (self.tracker.load_score(backend) + 1)
+
+
+class BalancingAlgorithmFactory:
+
+    algorithms = {
+        "RoundRobin": RoundRobin,
+        "random": RandomChoice,
+        "WeightedRoundRobin": WeightedRoundRobin,
+        "LeastOutstanding": LeastOutstanding,
+        "LeastConnections": LeastOutstanding,
+        "PowerOfTwoChoices": PowerOfTwoChoices,
+        "EWMA": EWMA,
+    }
+
+    @classmethod
+    def register(cls, name):
+        # decorator to plug a new algorithm in without touching the load balancer
+        def decorator(algorithm_cls):
+            cls.algorithms[name] = algorithm_cls
+            return algorithm_cls
+        return decorator
+
+    def get_algorithm(self, name, tracker, **options) -> BalancingAlgorithm:
+        # options : keyword arguments of the algorithm (e.g. key / vnodes for ConsistentHash)
+        algorithm_cls = self.algorithms.get(name)
+        if algorithm_cls is None:
+            raise ValueError(f"Unknown load balancing algorithm {name!r}, expected one of {sorted(self.algorithms)}")
+        return algorithm_cls(tracker, **options)
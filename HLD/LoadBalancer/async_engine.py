@@ -0,0 +1,294 @@
+"""
+Asyncio serving mode for the load balancer.
+
+The threaded mode spawns one thread per accepted connection and blocks that thread on the
+backend call. Here every client connection is a coroutine on a single event loop :
+    accept -> parse head -> choose server -> stream request (non blocking) -> stream response
+so thousands of concurrent clients only cost a few KB each instead of a thread stack.
+
+Classification, registration and heartbeat semantics stay exactly the same, the engine reuses the
+LoadBalancer registry and fast path (classify / choose_server), registration goes through the admin port.
+"""
+
+import asyncio
+import time
+
+from algorithms import RouteContext
+from connection_pool import AsyncConnectionPool
+from log import get_logger
+from httputil import (
+    CLIENT_RESPONSE_HEADERS, MAX_HEAD_SIZE, BodyFramer, HTTPParseError, build_json_response,
+    forwarding_headers, parse_head, parse_json_body,
+)
+from relay import BUFFER_SIZE
+from resilience import RETRYABLE_STATUSES, is_idempotent
+
+logger = get_logger("async")
+
+# how long a rejected connection may take to send its request head
+REJECT_READ_TIMEOUT = 1.0
+
+
+class AsyncProxyEngine:
+
+    def __init__(self, load_balancer, backend_timeout=30):
+        self.lb = load_balancer
+        self.backend_timeout = backend_timeout
+        self.pool = AsyncConnectionPool(load_balancer.pool.max_size, load_balancer.pool.idle_timeout,
+                                        timeout=backend_timeout)
+        self.loop = None
+        self._stopped = None
+
+    def run(self):
+        # entry point of the serving thread : owns the event loop till stop() is called
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        server = await asyncio.start_server(self.handle_client, sock=self.lb.lb_socket, limit=MAX_HEAD_SIZE)
+        async with server:
+            await self._stopped.wait()
+
+    def stop(self):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._stopped.set)
+
+    def evict(self, backend):
+        # called from the heartbeat thread, the pool belongs to the event loop
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.pool.evict, backend)
+
+    async def handle_client(self, reader, writer):
+        # one coroutine per client connection
+        admission = self.lb.admission
+        if admission is not None:
+            # over the rate / concurrency limit : precomputed response, the request is not parsed
+            rejection = admission.admit(writer.get_extra_info('peername')[0])
+            if rejection is not None:
+                writer.write(rejection)
+                try:
+                    # take the request head off the socket first : closing with unread data resets the connection
+                    # before the client reads the response
+                    await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), REJECT_READ_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError):
+                    pass
+                writer.close()
+                return
+        try:
+            await self.serve_client(reader, writer)
+        finally:
+            if admission is not None:
+                admission.release()
+
+    async def serve_client(self, reader, writer):
+        try:
+            head = parse_head(await reader.readuntil(b'\r\n\r\n'), "request")
+            framer = BodyFramer.for_request(head)
+
+            body = None
+            json_data = None
+            read_body_whole, decode_json = self.lb.classify(head, framer)
+            if read_body_whole:
+                body = await reader.readexactly(framer.remaining)
+                framer.skip(len(body))
+                if decode_json:
+                    json_data = parse_json_body(body)
+
+            cache = self.lb.cache
+            cache_key = cache.key_for(head, framer, body) if cache is not None else None
+            flight = None
+            if cache_key is not None:
+                entry, flight, leader = cache.acquire(cache_key)
+                if entry is None and flight is not None and not leader:
+                    # the same request is already on its way to a backend : wait for its response
+                    entry = await flight.wait_async(cache.coalesce_timeout)
+                    if entry is not None:
+                        cache.served_from_flight(entry)
+                    flight = cache_key = None
+                if entry is not None:
+                    writer.write(entry.data)
+                    return
+
+            try:
+                route = RouteContext(head, writer.get_extra_info('peername')[0], json_data)
+                server = self.lb.admit(self.lb.choose_server(self.lb.algorithm, route))
+                if server:
+                    await self.forward(server, reader, writer, head, framer, body, cache_key)
+                else:
+                    writer.write(build_json_response(503, {"message": "No backend server available"}))
+            finally:
+                if flight is not None:
+                    cache.complete(cache_key, flight)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, HTTPParseError):
+            writer.write(build_json_response(400, {"message": "Malformed request"}))
+        except (asyncio.TimeoutError, OSError) as e:
+            logger.warning("Exception occured while forwarding request : %s", e)
+            writer.write(build_json_response(502, {"message": "Backend server failed"}))
+        finally:
+            try:
+                await writer.drain()
+            except OSError:
+                pass
+            writer.close()
+
+    async def forward(self, server, client_reader, client_writer, head, framer, body, cache_key=None):
+        # relay the request to the server over a pooled keep-alive connection, then relay the response back.
+        # bodies are streamed chunk by chunk with their original framing, never buffered whole.
+        # with a cache_key, a cacheable response is also recorded and stored in the cache.
+        # idempotent requests whose body we have are retried on another backend / hedged (see resilience.py).
+        lb = self.lb
+        client_ip = client_writer.get_extra_info('peername')[0]
+        request_head = head.serialize(forwarding_headers(client_ip))
+        # a request can be sent again as long as its body was not streamed yet
+        if body is None and framer.done:
+            body = b""
+        retryable = body is not None and is_idempotent(head)
+        lb.resilience.budget.deposit()
+        tried = []
+        while True:
+            tried.append(server)
+            try:
+                if retryable and lb.resilience.hedge:
+                    server, backend_reader, backend_writer, response_head, latency = await self.hedged_exchange(
+                        server, tried, request_head, body)
+                else:
+                    backend_reader, backend_writer, response_head, latency = await self.exchange(
+                        server, client_reader, request_head, framer, body)
+            except (OSError, HTTPParseError) as e:
+                retry = lb.retry_target(tried) if retryable else None
+                if retry is None:
+                    raise
+                logger.debug("%s failed (%s), retrying on %s", server, e, retry)
+                server = retry
+                continue
+            lb.health.report_success(server)
+            if response_head.status in RETRYABLE_STATUSES and retryable:
+                retry = lb.retry_target(tried)
+                if retry is not None:
+                    # nothing was sent to the client yet : drop this response and ask another backend
+                    logger.debug("%s answered %s, retrying on %s", server, response_head.status, retry)
+                    self.pool.release(server, backend_reader, backend_writer, reusable=False)
+                    lb.finish_attempt(server, False, latency)
+                    server = retry
+                    continue
+            break
+
+        response_framer = BodyFramer.for_response(response_head, head.method)
+        reusable = False
+        recorder = None
+        if cache_key is not None:
+            recorder = lb.cache.recorder_for(response_head, client_writer, cache_key)
+        try:
+            # Forward the response back to the client
+            destination = recorder or client_writer
+            destination.write(response_head.serialize(CLIENT_RESPONSE_HEADERS))
+            clean = await relay_stream(backend_reader, destination, response_framer)
+            if recorder is not None and response_framer.done:
+                lb.cache.store(cache_key, recorder)
+            reusable = clean and response_head.keep_alive and response_framer.mode != BodyFramer.UNTIL_CLOSE
+        except (OSError, HTTPParseError) as e:
+            # the response is already on its way, the client only sees the connection closing
+            logger.warning("Relaying response from %s failed : %s", server, e)
+        finally:
+            self.pool.release(server, backend_reader, backend_writer, reusable)
+            lb.finish_attempt(server, response_head.status < 500, latency)
+
+    async def exchange(self, server, client_reader, request_head, framer, body):
+        # one attempt on one backend : send the request, receive the response head.
+        # returns (reader, writer, response_head, latency), the caller relays the body, releases the connection
+        # and calls finish_attempt. A cancelled attempt (hedge which lost) is not counted as a failure.
+        started = self.lb.begin_attempt(server)
+        for attempt in range(2):
+            try:
+                backend_reader, backend_writer, reused = await self.pool.acquire(server)
+            except OSError as e:
+                # refused / unreachable
+                self.lb.attempt_failed(server, started, e)
+                raise
+            except asyncio.CancelledError:
+                self.lb.attempt_abandoned(server)
+                raise
+            try:
+                # every wait on the backend is bounded by backend_timeout : connect (pool), send, response head
+                backend_writer.write(request_head)
+                if body is not None:
+                    backend_writer.write(body)
+                else:
+                    await relay_stream(client_reader, backend_writer, framer, self.backend_timeout)
+                await asyncio.wait_for(backend_writer.drain(), self.backend_timeout)
+                raw_head = await asyncio.wait_for(backend_reader.readuntil(b'\r\n\r\n'), self.backend_timeout)
+                response_head = parse_head(raw_head, "response")
+            except asyncio.CancelledError:
+                self.pool.release(server, backend_reader, backend_writer, reusable=False)
+                self.lb.attempt_abandoned(server)
+                raise
+            except BaseException as e:
+                self.pool.release(server, backend_reader, backend_writer, reusable=False)
+                if isinstance(e, (asyncio.IncompleteReadError, ConnectionError)):
+                    # stale keep-alive connection : the backend closed it while it was idle
+                    if reused and body is not None and attempt == 0:
+                        continue
+                    e = ConnectionError(f"{server} closed the connection")
+                self.lb.attempt_failed(server, started, e)
+                raise e
+            return backend_reader, backend_writer, response_head, time.monotonic() - started
+
+    async def hedged_exchange(self, server, tried, request_head, body):
+        # exchange() sending the request to a second backend when the response head of the first one is later
+        # than its usual p95 : whichever answers first is kept, the other attempt is cancelled.
+        # returns (backend which answered, reader, writer, response_head, latency)
+        lb = self.lb
+        delay = lb.resilience.hedge_delay(lb.tracker, server)
+        first = asyncio.ensure_future(self.exchange(server, None, request_head, None, body))
+        attempts = {first: server}
+        if delay is not None:
+            done, _ = await asyncio.wait((first,), timeout=delay)
+            hedge = lb.retry_target(tried) if not done else None
+            if hedge is not None:
+                tried.append(hedge)
+                lb.resilience.hedged()
+                attempts[asyncio.ensure_future(self.exchange(hedge, None, request_head, None, body))] = hedge
+        pending = set(attempts)
+        winner = error = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task
+                    else:
+                        # both answered at once : drop the second response
+                        backend_reader, backend_writer, _, _ = task.result()
+                        self.pool.release(attempts[task], backend_reader, backend_writer, reusable=False)
+                        lb.attempt_abandoned(attempts[task])
+        finally:
+            for task in pending:
+                task.cancel()
+        if winner is None:
+            raise error
+        if attempts[winner] != server:
+            lb.resilience.hedged(won=True)
+        return (attempts[winner],) + winner.result()
+
+
+async def relay_stream(reader, writer, framer, write_timeout=None) -> bool:
+    """
+    Relay one body from reader to writer, one read buffer at a time (see relay.relay_body).
+    returns False when the peer sent bytes past the end of the body. write_timeout bounds each wait for the
+    writer to take the bytes (asyncio.TimeoutError).
+    """
+    while not framer.done:
+        data = await reader.read(BUFFER_SIZE)
+        if not data:
+            framer.finish()
+            break
+        stop = framer.consume(data, 0, len(data))
+        writer.write(data if stop == len(data) else memoryview(data)[:stop])
+        # wait for the peer to take the bytes before reading more : memory stays bounded
+        await asyncio.wait_for(writer.drain(), write_timeout)
+        if framer.done:
+            return stop == len(data)
+    return True
@@ -0,0 +1,93 @@
+"""
+Load test : goodput past saturation, with and without admission control.
+
+Two stand-in backends with a bounded capacity (`--capacity` requests at once, `--latency` seconds each, so
+2 * capacity / latency requests per second overall). An open loop generator sends requests at a fixed rate
+whatever the answers take, each step offering more (`--steps`, multiples of the backend capacity). A request is
+goodput when it gets a 200 within `--timeout` seconds : what a real client with a deadline would get.
+
+Without admission control everything is queued, latency grows until requests time out and goodput collapses.
+With it the adaptive concurrency limit follows the upstream latency and sheds the excess with fast 503s :
+goodput stays flat at the backend capacity and the served requests keep their latency.
+
+usage : python benchmarks/bench_admission.py [--duration 3] [--latency 0.02] [--capacity 4] [--steps 0.5,1,2,4]
+                                             [--modes threaded,async] [--limiter gradient]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_serving_modes import percentile  # noqa: E402
+from loadbalancer import LoadBalancer  # noqa: E402
+from loadgen import build_request, open_loop  # noqa: E402
+from standin_backend import StandInBackend  # noqa: E402
+
+GET_PROFILE = build_request("GET", "/profile")
+
+
+def run(mode, admission_options, rps, args):
+    backends = [StandInBackend(latency=args.latency, capacity=args.capacity).start() for _ in range(2)]
+    lb = LoadBalancer("127.0.0.1", 0, "LeastOutstanding", mode=mode, admission_options=admission_options)
+    try:
+        for backend in backends:
+            lb.register_server(backend.host, backend.port, 1)
+        results = asyncio.run(open_loop("127.0.0.1", lb.port, rps, args.duration, args.timeout, GET_PROFILE))
+        limit = lb.admission_stats().get("limit", "-")
+    finally:
+        lb.stop()
+        for backend in backends:
+            backend.stop()
+    served = sorted(latency for status, latency in results if status == 200)
+    shed = sorted(latency for status, latency in results if status in (429, 503))
+    return {
+        "mode": mode,
+        "admission": "on" if admission_options is not None else "off",
+        "offered": rps,
+        "goodput": len(served) / args.duration,
+        "shed": len(shed) / args.duration,
+        "timeouts": sum(1 for status, _ in results if status == "timeout"),
+        "errors": sum(1 for status, _ in results if status not in (200, 429, 503, "timeout")),
+        "p50_ms": percentile(served, 50) * 1000,
+        "p99_ms": percentile(served, 99) * 1000,
+        "shed_p50_ms": percentile(shed, 50) * 1000,
+        "limit": limit,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per step")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--capacity", type=int, default=4, help="concurrent requests per backend")
+    parser.add_argument("--timeout", type=float, default=1.0, help="client deadline in seconds")
+    parser.add_argument("--steps", default="0.5,1,2,4", help="offered load, multiples of the backend capacity")
+    parser.add_argument("--modes", default="threaded,async")
+    parser.add_argument("--limiter", default="gradient", choices=("gradient", "aimd", "fixed"))
+    args = parser.parse_args()
+
+    capacity_rps = 2 * args.capacity / args.latency
+    print(f"backend capacity : {capacity_rps:.0f} requests/s")
+    admission_options = {"limiter": args.limiter, "initial_limit": 4 * args.capacity, "min_limit": args.capacity,
+                         "latency_threshold": 4 * args.latency}
+    if args.limiter != "aimd":
+        del admission_options["latency_threshold"]
+    results = [
+        run(mode, options, capacity_rps * float(step), args)
+        for mode in args.modes.split(",")
+        for options in (None, admission_options)
+        for step in args.steps.split(",")
+    ]
+    print(f"\n{'mode':<10}{'admission':<11}{'offered/s':>10}{'goodput/s':>11}{'shed/s':>9}{'timeouts':>10}"
+          f"{'errors':>8}{'p50 ms':>9}{'p99 ms':>9}{'shed p50 ms':>13}{'limit':>7}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['admission']:<11}{r['offered']:>10.0f}{r['goodput']:>11.1f}{r['shed']:>9.1f}"
+              f"{r['timeouts']:>10}{r['errors']:>8}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['shed_p50_ms']:>13.2f}"
+              f"{r['limit']:>7}")
+
+
+if __name__ == "__main__":
+    main()
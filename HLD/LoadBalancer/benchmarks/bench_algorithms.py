@@ -0,0 +1,126 @@
+"""
+Simulation benchmark of the load balancing algorithms with heterogeneous backends.
+
+No sockets : a discrete event simulation feeds Poisson arrivals to every algorithm of
+BalancingAlgorithmFactory, each backend being a FIFO queue with `workers` parallel workers and
+exponential service times. The LoadTracker is updated exactly like the proxy path does
+(begin when the request is sent, end with its latency), so dynamic algorithms see the same signals.
+
+Also measures the cost of one pick with 10 and 1000 backends.
+
+usage : python benchmarks/bench_algorithms.py [--requests 200000] [--load 0.8]
+"""
+
+import argparse
+import heapq
+import os
+import random
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algorithms import BalancingAlgorithmFactory, LoadTracker  # noqa: E402
+
+# (name, parallel workers, mean service time in seconds)
+BACKENDS = [
+    ("fast-1", 4, 0.010), ("fast-2", 4, 0.010), ("fast-3", 4, 0.010), ("fast-4", 4, 0.010),
+    ("slow-1", 4, 0.030), ("slow-2", 4, 0.030),
+    ("degraded-1", 2, 0.100),
+]
+ALGORITHMS = ["RoundRobin", "random", "WeightedRoundRobin", "LeastOutstanding", "PowerOfTwoChoices", "EWMA"]
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def simulate(name, total, load, seed=1):
+    random.seed(seed)  # random / PowerOfTwoChoices / EWMA use the module level generator
+    rng = random.Random(seed)
+    tracker = LoadTracker()
+    algorithm = BalancingAlgorithmFactory().get_algorithm(name, tracker)
+    names = [backend[0] for backend in BACKENDS]
+    workers = {backend[0]: backend[1] for backend in BACKENDS}
+    service = {backend[0]: backend[2] for backend in BACKENDS}
+    # static weights : capacity of the backend in requests per second
+    weights = {n: workers[n] / service[n] for n in names}
+    tracker.update(names)
+    algorithm.update(names, weights)
+
+    arrival_rate = load * sum(weights.values())
+    busy = {n: 0 for n in names}
+    queues = {n: deque() for n in names}
+    events = []  # (time, sequence, backend, arrival time)
+    latencies = []
+    now = 0.0
+    sequence = 0
+    next_arrival = rng.expovariate(arrival_rate)
+    arrived = 0
+
+    def start(backend, arrival_time):
+        nonlocal sequence
+        busy[backend] += 1
+        sequence += 1
+        heapq.heappush(events, (now + rng.expovariate(1 / service[backend]), sequence, backend, arrival_time))
+
+    while arrived < total or events:
+        if arrived < total and (not events or next_arrival <= events[0][0]):
+            now = next_arrival
+            arrived += 1
+            backend = algorithm.choose()
+            tracker.begin(backend)
+            if busy[backend] < workers[backend]:
+                start(backend, now)
+            else:
+                queues[backend].append(now)
+            next_arrival = now + rng.expovariate(arrival_rate)
+            continue
+        now, _, backend, arrival_time = heapq.heappop(events)
+        latency = now - arrival_time
+        latencies.append(latency)
+        tracker.end(backend, latency)
+        busy[backend] -= 1
+        if queues[backend]:
+            start(backend, queues[backend].popleft())
+
+    latencies.sort()
+    return {
+        "p50": percentile(latencies, 50) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "p999": percentile(latencies, 99.9) * 1000,
+    }
+
+
+def pick_cost(name, backends, picks=200000):
+    tracker = LoadTracker()
+    algorithm = BalancingAlgorithmFactory().get_algorithm(name, tracker)
+    names = [f"10.0.{i // 250}.{i % 250}:3000" for i in range(backends)]
+    tracker.update(names)
+    algorithm.update(names, {n: 1 + i % 4 for i, n in enumerate(names)})
+    choose = algorithm.choose
+    start = time.perf_counter()
+    for _ in range(picks):
+        choose()
+    return (time.perf_counter() - start) / picks * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--load", type=float, default=0.8, help="offered load as a fraction of total capacity")
+    args = parser.parse_args()
+
+    print(f"{'algorithm':<20}{'p50 ms':>10}{'p99 ms':>10}{'p99.9 ms':>10}{'ns/pick n=10':>14}{'ns/pick n=1000':>16}")
+    for name in ALGORITHMS:
+        result = simulate(name, args.requests, args.load)
+        print(
+            f"{name:<20}{result['p50']:>10.1f}{result['p99']:>10.1f}{result['p999']:>10.1f}"
+            f"{pick_cost(name, 10):>14.0f}{pick_cost(name, 1000):>16.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
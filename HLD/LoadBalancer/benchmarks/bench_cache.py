@@ -0,0 +1,104 @@
+"""
+Benchmark : response cache in front of slow backends.
+
+Clients GET `--keys` distinct URLs with a skewed (zipf like) popularity from a stand-in backend answering in
+`--latency` seconds with Cache-Control: max-age=60. For each serving mode, without and with the cache, reports
+connections per second, p50 / p99, how many requests actually reached the backend, hit ratio and bytes saved.
+Concurrent misses on the same URL are coalesced into one backend call (see `coalesced`).
+
+usage : python benchmarks/bench_cache.py [--requests 5000] [--concurrency 100] [--keys 200] [--latency 0.02]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_serving_modes import percentile  # noqa: E402
+from loadbalancer import LoadBalancer  # noqa: E402
+from standin_backend import StandInBackend  # noqa: E402
+
+
+async def one_get(host, port, path, latencies, errors):
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nAccept: application/json\r\n\r\n".encode('latin-1'))
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        if not response.startswith(b"HTTP/1.1 200"):
+            errors.append(response[:64])
+            return
+        latencies.append(time.perf_counter() - start)
+    except OSError as e:
+        errors.append(str(e))
+
+
+async def drive(port, paths, concurrency):
+    latencies, errors = [], []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(path):
+        async with semaphore:
+            await one_get("127.0.0.1", port, path, latencies, errors)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded(path) for path in paths))
+    return latencies, errors, time.perf_counter() - start
+
+
+def run(mode, cached, paths, args):
+    backend = StandInBackend(latency=args.latency, cache_control="public, max-age=60").start()
+    lb = LoadBalancer("127.0.0.1", 0, "RoundRobin", mode=mode, cache_options={} if cached else None)
+    try:
+        lb.register_server(backend.host, backend.port, 1)
+        latencies, errors, elapsed = asyncio.run(drive(lb.port, paths, args.concurrency))
+        stats = lb.cache_stats()
+        # requests the balancer actually forwarded (heartbeats and registration are not counted)
+        forwarded = sum(backend_stats["requests"] for backend_stats in lb.backend_stats().values())
+    finally:
+        lb.stop()
+        backend.stop()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "cache": "on" if cached else "off",
+        "errors": len(errors),
+        "conn_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "backend_requests": forwarded,
+        "hit_ratio": stats.get("hit_ratio", 0.0),
+        "coalesced": stats.get("coalesced", 0),
+        "bytes_saved": stats.get("bytes_saved", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="backend latency in seconds")
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    popularity = [1 / (i + 1) for i in range(args.keys)]
+    paths = [f"/profile?user={key}" for key in rng.choices(range(args.keys), popularity, k=args.requests)]
+
+    results = [run(mode, cached, paths, args) for mode in ("threaded", "async") for cached in (False, True)]
+    print(f"\n{'mode':<10}{'cache':<7}{'conn/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}{'to backend':>12}"
+          f"{'hit ratio':>11}{'coalesced':>11}{'KB saved':>10}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['cache']:<7}{r['conn_per_sec']:>10.1f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+              f"{r['errors']:>8}{r['backend_requests']:>12}{r['hit_ratio']:>11.3f}{r['coalesced']:>11}"
+              f"{r['bytes_saved'] / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark : CPU per request of the load balancer for JSON payloads of growing size, by classification path.
+
+Requests are classified from their head (method, path, headers) before any body byte is looked at :
+    opaque  : POST with RoundRobin, the body is streamed (or spliced) to the backend as bytes, never read whole
+    read    : PUT with RoundRobin, idempotent so the body is read whole (a retry / hedge sends it again),
+              but not decoded
+    decoded : POST with ConsistentHash on "json:user", the only path where the body is json decoded
+
+Before registration moved to the admin port every small JSON body took the decoded path (it might have been a
+registration request), so `decoded` is also what every JSON request used to cost.
+
+The load balancer runs in its own process (bench_suite.LoadBalancerProcess) and reports its CPU time, the
+stand-in backends run in another one, the open loop generator (loadgen.py) in this one.
+
+usage : python benchmarks/bench_classification.py [--sizes 1024,16384,60000] [--rps 200] [--duration 3]
+                                                  [--modes threaded,async]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_suite import LoadBalancerProcess, start_stand_ins  # noqa: E402
+from loadgen import build_request, open_loop, summarize  # noqa: E402
+
+PATHS = {
+    # name : (method, algorithm, algorithm_options)
+    "opaque": ("POST", "RoundRobin", None),
+    "read": ("PUT", "RoundRobin", None),
+    "decoded": ("POST", "ConsistentHash", {"key": "json:user"}),
+}
+
+
+def json_payload(size) -> bytes:
+    # a JSON document of about `size` bytes, many small values like a real API payload
+    items = []
+    body = {"user": "user-1", "items": items}
+    while len(json.dumps(body)) < size:
+        items.append({"id": len(items), "name": f"item-{len(items)}", "price": 9.99, "tags": ["a", "b"]})
+    return json.dumps(body).encode('utf-8')
+
+
+def run(context, addresses, mode, path, size, args):
+    method, algorithm, options = PATHS[path]
+    lb = LoadBalancerProcess(context, algorithm, mode, algorithm_options=options)
+    try:
+        for host, port in addresses:
+            lb.call("register", host, port, 1)
+        request = build_request(method, "/signup", json_payload(size))
+        asyncio.run(open_loop("127.0.0.1", lb.port, args.rps, 0.5, args.timeout, request))
+        before = lb.call("usage")
+        results = asyncio.run(open_loop("127.0.0.1", lb.port, args.rps, args.duration, args.timeout, request))
+        after = lb.call("usage")
+    finally:
+        lb.stop()
+    summary = summarize(results, args.duration)
+    return {
+        "mode": mode,
+        "path": path,
+        "size": size,
+        "goodput": summary["goodput"],
+        "p99_ms": summary["p99_ms"],
+        "cpu_us_per_request": (after["cpu"] - before["cpu"]) / max(1, summary["sent"]) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1024,16384,60000", help="payload sizes in bytes, comma separated")
+    parser.add_argument("--rps", type=float, default=200.0)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--modes", default="threaded,async")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    stand_in_args = argparse.Namespace(
+        backends=2, latency=0.002, distribution="fixed", error_rate=0.0, tail_rate=0.0, tail_latency=0.0,
+        capacity=None,
+    )
+    addresses, stop_backends = start_stand_ins(context, stand_in_args)
+    try:
+        results = [
+            run(context, addresses, mode, path, int(size), args)
+            for mode in args.modes.split(",")
+            for size in args.sizes.split(",")
+            for path in PATHS
+        ]
+    finally:
+        stop_backends()
+
+    print(f"\n{'mode':<10}{'size':>8}{'path':>10}{'goodput':>10}{'p99 ms':>9}{'cpu us/req':>12}{'vs decoded':>12}")
+    decoded = {(r["mode"], r["size"]): r["cpu_us_per_request"] for r in results if r["path"] == "decoded"}
+    for r in results:
+        ratio = r["cpu_us_per_request"] / decoded[(r["mode"], r["size"])] if decoded[(r["mode"], r["size"])] else 0
+        print(f"{r['mode']:<10}{r['size']:>8}{r['path']:>10}{r['goodput']:>10.1f}{r['p99_ms']:>9.2f}"
+              f"{r['cpu_us_per_request']:>12.1f}{ratio:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
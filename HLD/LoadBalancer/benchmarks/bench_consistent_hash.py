@@ -0,0 +1,97 @@
+"""
+Benchmark : ConsistentHash lookup cost, remapping and bounded loads as the fleet grows.
+
+For each fleet size :
+    - ns per pick (bounded loads on, nothing in flight) and ring rebuild time on a health flip
+    - fraction of keys moving to another backend when one backend is added / removed.
+      Ideal consistent hashing moves 1 / n of the keys, a modulo hash moves almost all of them.
+    - bounded loads : with skewed keys (zipf-like popularity) and requests kept in flight, the max / mean
+      in-flight ratio with and without the load bound.
+
+usage : python benchmarks/bench_consistent_hash.py [--keys 20000] [--vnodes 100]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algorithms import LoadTracker, RouteContext  # noqa: E402
+from consistent_hash import ConsistentHash, hash_key  # noqa: E402
+
+
+def make_ring(backends, vnodes, load_factor=1.25):
+    tracker = LoadTracker()
+    algorithm = ConsistentHash(tracker, key="header:x-user", vnodes=vnodes, load_factor=load_factor)
+    tracker.update(backends)
+    algorithm.update(backends)
+    # second build : the points of every backend are cached, this is what a health flip costs
+    start = time.perf_counter()
+    algorithm.update(backends)
+    return algorithm, tracker, time.perf_counter() - start
+
+
+def remap_fraction(algorithm, backends, keys, new_backends):
+    before = [algorithm.lookup(key) for key in keys]
+    algorithm.update(new_backends)
+    after = [algorithm.lookup(key) for key in keys]
+    algorithm.update(backends)
+    return sum(1 for a, b in zip(before, after) if a != b) / len(keys)
+
+
+def pick_cost(algorithm, keys):
+    # a dict stands for the MessageHead : lower-case get()
+    routes = [RouteContext({"x-user": key}, "10.0.0.1") for key in keys]
+    choose = algorithm.choose
+    start = time.perf_counter()
+    for route in routes:
+        choose(route)
+    return (time.perf_counter() - start) / len(routes) * 1e9
+
+
+def max_over_mean(backends, vnodes, load_factor, requests=20000, inflight=None):
+    # skewed popularity : a few users send most of the requests, `inflight` of them stay outstanding
+    algorithm, tracker, _ = make_ring(backends, vnodes, load_factor)
+    rng = random.Random(7)
+    users = [f"user-{i}" for i in range(2000)]
+    popularity = [1 / (i + 1) for i in range(len(users))]
+    inflight = inflight or len(backends) * 4
+    outstanding = []
+    peak = {}
+    for key in rng.choices(users, popularity, k=requests):
+        backend = algorithm.choose(RouteContext({"x-user": key}, "10.0.0.1"))
+        tracker.begin(backend)
+        outstanding.append(backend)
+        peak[backend] = max(peak.get(backend, 0), tracker.inflight(backend))
+        if len(outstanding) > inflight:
+            tracker.end(outstanding.pop(rng.randrange(len(outstanding))))
+    return max(peak.values()) / (inflight / len(backends))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=20000)
+    parser.add_argument("--vnodes", type=int, default=100)
+    args = parser.parse_args()
+    keys = [f"user-{i}" for i in range(args.keys)]
+
+    print(f"{'backends':>9}{'ns/pick':>10}{'rebuild ms':>12}{'moved +1':>10}{'moved -1':>10}{'ideal':>8}"
+          f"{'modulo':>8}{'max/mean':>10}{'bounded':>9}")
+    for count in (10, 100, 1000, 5000):
+        backends = tuple(f"10.{i // 65536}.{i // 256 % 256}.{i % 256}:3000" for i in range(count))
+        algorithm, _, rebuild = make_ring(backends, args.vnodes)
+        added = remap_fraction(algorithm, backends, keys, backends + ("10.255.255.255:3000",))
+        removed = remap_fraction(algorithm, backends, keys, backends[1:])
+        hashes = [hash_key(key) for key in keys]
+        modulo = sum(1 for h in hashes if h % count != h % (count + 1)) / len(keys)
+        unbounded = max_over_mean(backends, args.vnodes, None) if count <= 1000 else float("nan")
+        bounded = max_over_mean(backends, args.vnodes, 1.25) if count <= 1000 else float("nan")
+        print(f"{count:>9}{pick_cost(algorithm, keys[:5000]):>10.0f}{rebuild * 1000:>12.1f}{added:>10.4f}"
+              f"{removed:>10.4f}{1 / (count + 1):>8.4f}{modulo:>8.3f}{unbounded:>10.2f}{bounded:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark : time to detect a dead backend as the fleet grows.
+
+No sockets : the probe is a fake heartbeat taking `--probe-ms`, and 5% of the backends hang
+(their probe never returns in time). At t=0 one healthy backend dies and we measure how long it
+takes until HealthChecker reports it down, for several fleet sizes.
+The old serial sweep is given for reference : it had to go through every probe (hung ones waiting
+for the 10s pool timeout) before seeing the dead backend again.
+
+usage : python benchmarks/bench_health.py [--interval 1] [--timeout 0.5] [--fall 3] [--probe-ms 2]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from health import HealthChecker  # noqa: E402
+
+HUNG_FRACTION = 0.05
+OLD_TIMEOUT = 10.0
+
+
+def detection_time(backends, args):
+    hung = {f"backend-{i}" for i in range(0, backends, int(1 / HUNG_FRACTION))}
+    victim = f"backend-{backends - 1}"
+    dead = set()
+    detected = threading.Event()
+    release = threading.Event()
+
+    def probe(server_addr):
+        if server_addr in hung:
+            # in the load balancer the socket timeout of the health pool ends a hung probe
+            release.wait(args.timeout * 1.2)
+            return False
+        time.sleep(args.probe_ms / 1000)
+        return server_addr not in dead
+
+    def on_change(server_addr, healthy):
+        if server_addr == victim and not healthy:
+            detected.set()
+
+    checker = HealthChecker(
+        probe, on_change, interval=args.interval, timeout=args.timeout, fall=args.fall, max_workers=64,
+    )
+    for i in range(backends):
+        checker.add(f"backend-{i}")
+    stop = threading.Event()
+    scheduler = threading.Thread(target=checker.run, args=(stop,))
+    scheduler.start()
+    # let every backend get its first probes, hung ones included
+    time.sleep(args.interval * 2)
+    start = time.perf_counter()
+    dead.add(victim)
+    detected.wait(60)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    release.set()
+    checker.stop()
+    scheduler.join()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--fall", type=int, default=3)
+    parser.add_argument("--probe-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"{'backends':>10}{'hung':>8}{'detected in s':>16}{'old serial sweep s':>20}")
+    for backends in (10, 100, 1000):
+        hung = len(range(0, backends, int(1 / HUNG_FRACTION)))
+        # old loop : one sweep per interval (5s), every probe in series, `fall` did not exist
+        serial = (backends - hung) * args.probe_ms / 1000 + hung * OLD_TIMEOUT + 5
+        print(f"{backends:>10}{hung:>8}{detection_time(backends, args):>16.2f}{serial:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
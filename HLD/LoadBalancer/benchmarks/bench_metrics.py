@@ -0,0 +1,106 @@
+"""
+Microbenchmark : cost of instrumentation on the request path.
+
+    - tracker begin + end with the latency histogram (what every proxied request records)
+    - one per-request log line : print() to a pipe (what the balancer did) vs logger.debug (dropped at the
+      default INFO level) vs logger.info (queued, written by the listener thread)
+    - rendering /metrics for 10 / 100 / 1000 backends
+
+usage : python benchmarks/bench_metrics.py [--iterations 200000]
+"""
+
+import argparse
+import io
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log  # noqa: E402
+from algorithms import LoadTracker  # noqa: E402
+from metrics import render_prometheus  # noqa: E402
+
+
+def ns_per_call(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+class FakeBalancer:
+    # just what render_prometheus reads
+    def __init__(self, backends):
+        self.server_lock = threading.Lock()
+        self.servers = {addr: {"isRegistered": 1, "isAlive": 1, "weight": 1} for addr in backends}
+        self.tracker = LoadTracker()
+        self.tracker.update(backends)
+        for i, addr in enumerate(backends):
+            self.tracker.begin(addr)
+            self.tracker.end(addr, 0.001 * (i % 50))
+        self.lb_socket = socket.socket()
+        self.lb_socket.bind(("127.0.0.1", 0))
+        self.lb_socket.listen()
+
+    def health_stats(self):
+        return {}
+
+    def pool_stats(self):
+        return {}
+
+    def cache_stats(self):
+        return {}
+
+    def resilience_stats(self):
+        return {"breakers": {}, "retry_budget": {"tokens": 0, "retries": 0, "exhausted": 0},
+                "hedges": 0, "hedge_wins": 0}
+
+    def admission_stats(self):
+        return {}
+
+    def push_stats(self):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+    n = args.iterations
+
+    tracker = LoadTracker()
+    tracker.update(["10.0.0.1:3000", "10.0.0.2:3000"])
+
+    def record():
+        tracker.begin("10.0.0.1:3000")
+        tracker.end("10.0.0.1:3000", 0.004)
+
+    read_fd, write_fd = os.pipe()
+    pipe = io.TextIOWrapper(io.FileIO(write_fd, "w"), line_buffering=True)
+    drain = io.FileIO(read_fd, "r")
+    os.set_blocking(read_fd, False)
+
+    def print_line():
+        print("Received request: GET /signup", file=pipe)
+        drain.read(65536)
+
+    log.configure(level="INFO", stream=io.StringIO(), queue_size=n * 2)
+    logger = log.get_logger("bench")
+
+    print(f"{'operation':<40}{'ns/op':>10}")
+    print(f"{'tracker begin + end + histogram':<40}{ns_per_call(record, n):>10.0f}")
+    print(f"{'print() per request (line buffered)':<40}{ns_per_call(print_line, n // 4):>10.0f}")
+    print(f"{'logger.debug (level INFO)':<40}{ns_per_call(lambda: logger.debug('Received request: %s %s', 'GET', '/signup'), n):>10.0f}")
+    print(f"{'logger.info (queued)':<40}{ns_per_call(lambda: logger.info('Received request: %s %s', 'GET', '/signup'), n // 4):>10.0f}")
+    for backends in (10, 100, 1000):
+        lb = FakeBalancer([f"10.0.{i // 250}.{i % 250}:3000" for i in range(backends)])
+        cost = ns_per_call(lambda: render_prometheus(lb), 20) / 1e6
+        print(f"{f'render /metrics, {backends} backends (ms)':<40}{cost:>10.2f}")
+        lb.lb_socket.close()
+
+
+if __name__ == "__main__":
+    main()
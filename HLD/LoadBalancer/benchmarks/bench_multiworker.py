@@ -0,0 +1,105 @@
+"""
+Benchmark : multi process load balancer (SO_REUSEPORT workers sharing the backend table).
+
+For 1, 2, ... `--max-workers` workers (default : one per CPU) :
+    - connections per second and p50 / p99 with the same client as bench_serving_modes.py
+    - registration visibility : a backend registers through the balancer (so through one worker only), we then
+      measure how long until `--probe` requests in a row succeed, i.e. every worker routes to it.
+
+Scaling is only visible with as many free cores as workers + the client and backend processes.
+
+usage : python benchmarks/bench_multiworker.py [--requests 5000] [--concurrency 200] [--max-workers N]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_serving_modes import drive, percentile  # noqa: E402
+from multiworker import MultiProcessLoadBalancer  # noqa: E402
+from standin_backend import StandInBackend  # noqa: E402
+
+
+def send(port, raw):
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        sock.sendall(raw)
+        response = b""
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                return response
+            response += data
+
+
+def register(admin_port, backend):
+    body = json.dumps({"server_ip": backend.host, "server_port": backend.port, "isAlive": 1}).encode()
+    send(admin_port, b"POST /register HTTP/1.1\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+         % (len(body), body))
+
+
+def wait_until_visible(port, probe, timeout=10.0):
+    # first time `probe` requests in a row were routed (no 503 from a worker which does not know the backend yet)
+    start = time.perf_counter()
+    in_a_row = 0
+    while in_a_row < probe and time.perf_counter() - start < timeout:
+        in_a_row = in_a_row + 1 if send(port, b"GET / HTTP/1.1\r\n\r\n").startswith(b"HTTP/1.1 200") else 0
+    return time.perf_counter() - start
+
+
+def run(workers, backends, args):
+    lb = MultiProcessLoadBalancer("127.0.0.1", 0, "RoundRobin", workers=workers, admin_port=0).start()
+    try:
+        # let every worker bind before the first connection
+        time.sleep(1.0 + 0.5 * workers)
+        register(lb.admin_port, backends[0])
+        visible = wait_until_visible(lb.port, args.probe)
+        for backend in backends[1:]:
+            register(lb.admin_port, backend)
+        time.sleep(1.0)
+        latencies, errors, elapsed = asyncio.run(drive("127.0.0.1", lb.port, args.requests, args.concurrency))
+    finally:
+        lb.stop()
+    latencies.sort()
+    return {
+        "workers": workers,
+        "errors": len(errors),
+        "conn_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "visible_s": visible,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--probe", type=int, default=50, help="requests in a row that must be routed")
+    args = parser.parse_args()
+
+    backends = [StandInBackend().start() for _ in range(2)]
+    results = []
+    try:
+        workers = 1
+        while workers <= args.max_workers:
+            results.append(run(workers, backends, args))
+            workers *= 2
+    finally:
+        for backend in backends:
+            backend.stop()
+
+    print(f"\n{'workers':>8}{'conn/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'registration visible s':>24}")
+    for r in results:
+        print(f"{r['workers']:>8}{r['conn_per_sec']:>12.1f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['errors']:>8}"
+              f"{r['visible_s']:>24.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Benchmark : PULL heartbeats vs PUSH status frames.
+
+    chatter   : `--backends` backends checked every `--interval` seconds. PULL : one HTTP probe per backend per
+                interval (stand-ins answering /heartbeat). PUSH : one status frame per backend per interval, over
+                `--connections` persistent connections. Reports the messages per second and the CPU time the
+                load balancer process spends on them.
+    detection : PUSH only, time between a frame saying alive=0 (or the connection dropping) and the backend
+                leaving the routing snapshot : about one batch interval, whatever the fleet size.
+    routing   : three stand-ins behind PowerOfTwoChoices, one of them pushes a high in-flight count (another load
+                balancer keeps it busy). Share of the requests each backend gets, without and with the reports.
+
+usage : python benchmarks/bench_push.py [--backends 100] [--interval 1] [--duration 10] [--connections 4]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_suite import LoadBalancerProcess, start_stand_ins  # noqa: E402
+from loadbalancer import LoadBalancer  # noqa: E402
+from loadgen import build_request, open_loop  # noqa: E402
+from push import encode_frame  # noqa: E402
+from standin_backend import StandInBackend  # noqa: E402
+
+
+def push_main(port, servers, interval, connections, stop_event):
+    # reporter process : frames for every server, spread over `connections` connections
+    socks = [socket.create_connection(("127.0.0.1", port)) for _ in range(connections)]
+    while not stop_event.is_set():
+        started = time.monotonic()
+        for index, server in enumerate(servers):
+            socks[index % connections].sendall(encode_frame(server, alive=1, inflight=index % 7))
+        stop_event.wait(max(0.0, interval - (time.monotonic() - started)))
+    for sock in socks:
+        sock.close()
+
+
+def chatter(context, model, args):
+    stand_in_args = argparse.Namespace(
+        backends=args.backends, latency=0.0, distribution="fixed", error_rate=0.0, tail_rate=0.0,
+        tail_latency=0.0, capacity=None,
+    )
+    addresses, stop_backends = start_stand_ins(context, stand_in_args)
+    servers = [f"{host}:{port}" for host, port in addresses]
+    health_options = {"interval": args.interval, "fast_interval": args.interval, "jitter": 0.2}
+    if model == "pull":
+        lb = LoadBalancerProcess(context, "RoundRobin", "threaded", health_options=health_options)
+        for host, port in addresses:
+            lb.call("register", host, port, 1)
+        reporter_stop = None
+    else:
+        lb = LoadBalancerProcess(context, "RoundRobin", "threaded", health_options=health_options, push_port=0)
+        reporter_stop = context.Event()
+        reporter = context.Process(
+            target=push_main, args=(lb.call("stats")["push_port"], servers, args.interval, args.connections,
+                                    reporter_stop), daemon=True)
+        reporter.start()
+    try:
+        # let registration / the first round settle
+        time.sleep(args.interval * 2)
+        before_usage, before_stats = lb.call("usage"), lb.call("stats")
+        time.sleep(args.duration)
+        after_usage, after_stats = lb.call("usage"), lb.call("stats")
+    finally:
+        if reporter_stop is not None:
+            reporter_stop.set()
+            reporter.join(5)
+        lb.stop()
+        stop_backends()
+
+    def messages(stats):
+        if model == "pull":
+            return sum(state["probes_ok"] + state["probes_failed"] for state in stats["health"].values())
+        return stats["push"]["frames"]
+
+    cpu = after_usage["cpu"] - before_usage["cpu"]
+    return {
+        "model": model,
+        "healthy": after_stats["healthy"],
+        "messages_per_sec": (messages(after_stats) - messages(before_stats)) / args.duration,
+        "cpu_percent": cpu / args.duration * 100,
+        "threads": after_usage["threads"],
+        "batches": after_stats["push"].get("batches", "-"),
+    }
+
+
+def wait_for(condition, timeout=5.0):
+    started = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - started > timeout:
+            return float("inf")
+        time.sleep(0.0005)
+    return time.perf_counter() - started
+
+
+def detection(args):
+    lb = LoadBalancer("127.0.0.1", 0, "RoundRobin", push_port=0)
+    results = {}
+    try:
+        sock = socket.create_connection(("127.0.0.1", lb.push_port))
+        server = "127.0.0.1:1"
+        sock.sendall(encode_frame(server, alive=1))
+        results["register"] = wait_for(lambda: server in lb.healthy_backends)
+        sock.sendall(encode_frame(server, alive=0))
+        results["alive=0"] = wait_for(lambda: server not in lb.healthy_backends)
+        sock.sendall(encode_frame(server, alive=1))
+        wait_for(lambda: server in lb.healthy_backends)
+        sock.close()
+        results["connection closed"] = wait_for(lambda: server not in lb.healthy_backends)
+    finally:
+        lb.stop()
+    return results
+
+
+def routing(args):
+    backends = [StandInBackend(latency=0.005).start() for _ in range(3)]
+    shares = {}
+    try:
+        for reports in (False, True):
+            lb = LoadBalancer("127.0.0.1", 0, "PowerOfTwoChoices", push_port=0)
+            reporter = None
+            try:
+                for backend in backends:
+                    lb.register_server(backend.host, backend.port, 1)
+                if reports:
+                    # backends[0] is busy with another load balancer's traffic
+                    reporter = socket.create_connection(("127.0.0.1", lb.push_port))
+                    for index, backend in enumerate(backends):
+                        reporter.sendall(encode_frame(backend.address, alive=1, inflight=40 if index == 0 else 0))
+                    time.sleep(0.2)
+                served = [backend.requests_served for backend in backends]
+                request = build_request("POST", "/signup", b'{"email": "user@example.com"}')
+                asyncio.run(open_loop("127.0.0.1", lb.port, 300, 2.0, 2.0, request))
+                total = sum(backend.requests_served for backend in backends) - sum(served)
+                shares["with reports" if reports else "without"] = [
+                    (backend.requests_served - before) / max(1, total) for backend, before in zip(backends, served)
+                ]
+            finally:
+                if reporter is not None:
+                    reporter.close()
+                lb.stop()
+    finally:
+        for backend in backends:
+            backend.stop()
+    return shares
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--connections", type=int, default=4)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = [chatter(context, model, args) for model in ("pull", "push")]
+    print(f"\n{args.backends} backends, one status per {args.interval}s")
+    print(f"{'model':<8}{'healthy':>9}{'msgs/s':>9}{'LB cpu %':>10}{'threads':>9}{'batches':>9}")
+    for r in results:
+        print(f"{r['model']:<8}{r['healthy']:>9}{r['messages_per_sec']:>9.1f}{r['cpu_percent']:>10.2f}"
+              f"{r['threads']:>9}{r['batches']:>9}")
+
+    print("\nPUSH detection (ms)")
+    for event, seconds in detection(args).items():
+        print(f"  {event:<20}{seconds * 1000:>8.1f}")
+
+    print("\nPowerOfTwoChoices share per backend (backend 0 reports 40 in-flight requests)")
+    for name, share in routing(args).items():
+        print(f"  {name:<15}" + "".join(f"{value:>8.3f}" for value in share))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark : circuit breakers, retries and hedged requests with one degraded backend out of three.
+
+    errors : the degraded stand-in answers 503 to `--error-rate` of the requests (heartbeats stay fine, so
+             health checks never take it out). Without resilience those 503s reach the clients, with it they
+             are retried on another backend and the breaker soon stops sending traffic to the sick one.
+    tail   : the degraded stand-in takes `--tail-latency` seconds for `--tail-rate` of the requests. Hedged
+             requests cut the p99 by asking another backend once the p95 of the slow one is exceeded.
+
+For each serving mode and each configuration, reports the client success rate, p50 / p99 / p999, retries,
+hedges and breaker trips.
+
+usage : python benchmarks/bench_resilience.py [--requests 3000] [--concurrency 50] [--error-rate 0.5]
+                                              [--tail-rate 0.1] [--tail-latency 0.2]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_serving_modes import percentile  # noqa: E402
+from loadbalancer import LoadBalancer  # noqa: E402
+from standin_backend import StandInBackend  # noqa: E402
+
+# breakers which never trip and no retries : the forwarding path as it was
+NO_RESILIENCE = {"max_retries": 0, "breaker": {"error_threshold": 2.0, "slow_call_threshold": 2.0}}
+CONFIGURATIONS = {
+    "errors": (("off", NO_RESILIENCE), ("retry+breaker", {})),
+    "tail": (("off", NO_RESILIENCE), ("retry+breaker", {}), ("hedge", {"hedge": True})),
+}
+
+
+async def one_get(port, statuses, latencies):
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET /profile HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n\r\n".encode('latin-1'))
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+    except OSError:
+        statuses.append(0)
+        return
+    statuses.append(int(response[9:12]) if response.startswith(b"HTTP/1.1 ") else 0)
+    latencies.append(time.perf_counter() - start)
+
+
+async def drive(port, total, concurrency):
+    statuses, latencies = [], []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded():
+        async with semaphore:
+            await one_get(port, statuses, latencies)
+
+    await asyncio.gather(*(bounded() for _ in range(total)))
+    return statuses, latencies
+
+
+def run(scenario, mode, name, options, args):
+    degraded = (
+        {"error_rate": args.error_rate} if scenario == "errors"
+        else {"tail_rate": args.tail_rate, "tail_latency": args.tail_latency}
+    )
+    backends = [StandInBackend(latency=args.latency, seed=i).start() for i in range(2)]
+    backends.append(StandInBackend(latency=args.latency, seed=2, **degraded).start())
+    lb = LoadBalancer("127.0.0.1", 0, "RoundRobin", mode=mode, resilience_options=options)
+    try:
+        for backend in backends:
+            lb.register_server(backend.host, backend.port, 1)
+        statuses, latencies = asyncio.run(drive(lb.port, args.requests, args.concurrency))
+        stats = lb.resilience_stats()
+    finally:
+        lb.stop()
+        for backend in backends:
+            backend.stop()
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "mode": mode,
+        "config": name,
+        "success": statuses.count(200) / len(statuses),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "p999_ms": percentile(latencies, 99.9) * 1000,
+        "degraded_share": backends[2].requests_served / max(1, sum(b.requests_served for b in backends)),
+        "retries": stats["retry_budget"]["retries"],
+        "hedges": stats["hedges"],
+        "trips": sum(breaker["trips"] for breaker in stats["breakers"].values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.002, help="usual backend latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.5)
+    parser.add_argument("--tail-rate", type=float, default=0.1)
+    parser.add_argument("--tail-latency", type=float, default=0.2)
+    parser.add_argument("--modes", default="threaded,async")
+    args = parser.parse_args()
+
+    results = [
+        run(scenario, mode, name, options, args)
+        for scenario, configurations in CONFIGURATIONS.items()
+        for mode in args.modes.split(",")
+        for name, options in configurations
+    ]
+    print(f"\n{'scenario':<10}{'mode':<10}{'config':<15}{'success':>9}{'p50 ms':>9}{'p99 ms':>9}{'p999 ms':>9}"
+          f"{'to degraded':>13}{'retries':>9}{'hedges':>8}{'trips':>7}")
+    for r in results:
+        print(f"{r['scenario']:<10}{r['mode']:<10}{r['config']:<15}{r['success']:>9.3f}{r['p50_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['p999_ms']:>9.2f}{r['degraded_share']:>13.3f}{r['retries']:>9}"
+              f"{r['hedges']:>8}{r['trips']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Microbenchmark : round robin picks per second under 64 concurrent threads.
+
+    legacy   : the previous LoadBalancer.round_robin (server_lock + list(self.servers.keys()) per pick)
+    snapshot : algorithms.RoundRobin (immutable tuple snapshot + itertools.count, no lock)
+
+Each variant runs once alone and once with a fake heartbeat thread which, every 50ms, holds the
+server lock for 20ms (like the old sweep did during its HTTP calls) and then publishes a new snapshot.
+
+usage : python benchmarks/bench_round_robin.py [--threads 64] [--seconds 1] [--backends 16]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algorithms import LoadTracker, RoundRobin  # noqa: E402
+
+class LegacyRoundRobin:
+    # copy of the round robin the load balancer used before the snapshot
+    def __init__(self, servers):
+        self.servers = {addr: {"isRegistered": 1, "isAlive": 1} for addr in servers}
+        self.server_lock = threading.Lock()
+        self.round_robin_index = 0
+
+    def choose(self):
+        with self.server_lock:
+            servers = list(self.servers.keys())
+            if not servers:
+                return None
+            selected_server = servers[self.round_robin_index]
+            self.round_robin_index = (self.round_robin_index + 1) % len(servers)
+            return selected_server
+
+    def heartbeat(self, servers):
+        with self.server_lock:
+            time.sleep(0.02)
+
+
+class SnapshotRoundRobin:
+    def __init__(self, servers):
+        self.algorithm = RoundRobin(LoadTracker())
+        self.algorithm.update(tuple(servers))
+        self.choose = self.algorithm.choose
+
+    def heartbeat(self, servers):
+        # health checks run without touching the pickers, then swap the snapshot
+        time.sleep(0.02)
+        self.algorithm.update(tuple(servers))
+
+
+def run(variant, servers, threads, seconds, with_heartbeat):
+    stop = threading.Event()
+    running = [True]  # plain flag checked on every pick : a thread stuck in the lock convoy stops right away
+    counts = [0] * threads
+
+    def picker(slot):
+        choose = variant.choose
+        picks = 0
+        while running[0]:
+            choose()
+            picks += 1
+        counts[slot] = picks
+
+    def heartbeat():
+        while not stop.is_set():
+            variant.heartbeat(servers)
+            stop.wait(0.05)
+
+    workers = [threading.Thread(target=picker, args=(slot,)) for slot in range(threads)]
+    if with_heartbeat:
+        workers.append(threading.Thread(target=heartbeat))
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    running[0] = False
+    stop.set()
+    elapsed = time.perf_counter() - start
+    for worker in workers:
+        worker.join()
+    return sum(counts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=1.0)
+    parser.add_argument("--backends", type=int, default=16)
+    args = parser.parse_args()
+
+    servers = [f"127.0.0.1:{3000 + i}" for i in range(args.backends)]
+    print(f"{'variant':<12}{'heartbeat':<12}{'picks/s':>14}")
+    for name, cls in (("legacy", LegacyRoundRobin), ("snapshot", SnapshotRoundRobin)):
+        for with_heartbeat in (False, True):
+            rate = run(cls(servers), servers, args.threads, args.seconds, with_heartbeat)
+            print(f"{name:<12}{'yes' if with_heartbeat else 'no':<12}{rate:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark : threaded vs asyncio serving mode of the load balancer.
+
+Starts two stand-in backends, a load balancer per mode on a free port and drives it with
+`concurrency` clients (one connection per request, like the original client flow).
+Reports connections per second and p50 / p99 latency.
+
+usage : python benchmarks/bench_serving_modes.py [--requests 5000] [--concurrency 200] [--latency 0.005]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loadbalancer import LoadBalancer  # noqa: E402
+from standin_backend import StandInBackend  # noqa: E402
+
+REQUEST_BODY = b'{"email": "user@example.com", "password": "secret", "name": "user"}'
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def one_request(host, port, latencies, errors):
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(
+            (
+                "POST /signup HTTP/1.1\r\n"
+                f"Host: {host}:{port}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(REQUEST_BODY)}\r\n"
+                "\r\n"
+            ).encode('latin-1') + REQUEST_BODY
+        )
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        if not response.startswith(b"HTTP/1.1 200"):
+            errors.append(response[:64])
+            return
+        latencies.append(time.perf_counter() - start)
+    except OSError as e:
+        errors.append(str(e))
+
+
+async def drive(host, port, total, concurrency):
+    latencies, errors = [], []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded():
+        async with semaphore:
+            await one_request(host, port, latencies, errors)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def run_mode(mode, backends, args):
+    lb = LoadBalancer("127.0.0.1", 0, "RoundRobin", mode=mode)
+    try:
+        for backend in backends:
+            lb.register_server(backend.host, backend.port, 1)
+        latencies, errors, elapsed = asyncio.run(drive("127.0.0.1", lb.port, args.requests, args.concurrency))
+        pool_stats = lb.pool_stats()
+    finally:
+        lb.stop()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "conn_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "pool_hits": sum(stats["hits"] for stats in pool_stats.values()),
+        "pool_misses": sum(stats["misses"] for stats in pool_stats.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.005, help="backend latency in seconds")
+    args = parser.parse_args()
+
+    backends = [StandInBackend(latency=args.latency).start() for _ in range(2)]
+    results = []
+    try:
+        for mode in ("threaded", "async"):
+            results.append(run_mode(mode, backends, args))
+    finally:
+        for backend in backends:
+            backend.stop()
+
+    print(f"\n{'mode':<10}{'ok':>8}{'errors':>8}{'conn/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'pool hit/miss':>16}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['ok']:>8}{r['errors']:>8}{r['conn_per_sec']:>12.1f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['pool_hits']:>10}/{r['pool_misses']:<5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark : streaming large bodies through the load balancer.
+
+For each serving mode, uploads and downloads `--size` MB through the balancer with Content-Length
+and chunked framing, and reports throughput and the growth of the process peak RSS.
+Since bodies are relayed (or spliced) instead of buffered, RSS growth should stay flat
+whatever the payload size.
+
+usage : python benchmarks/bench_streaming.py [--size 256]
+"""
+
+import argparse
+import os
+import resource
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loadbalancer import LoadBalancer  # noqa: E402
+from standin_backend import StandInBackend  # noqa: E402
+
+CHUNK = 64 * 1024
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def drain_response(sock):
+    # read and discard the whole response, returns bytes received
+    total = 0
+    buffer = bytearray(CHUNK)
+    while True:
+        n = sock.recv_into(buffer)
+        if not n:
+            return total
+        total += n
+
+
+def upload(port, size, chunked):
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        framing = "Transfer-Encoding: chunked" if chunked else f"Content-Length: {size}"
+        sock.sendall(
+            f"POST /upload HTTP/1.1\r\nHost: lb\r\nContent-Type: application/octet-stream\r\n{framing}\r\n\r\n".encode()
+        )
+        block = b"y" * CHUNK
+        left = size
+        while left:
+            piece = block[:min(left, CHUNK)]
+            left -= len(piece)
+            sock.sendall(b"%x\r\n%s\r\n" % (len(piece), piece) if chunked else piece)
+        if chunked:
+            sock.sendall(b"0\r\n\r\n")
+        return drain_response(sock)
+
+
+def download(port, size, chunked):
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        sock.sendall(f"GET /blob?size={size}&chunked={int(chunked)} HTTP/1.1\r\nHost: lb\r\n\r\n".encode())
+        return drain_response(sock)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=256, help="payload size in MB")
+    args = parser.parse_args()
+    size = args.size * 1024 * 1024
+
+    backend = StandInBackend().start()
+    rows = []
+    try:
+        for mode in ("threaded", "async"):
+            lb = LoadBalancer("127.0.0.1", 0, "RoundRobin", mode=mode)
+            try:
+                lb.register_server(backend.host, backend.port, 1)
+                for name, func in (("upload", upload), ("download", download)):
+                    for chunked in (False, True):
+                        rss_before = peak_rss_mb()
+                        start = time.perf_counter()
+                        received = func(lb.port, size, chunked)
+                        elapsed = time.perf_counter() - start
+                        rows.append((
+                            mode, name, "chunked" if chunked else "length",
+                            args.size / elapsed, peak_rss_mb() - rss_before, received,
+                        ))
+            finally:
+                lb.stop()
+    finally:
+        backend.stop()
+
+    print(f"\n{'mode':<10}{'direction':<10}{'framing':<10}{'MB/s':>10}{'peak RSS +MB':>14}{'bytes back':>14}")
+    for mode, name, framing, throughput, rss_growth, received in rows:
+        print(f"{mode:<10}{name:<10}{framing:<10}{throughput:>10.1f}{rss_growth:>14.1f}{received:>14}")
+
+
+if __name__ == "__main__":
+    main()
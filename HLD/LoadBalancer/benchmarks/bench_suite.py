@@ -0,0 +1,287 @@
+"""
+Benchmark suite : every algorithm x serving mode x offered rate, results saved as JSON to compare runs.
+
+Processes, so that they do not share a GIL (and the load balancer's CPU / memory are its own) :
+    backends       : `--backends` stand-ins in one process (standin_backend.py) with the latency distribution,
+                     tail and error rate given on the command line. `--backend-kind express` starts server1.js /
+                     server2.js instead (npm install first), they register themselves on the admin port 5002
+                     and are proxied through port 5001.
+    load balancer  : one process per configuration, asked for its CPU time and RSS before / after the run.
+    load generator : this process, open loop at a fixed rate (loadgen.py), `--warmup` seconds not counted.
+
+Per configuration : throughput and goodput (200 answers) per second, shed / 5xx / timeouts / connection errors,
+p50 / p99 / p999 of the served requests, CPU seconds of the load balancer (and per request), its RSS and
+thread count.
+
+Results go to `--output` (default benchmarks/results/suite-<time>.json). `--compare OLD.json` prints the change
+of goodput, p99 and CPU per request against an older run for the configurations both have, and marks the ones
+worse than `--tolerance`.
+
+usage : python benchmarks/bench_suite.py [--algorithms RoundRobin,LeastOutstanding] [--modes threaded,async]
+                                         [--rps 200,500] [--duration 5] [--latency 0.005]
+                                         [--distribution exponential] [--error-rate 0.0] [--compare OLD.json]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loadgen import build_request, open_loop, summarize  # noqa: E402
+from standin_backend import DISTRIBUTIONS, StandInBackend  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+LB_DIR = os.path.dirname(BENCH_DIR)
+REQUEST_BODY = b'{"email": "user@example.com", "password": "secret", "name": "user"}'
+# express servers expect the load balancer on these ports (proxy, admin port they register on)
+EXPRESS_LB_PORT = 5001
+EXPRESS_ADMIN_PORT = 5002
+EXPRESS_SERVERS = ("server1.js", "server2.js")
+
+
+def process_usage() -> dict:
+    # CPU seconds and memory of the calling process
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    rss = None
+    try:
+        with open("/proc/self/statm") as statm:
+            rss = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    return {
+        "cpu": usage.ru_utime + usage.ru_stime,
+        "rss_mb": rss / 2 ** 20 if rss is not None else None,
+        "max_rss_mb": usage.ru_maxrss / 1024,  # KB on linux
+        "threads": threading.active_count(),
+    }
+
+
+def lb_main(conn, port, algorithm, mode, options):
+    # load balancer process : answers the commands of the suite until "stop"
+    from loadbalancer import LoadBalancer
+    lb = LoadBalancer("127.0.0.1", port, algorithm, mode=mode, **options)
+    conn.send(lb.port)
+    while True:
+        command, *args = conn.recv()
+        if command == "register":
+            lb.register_server(*args)
+            conn.send(True)
+        elif command == "servers":
+            with lb.server_lock:
+                conn.send(len(lb.servers))
+        elif command == "usage":
+            conn.send(process_usage())
+        elif command == "stats":
+            conn.send({"healthy": len(lb.healthy_backends), "health": lb.health_stats(), "push": lb.push_stats(),
+                       "push_port": lb.push_port})
+        elif command == "stop":
+            lb.stop()
+            conn.send(True)
+            return
+
+
+def backends_main(conn, count, options):
+    # stand-in backends process
+    backends = [StandInBackend(seed=i, **options).start() for i in range(count)]
+    conn.send([(backend.host, backend.port) for backend in backends])
+    conn.recv()
+    for backend in backends:
+        backend.stop()
+
+
+class LoadBalancerProcess:
+
+    def __init__(self, context, algorithm, mode, port=0, **options):
+        # options : keyword arguments of LoadBalancer (health_options, push_port ...)
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=lb_main, args=(child, port, algorithm, mode, options), daemon=True)
+        self.process.start()
+        self.port = self.conn.recv()
+
+    def call(self, *command):
+        self.conn.send(command)
+        return self.conn.recv()
+
+    def stop(self):
+        try:
+            self.call("stop")
+        except (EOFError, OSError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+
+
+def start_stand_ins(context, args):
+    options = {
+        "latency": args.latency, "distribution": args.distribution, "error_rate": args.error_rate,
+        "tail_rate": args.tail_rate, "tail_latency": args.tail_latency, "capacity": args.capacity,
+    }
+    conn, child = context.Pipe()
+    process = context.Process(target=backends_main, args=(child, args.backends, options), daemon=True)
+    process.start()
+    addresses = conn.recv()
+
+    def stop():
+        conn.send("stop")
+        process.join(5)
+
+    return addresses, stop
+
+
+def start_express(lb):
+    # the servers register themselves with the load balancer on EXPRESS_ADMIN_PORT
+    servers = [subprocess.Popen(["node", name], cwd=LB_DIR, stdout=subprocess.DEVNULL) for name in EXPRESS_SERVERS]
+    deadline = time.monotonic() + 15
+    while lb.call("servers") < len(servers):
+        if time.monotonic() > deadline or any(server.poll() is not None for server in servers):
+            for server in servers:
+                server.kill()
+            raise RuntimeError("express servers did not register (node installed ? npm install done ?)")
+        time.sleep(0.2)
+
+    def stop():
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    return stop
+
+
+def run(context, algorithm, mode, rps, addresses, args):
+    express = args.backend_kind == "express"
+    if express:
+        lb = LoadBalancerProcess(context, algorithm, mode, EXPRESS_LB_PORT, admin_port=EXPRESS_ADMIN_PORT)
+    else:
+        lb = LoadBalancerProcess(context, algorithm, mode)
+    stop_express = None
+    try:
+        if express:
+            stop_express = start_express(lb)
+        else:
+            for host, port in addresses:
+                lb.call("register", host, port, 1)
+        request = build_request("POST", "/signup", REQUEST_BODY)
+        if args.warmup:
+            asyncio.run(open_loop("127.0.0.1", lb.port, rps, args.warmup, args.timeout, request))
+        before = lb.call("usage")
+        started = time.perf_counter()
+        results = asyncio.run(open_loop("127.0.0.1", lb.port, rps, args.duration, args.timeout, request))
+        elapsed = time.perf_counter() - started
+        after = lb.call("usage")
+    finally:
+        if stop_express is not None:
+            stop_express()
+        lb.stop()
+    summary = summarize(results, args.duration)
+    cpu = after["cpu"] - before["cpu"]
+    return {
+        "algorithm": algorithm,
+        "mode": mode,
+        "rps": rps,
+        **summary,
+        "elapsed": elapsed,
+        "cpu_seconds": cpu,
+        "cpu_percent": cpu / elapsed * 100,
+        "cpu_us_per_request": cpu / max(1, summary["sent"]) * 1e6,
+        "rss_mb": after["rss_mb"],
+        "max_rss_mb": after["max_rss_mb"],
+        "threads": after["threads"],
+    }
+
+
+def config_key(result):
+    return (result["algorithm"], result["mode"], result["rps"])
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as baseline_file:
+        baseline = {config_key(r): r for r in json.load(baseline_file)["results"]}
+    print(f"\nagainst {baseline_path} (changes in %, ! : worse than {tolerance:.0%})")
+    print(f"{'algorithm':<18}{'mode':<10}{'rps':>7}{'goodput':>10}{'p99':>10}{'cpu/req':>10}")
+    for r in results:
+        old = baseline.get(config_key(r))
+        if old is None:
+            continue
+        line = f"{r['algorithm']:<18}{r['mode']:<10}{r['rps']:>7.0f}"
+        # goodput : higher is better, p99 and cpu per request : lower is better
+        for field, sign in (("goodput", 1), ("p99_ms", -1), ("cpu_us_per_request", -1)):
+            change = (r[field] - old[field]) / old[field] if old[field] else 0.0
+            flag = "!" if sign * change < -tolerance else " "
+            line += f"{change * 100:>+9.1f}{flag}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--algorithms", default="RoundRobin,LeastOutstanding,PowerOfTwoChoices")
+    parser.add_argument("--modes", default="threaded,async")
+    parser.add_argument("--rps", default="200,500", help="offered rates, comma separated")
+    parser.add_argument("--duration", type=float, default=5.0, help="measured seconds per configuration")
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=2.0, help="client deadline in seconds")
+    parser.add_argument("--backend-kind", default="standin", choices=("standin", "express"))
+    parser.add_argument("--backends", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.005, help="mean backend latency in seconds")
+    parser.add_argument("--distribution", default="exponential", choices=DISTRIBUTIONS)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tail-rate", type=float, default=0.0)
+    parser.add_argument("--tail-latency", type=float, default=0.0)
+    parser.add_argument("--capacity", type=int, default=None, help="concurrent requests per backend")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None, help="JSON of an older run")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    addresses, stop_backends = start_stand_ins(context, args) if args.backend_kind == "standin" else ((), None)
+    try:
+        results = []
+        for algorithm in args.algorithms.split(","):
+            for mode in args.modes.split(","):
+                for rps in args.rps.split(","):
+                    results.append(run(context, algorithm, mode, float(rps), addresses, args))
+                    r = results[-1]
+                    print(f"{algorithm} {mode} {rps}/s : goodput {r['goodput']:.1f}/s p99 {r['p99_ms']:.2f} ms",
+                          file=sys.stderr)
+    finally:
+        if stop_backends is not None:
+            stop_backends()
+
+    print(f"\n{'algorithm':<18}{'mode':<10}{'rps':>7}{'goodput':>9}{'errors':>8}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'p999 ms':>9}{'cpu %':>7}{'cpu us/req':>12}{'rss MB':>8}{'threads':>9}")
+    for r in results:
+        errors = r["shed"] + r["server_errors"] + r["timeouts"] + r["connection_errors"]
+        print(f"{r['algorithm']:<18}{r['mode']:<10}{r['rps']:>7.0f}{r['goodput']:>9.1f}{errors:>8}"
+              f"{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['p999_ms']:>9.2f}{r['cpu_percent']:>7.1f}"
+              f"{r['cpu_us_per_request']:>12.1f}{r['rss_mb'] or 0:>8.1f}{r['threads']:>9}")
+
+    output = args.output or os.path.join(BENCH_DIR, "results", time.strftime("suite-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump({
+            "meta": {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "args": vars(args),
+            },
+            "results": results,
+        }, output_file, indent=2)
+    print(f"\nresults saved to {output}")
+    if args.compare:
+        compare(results, args.compare, args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
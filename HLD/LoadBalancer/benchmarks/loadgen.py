@@ -0,0 +1,75 @@
+"""
+Open loop load generator shared by the benchmarks.
+
+Requests are started on a fixed schedule (`rps` per second) whatever the previous ones take, like real users do.
+A closed loop generator (N clients each waiting for their answer) slows down with the server and hides queueing :
+with an open loop, a saturated load balancer shows up as growing latency, timeouts and rejections.
+
+Every request gets its own connection (the load balancer closes client connections after one response) and must be
+answered within `timeout` seconds. Results are (status, latency) pairs : status is the HTTP status, "timeout", or
+0 for a connection error.
+"""
+
+import asyncio
+import time
+
+from bench_serving_modes import percentile
+
+
+def build_request(method="POST", path="/signup", body=b"", host="lb", headers=()):
+    head = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+    if body:
+        head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+    head += "".join(f"{name}: {value}\r\n" for name, value in headers)
+    return (head + "\r\n").encode('latin-1') + body
+
+
+async def one_request(host, port, request, timeout, results):
+    start = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(request)
+        response = await asyncio.wait_for(reader.read(), timeout - (time.perf_counter() - start))
+        status = int(response[9:12]) if response.startswith(b"HTTP/1.1 ") else 0
+    except asyncio.TimeoutError:
+        status = "timeout"
+    except OSError:
+        status = 0
+    finally:
+        if writer is not None:
+            writer.close()
+    results.append((status, time.perf_counter() - start))
+
+
+async def open_loop(host, port, rps, duration, timeout=1.0, request=None):
+    """send int(rps * duration) requests on schedule, returns their (status, latency) pairs"""
+    request = request or build_request()
+    results = []
+    tasks = []
+    start = time.perf_counter()
+    for i in range(int(rps * duration)):
+        delay = start + i / rps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(one_request(host, port, request, timeout, results)))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def summarize(results, duration) -> dict:
+    """throughput / goodput per second, error counts and latency percentiles (ms) of the 200 answers"""
+    served = sorted(latency for status, latency in results if status == 200)
+    return {
+        "sent": len(results),
+        "throughput": sum(1 for status, _ in results if isinstance(status, int) and status) / duration,
+        "goodput": len(served) / duration,
+        "shed": sum(1 for status, _ in results if status in (429, 503)),
+        "server_errors": sum(1 for status, _ in results if status not in (429, 503) and isinstance(status, int)
+                             and status >= 500),
+        "timeouts": sum(1 for status, _ in results if status == "timeout"),
+        "connection_errors": sum(1 for status, _ in results if status == 0),
+        "p50_ms": percentile(served, 50) * 1000,
+        "p99_ms": percentile(served, 99) * 1000,
+        "p999_ms": percentile(served, 99.9) * 1000,
+    }
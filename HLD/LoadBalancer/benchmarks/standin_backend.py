@@ -0,0 +1,170 @@
+"""
+Stand-in backend used by the benchmarks instead of server1.js / server2.js.
+Speaks just enough HTTP/1.1 (keep-alive, Content-Length / chunked bodies) and answers the same routes :
+    /heartbeat              -> {"data": {"isAlive": 1}}
+    /registration-response  -> 200
+    /blob?size=N&chunked=1  -> N bytes streamed back (Content-Length or chunked)
+    anything else           -> signup like JSON response with the size of the request body
+Heartbeats always answer, the other routes can be degraded : `error_rate` of them get a 503, `tail_rate` of them
+take `tail_latency` seconds instead of `latency`. `distribution` spreads the latency around its mean : "fixed",
+"uniform" (0 .. 2x), "exponential" or "lognormal" (sigma 1, a long tail). With a `capacity`, at most that many requests are worked on at
+once and the others queue, like a real server past saturation.
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from httputil import BodyFramer, parse_head  # noqa: E402
+
+STREAM_CHUNK = 64 * 1024
+DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+class StandInBackend:
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, is_alive=1, cache_control=None, error_rate=0.0,
+                 tail_rate=0.0, tail_latency=0.0, seed=None, capacity=None, distribution="fixed"):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution {distribution!r}, expected one of {DISTRIBUTIONS}")
+        self.host = host
+        self.port = port
+        self.latency = latency  # seconds added to every non heartbeat request
+        self.is_alive = is_alive
+        self.cache_control = cache_control  # Cache-Control header of the JSON responses (None : not sent)
+        self.error_rate = error_rate
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self._random = random.Random(seed)
+        self.capacity = capacity
+        self.distribution = distribution
+        self._workers = None
+        self.requests_served = 0
+        self._loop = None
+        self._stopped = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+            self._thread.join()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        if self.capacity:
+            self._workers = asyncio.Semaphore(self.capacity)
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with server:
+            await self._stopped.wait()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = parse_head(await reader.readuntil(b'\r\n\r\n'), "request")
+                # request bodies are consumed as they arrive, only their size is kept
+                framer = BodyFramer.for_request(head)
+                size = 0
+                while not framer.done:
+                    data = await reader.read(STREAM_CHUNK)
+                    if not data:
+                        return
+                    stop = framer.consume(data, 0, len(data))
+                    size += stop
+
+                close = not head.keep_alive
+                if head.path == "/blob":
+                    await self.send_blob(writer, head, close)
+                else:
+                    status, payload = await self.respond(head.path, size)
+                    response_body = json.dumps(payload).encode('utf-8')
+                    cache_control = f"Cache-Control: {self.cache_control}\r\n" if self.cache_control else ""
+                    writer.write(
+                        (
+                            f"HTTP/1.1 {status}\r\n"
+                            "Content-Type: application/json\r\n"
+                            f"{cache_control}"
+                            f"Content-Length: {len(response_body)}\r\n"
+                            f"Connection: {'close' if close else 'keep-alive'}\r\n"
+                            "\r\n"
+                        ).encode('latin-1') + response_body
+                    )
+                await writer.drain()
+                self.requests_served += 1
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # client went away or the stand-in is shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, path, size):
+        # returns (status line, payload)
+        if path == "/heartbeat":
+            return "200 OK", {"message": "stand-in is healthy.", "data": {"isAlive": self.is_alive}}
+        if path == "/registration-response":
+            return "200 OK", {"message": "stand-in registeration completed"}
+        latency = self.tail_latency if self._random.random() < self.tail_rate else self.sample_latency()
+        if self._workers is not None:
+            async with self._workers:
+                await asyncio.sleep(latency)
+        elif latency:
+            await asyncio.sleep(latency)
+        if self._random.random() < self.error_rate:
+            return "503 Service Unavailable", {"message": "stand-in is overloaded", "success": False}
+        return "200 OK", {"message": "Successfully signed up user", "data": {"size": size}, "success": True, "err": {}}
+
+    def sample_latency(self) -> float:
+        if not self.latency or self.distribution == "fixed":
+            return self.latency
+        if self.distribution == "uniform":
+            return self._random.uniform(0, 2 * self.latency)
+        if self.distribution == "exponential":
+            return self._random.expovariate(1 / self.latency)
+        # lognormal with sigma 1 has the requested mean when mu = ln(mean) - 1/2
+        return self._random.lognormvariate(math.log(self.latency) - 0.5, 1.0)
+
+    async def send_blob(self, writer, head, close):
+        # /blob?size=N[&chunked=1] : N bytes generated on the fly
+        query = dict(part.split('=', 1) for part in head.target.partition('?')[2].split('&') if '=' in part)
+        size = int(query.get("size", 0))
+        chunked = query.get("chunked") == "1"
+        framing = "Transfer-Encoding: chunked" if chunked else f"Content-Length: {size}"
+        writer.write(
+            (
+                "HTTP/1.1 200 OK\r\n"
+                "Content-Type: application/octet-stream\r\n"
+                f"{framing}\r\n"
+                f"Connection: {'close' if close else 'keep-alive'}\r\n"
+                "\r\n"
+            ).encode('latin-1')
+        )
+        block = b"x" * STREAM_CHUNK
+        left = size
+        while left:
+            piece = block[:min(left, STREAM_CHUNK)]
+            left -= len(piece)
+            writer.write(b"%x\r\n%s\r\n" % (len(piece), piece) if chunked else piece)
+            await writer.drain()
+        if chunked:
+            writer.write(b"0\r\n\r\n")
@@ -0,0 +1,307 @@
+"""
+Optional response cache in front of the backends.
+
+    key       : method + target + the request headers a response may vary on (accept, accept-encoding,
+                accept-language) + the body. JSON bodies are normalized (sorted keys, no whitespace) so that
+                {"a":1, "b":2} and {"b": 2,"a": 1} share an entry.
+    freshness : Cache-Control of the backend response (s-maxage, then max-age). no-store / no-cache / private,
+                Set-Cookie, Vary on other headers and non cacheable statuses are never stored. Responses without
+                Cache-Control use `default_ttl` (0 : not cached, the backend has to opt in).
+                Requests with Cache-Control no-cache / no-store or Authorization go straight to a backend.
+    eviction  : LRU bounded by the total size in bytes (`max_bytes`), responses above `max_entry_bytes` are
+                never stored.
+    coalescing: concurrent misses on the same key wait for the first one (the leader) instead of all hitting
+                a backend. Works across the threaded and the asyncio serving modes. When the leader's response
+                turns out not to be storable, the followers are released to the backend right away and the key
+                is remembered as "pass" for `pass_ttl` seconds (hit-for-pass) : its requests then go straight
+                to a backend without waiting behind each other.
+
+Entries are the exact bytes sent to the client (head + body), a hit is a single sendall.
+Hits, misses, coalesced requests, hit ratio and bytes saved are reported by stats() (/stats and /metrics).
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+CACHEABLE_METHODS = ("GET", "HEAD")
+# hit-for-pass markers kept at most (oldest dropped first)
+MAX_PASS_KEYS = 10000
+CACHEABLE_STATUSES = (200, 203, 204, 301, 404, 410)
+KEY_HEADERS = ("accept", "accept-encoding", "accept-language")
+
+
+def parse_cache_control(value) -> dict:
+    # "public, max-age=60" -> {"public": None, "max-age": "60"}
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+class CacheEntry:
+
+    __slots__ = ("data", "expires")
+
+    def __init__(self, data, expires):
+        self.data = data
+        self.expires = expires
+
+
+class Flight:
+    """One upstream call in progress for a key, the other requests for the key wait on it."""
+
+    def __init__(self):
+        self.entry = None
+        self.event = threading.Event()
+        self._waiters = []  # (loop, future) of asyncio waiters
+        self._lock = threading.Lock()
+
+    def wait(self, timeout):
+        self.event.wait(timeout)
+        return self.entry
+
+    async def wait_async(self, timeout):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.event.is_set():
+                return self.entry
+            self._waiters.append((loop, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def finish(self, entry):
+        with self._lock:
+            self.entry = entry
+            self.event.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future, entry)
+
+
+def _resolve(future, entry):
+    if not future.done():
+        future.set_result(entry)
+
+
+class ResponseRecorder:
+    """
+    Stands for the client connection while a cacheable response is relayed : everything sent to the client is
+    also kept, until `limit` bytes (then the response is just not stored).
+    Has the socket (sendall) and the asyncio StreamWriter (write / drain) interface.
+    """
+
+    def __init__(self, destination, limit, ttl):
+        self.destination = destination
+        self.limit = limit
+        self.ttl = ttl
+        self.data = bytearray()
+
+    def _keep(self, data):
+        if self.data is not None:
+            if len(self.data) + len(data) > self.limit:
+                self.data = None
+            else:
+                self.data += data
+
+    def sendall(self, data):
+        self.destination.sendall(data)
+        self._keep(data)
+
+    def write(self, data):
+        self.destination.write(data)
+        self._keep(data)
+
+    async def drain(self):
+        await self.destination.drain()
+
+
+class ResponseCache:
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entry_bytes=1024 * 1024, default_ttl=0,
+                 methods=CACHEABLE_METHODS, coalesce_timeout=10.0, pass_ttl=5.0):
+        # methods : add "POST" to cache read-only POST endpoints, the normalized body is part of the key
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.default_ttl = default_ttl
+        self.methods = tuple(methods)
+        self.coalesce_timeout = coalesce_timeout
+        self.pass_ttl = pass_ttl
+        self._entries = OrderedDict()  # key -> CacheEntry, least recently used first
+        self._flights = {}             # key -> Flight
+        self._passes = OrderedDict()   # key -> expiry of its hit-for-pass marker (uncacheable response)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.coalesced_hits = 0
+        self.passes = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    def key_for(self, head, framer, body):
+        """cache key of a request, None when it must bypass the cache"""
+        if head.method not in self.methods or head.get("authorization") is not None:
+            return None
+        directives = parse_cache_control(head.get("cache-control"))
+        if "no-cache" in directives or "no-store" in directives or head.get("pragma") == "no-cache":
+            return None
+        if body is None:
+            if not framer.done:
+                # body is streamed, we never see it whole
+                return None
+            body = b""
+        parsed = None
+        if body and "json" in head.get("content-type", ""):
+            try:
+                parsed = json.loads(body)
+            except ValueError:
+                pass
+        if parsed is not None:
+            body = json.dumps(parsed, sort_keys=True, separators=(",", ":")).encode('utf-8')
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest() if body else ""
+        varying = "\n".join(head.get(name, "").strip().lower() for name in KEY_HEADERS)
+        return f"{head.method} {head.target}\n{varying}\n{digest}"
+
+    def acquire(self, key):
+        """
+        returns (entry, flight, leader) :
+            hit      -> (entry, None, False)
+            leader   -> (None, flight, True)   : call the backend, then complete(key, flight)
+            follower -> (None, flight, False)  : flight.wait(...) / flight.wait_async(...) for the leader
+            pass     -> (None, None, False)    : the key's last response was not storable, call the backend
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.bytes_saved += len(entry.data)
+                    return entry, None, False
+                self._remove(key)
+            expires = self._passes.get(key)
+            if expires is not None:
+                if expires > now:
+                    self.passes += 1
+                    return None, None, False
+                del self._passes[key]
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return None, flight, False
+            self.misses += 1
+            flight = self._flights[key] = Flight()
+            return None, flight, True
+
+    def served_from_flight(self, entry):
+        # a follower got the leader's response
+        with self._lock:
+            self.coalesced_hits += 1
+            self.bytes_saved += len(entry.data)
+
+    def ttl_for(self, response_head) -> float:
+        """how long a response may be kept, 0 when it must not be stored"""
+        if response_head.status not in CACHEABLE_STATUSES or response_head.get("set-cookie") is not None:
+            return 0
+        vary = response_head.get("vary")
+        if vary is not None and any(
+            name.strip().lower() not in KEY_HEADERS for name in vary.split(",") if name.strip()
+        ):
+            return 0
+        value = response_head.get("cache-control")
+        if value is None:
+            return self.default_ttl
+        directives = parse_cache_control(value)
+        if "no-store" in directives or "no-cache" in directives or "private" in directives:
+            return 0
+        for name in ("s-maxage", "max-age"):
+            if directives.get(name) is not None:
+                try:
+                    return max(0, int(directives[name]))
+                except ValueError:
+                    return 0
+        return self.default_ttl
+
+    def recorder_for(self, response_head, destination, key=None):
+        """
+        ResponseRecorder to relay a response through when it can be stored, else None (and `key` is marked
+        pass : its followers are released now instead of when the response has been relayed)
+        """
+        ttl = self.ttl_for(response_head)
+        length = response_head.get("content-length")
+        if not ttl or (length is not None and length.isdigit() and int(length) > self.max_entry_bytes):
+            if key is not None:
+                self.mark_pass(key)
+            return None
+        return ResponseRecorder(destination, self.max_entry_bytes, ttl)
+
+    def mark_pass(self, key):
+        # hit-for-pass : the requests of `key` skip coalescing for pass_ttl seconds, the waiting followers go
+        # to a backend now (complete() still ends the leader's flight, finishing it twice is harmless)
+        with self._lock:
+            self._passes[key] = time.monotonic() + self.pass_ttl
+            self._passes.move_to_end(key)
+            while len(self._passes) > MAX_PASS_KEYS:
+                self._passes.popitem(last=False)
+            flight = self._flights.pop(key, None)
+        if flight is not None:
+            flight.finish(None)
+
+    def store(self, key, recorder):
+        if recorder.data is None:
+            # larger than max_entry_bytes, found out while relaying
+            self.mark_pass(key)
+            return
+        data = bytes(recorder.data)
+        with self._lock:
+            self._remove(key)
+            self._passes.pop(key, None)
+            self._entries[key] = CacheEntry(data, time.monotonic() + recorder.ttl)
+            self._bytes += len(data)
+            self.stores += 1
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def complete(self, key, flight):
+        # leader is done (stored or not) : wake the followers up
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            entry = self._entries.get(key)
+        flight.finish(entry)
+
+    def _remove(self, key):
+        # with the lock held
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced + self.passes
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "passes": self.passes,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "coalesced_hits": self.coalesced_hits,
+                "hit_ratio": (self.hits + self.coalesced_hits) / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
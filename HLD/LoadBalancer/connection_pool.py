@@ -0,0 +1,240 @@
+"""
+Keep-alive connection pools to the backend servers.
+
+Opening a new TCP connection per forwarded request (and per heartbeat) costs a handshake every
+time and under sustained load leaves thousands of sockets in TIME_WAIT, exhausting ephemeral ports.
+Instead every backend gets a small pool of persistent HTTP/1.1 connections :
+    - bounded : at most `max_size` idle connections are kept per backend. When all of them are
+      busy an extra connection is opened and closed after use (never blocks the caller).
+    - idle timeout : connections idle longer than `idle_timeout` are closed instead of reused.
+      Keep it below the backend keep-alive timeout (5s for node/express) so we never reuse a
+      connection the backend is about to close.
+    - eviction : evict(backend) closes every idle connection of a backend, used when the
+      heartbeat marks it dead.
+
+Idle connections are checked before reuse (a closed one is readable with EOF).
+ConnectionPool is used from the request threads and the heartbeat thread,
+AsyncConnectionPool is the event loop counterpart used by the asyncio serving mode.
+"""
+
+import asyncio
+import select
+import socket
+import threading
+import time
+import json
+from collections import deque
+
+from httputil import MAX_HEAD_SIZE, BodyFramer
+from relay import recv_head, read_body
+
+
+class PooledResponse:
+    """Fully read backend response (same fields we used from requests.Response)."""
+
+    def __init__(self, status_code, reason, headers, content):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers  # MessageHead, lower-case lookups with headers.get()
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class PoolStats:
+    """hits / misses / open connections of one backend."""
+
+    __slots__ = ("hits", "misses", "open")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.open = 0
+
+    def as_dict(self, idle):
+        return {"hits": self.hits, "misses": self.misses, "open": self.open, "idle": idle}
+
+
+class ConnectionPool:
+
+    def __init__(self, max_size=10, idle_timeout=4.0, timeout=10.0):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = {}   # backend address -> deque of (connection, last used time)
+        self._stats = {}  # backend address -> PoolStats
+        self._lock = threading.Lock()
+
+    def _stats_for(self, backend):
+        stats = self._stats.get(backend)
+        if stats is None:
+            stats = self._stats[backend] = PoolStats()
+        return stats
+
+    def acquire(self, backend):
+        """returns (socket, reused)"""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            stats = self._stats_for(backend)
+            idle = self._idle.get(backend)
+            conn = None
+            while idle:
+                # LIFO : the most recently used connection is the least likely to be closed by the backend
+                candidate, last_used = idle.pop()
+                if now - last_used <= self.idle_timeout and is_connection_alive(candidate):
+                    conn = candidate
+                    break
+                expired.append(candidate)
+                stats.open -= 1
+            if conn is not None:
+                stats.hits += 1
+            else:
+                stats.misses += 1
+                stats.open += 1
+        for old in expired:
+            old.close()
+        if conn is not None:
+            return conn, True
+        host, port = backend.rsplit(':', 1)
+        try:
+            conn = socket.create_connection((host, int(port)), timeout=self.timeout)
+        except OSError:
+            with self._lock:
+                stats.open -= 1
+            raise
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn, False
+
+    def release(self, backend, conn, reusable=True):
+        with self._lock:
+            idle = self._idle.setdefault(backend, deque())
+            if reusable and len(idle) < self.max_size:
+                idle.append((conn, time.monotonic()))
+                return
+            self._stats_for(backend).open -= 1
+        conn.close()
+
+    def evict(self, backend):
+        # backend marked dead : close every idle connection to it
+        with self._lock:
+            idle = self._idle.pop(backend, None)
+            if not idle:
+                return
+            self._stats_for(backend).open -= len(idle)
+        for conn, _ in idle:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            backends = list(self._idle)
+        for backend in backends:
+            self.evict(backend)
+
+    def request(self, backend, method, path, body=b"", headers=None) -> PooledResponse:
+        # send one small request over a pooled connection, retry once if a reused connection went stale
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {backend}", f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body
+        for attempt in range(2):
+            conn, reused = self.acquire(backend)
+            try:
+                conn.sendall(request)
+                buffer = bytearray(MAX_HEAD_SIZE)
+                head, start, end = recv_head(conn, buffer, "response")
+                framer = BodyFramer.for_response(head, method)
+                content = read_body(conn, framer, buffer, start, end)
+            except ConnectionError:
+                self.release(backend, conn, reusable=False)
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                self.release(backend, conn, reusable=False)
+                raise
+            self.release(backend, conn, reusable=head.keep_alive and framer.mode != BodyFramer.UNTIL_CLOSE)
+            return PooledResponse(head.status, head.reason, head, content)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                backend: stats.as_dict(len(self._idle.get(backend, ())))
+                for backend, stats in self._stats.items()
+            }
+
+
+def is_connection_alive(conn) -> bool:
+    # an idle keep-alive connection must have nothing to read :
+    # readable means EOF (backend closed it) or unexpected bytes left over from a previous response
+    poller = select.poll()
+    poller.register(conn, select.POLLIN)
+    return not poller.poll(0)
+
+
+class AsyncConnectionPool:
+    """
+    Same policy as ConnectionPool for asyncio streams. Only touched from the event loop thread,
+    so no locking is needed.
+    """
+
+    def __init__(self, max_size=10, idle_timeout=4.0, timeout=10.0):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        # connect timeout, like the socket timeout of ConnectionPool : a blackholed backend must not hang forever
+        self.timeout = timeout
+        self._idle = {}   # backend address -> deque of ((reader, writer), last used time)
+        self._stats = {}  # backend address -> PoolStats
+
+    def _stats_for(self, backend):
+        stats = self._stats.get(backend)
+        if stats is None:
+            stats = self._stats[backend] = PoolStats()
+        return stats
+
+    async def acquire(self, backend):
+        """returns (reader, writer, reused)"""
+        now = time.monotonic()
+        stats = self._stats_for(backend)
+        idle = self._idle.get(backend)
+        while idle:
+            (reader, writer), last_used = idle.pop()
+            if now - last_used <= self.idle_timeout and not reader.at_eof() and not writer.is_closing():
+                stats.hits += 1
+                return reader, writer, True
+            stats.open -= 1
+            writer.close()
+        stats.misses += 1
+        host, port = backend.rsplit(':', 1)
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), self.timeout)
+        stats.open += 1
+        return reader, writer, False
+
+    def release(self, backend, reader, writer, reusable=True):
+        idle = self._idle.setdefault(backend, deque())
+        if reusable and len(idle) < self.max_size and not writer.is_closing():
+            idle.append(((reader, writer), time.monotonic()))
+            return
+        self._stats_for(backend).open -= 1
+        writer.close()
+
+    def evict(self, backend):
+        idle = self._idle.pop(backend, None)
+        if not idle:
+            return
+        self._stats_for(backend).open -= len(idle)
+        for (_, writer), _ in idle:
+            writer.close()
+
+    def stats(self) -> dict:
+        # may be called from another thread : iterate over a copy
+        return {
+            backend: stats.as_dict(len(self._idle.get(backend, ())))
+            for backend, stats in list(self._stats.items())
+        }
@@ -0,0 +1,133 @@
+"""
+Consistent hashing / sticky routing.
+
+Every backend owns `vnodes * weight` points on a 64 bit hash ring. A request key is hashed and goes to the
+owner of the first point clockwise (bisect on the sorted points, O(log n)). Points of a backend only depend
+on its address, so when register_server adds a backend or the heartbeat removes one, only the keys of the
+arcs it gains / loses move (about 1/n of them), every other client stays on its backend and keeps its
+per-user cache warm.
+
+Bounded loads (consistent hashing with bounded loads, Mirrokni et al.) : a backend never takes more than
+`load_factor` times the average number of in-flight requests. When the owner is full the request spills
+over to the next backend clockwise, so a hot key can not overload one server.
+
+The key is a request attribute, configured with `key` :
+    "ip"                 : client address (default)
+    "header:<name>"      : a request header, e.g. "header:x-user-id"
+    "json:<field>"       : a field of a small JSON body, e.g. "json:user"
+Requests without the key fall back to the client address.
+
+usage : LoadBalancer(..., algorithm="ConsistentHash", algorithm_options={"key": "json:user"})
+"""
+
+import bisect
+import hashlib
+import random
+
+from algorithms import BalancingAlgorithm, BalancingAlgorithmFactory
+
+DEFAULT_VNODES = 100
+
+
+def hash_key(key) -> int:
+    # stable across processes (unlike hash()), so every worker maps a key to the same backend
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big')
+
+
+def key_extractor(key):
+    """returns a function RouteContext -> key (or None when the request does not carry it)"""
+    if key == "ip":
+        return lambda request: request.client_ip
+    kind, _, name = key.partition(":")
+    if kind == "header" and name:
+        name = name.lower()
+        return lambda request: request.head.get(name) if request.head is not None else None
+    if kind == "json" and name:
+        def from_json(request):
+            body = request.json
+            value = body.get(name) if isinstance(body, dict) else None
+            return None if value is None else str(value)
+        return from_json
+    raise ValueError(f"Unknown hash key {key!r}, expected 'ip', 'header:<name>' or 'json:<field>'")
+
+
+@BalancingAlgorithmFactory.register("ConsistentHash")
+class ConsistentHash(BalancingAlgorithm):
+
+    def __init__(self, tracker, key="ip", vnodes=DEFAULT_VNODES, load_factor=1.25):
+        super().__init__(tracker)
+        self.key = key
+        self.extract = key_extractor(key)
+        self.reads_json = key.startswith("json:")
+        self.vnodes = vnodes
+        # None disables bounded loads (pure consistent hashing)
+        self.load_factor = load_factor
+        # points of the current backends, sorted : (hash, (backend, weight)). A backend leaving (removed, down) or
+        # changing weight has its points dropped, so memory follows the live set ; a new one is one merge
+        self._sorted = []
+        self._known = set()
+        # (sorted hashes, owner of each hash, backends), swapped in one assignment and read once per request :
+        # choose() never mixes the ring of one update with the backends of another
+        self._ring = ((), (), ())
+
+    def points_for(self, backend, weight):
+        count = max(1, round(self.vnodes * weight))
+        return [hash_key(f"{backend}#{i}") for i in range(count)]
+
+    def update(self, backends, weights=None):
+        super().update(backends, weights)
+        weights = weights or {}
+        wanted = {(backend, weights.get(backend, 1)) for backend in self.backends}
+        stale = self._known - wanted
+        if stale:
+            # removed backends, and the old weight of a backend whose weight changed
+            self._sorted = [entry for entry in self._sorted if entry[1] in wanted]
+            self._known -= stale
+        new = wanted - self._known
+        if new:
+            for member in new:
+                self._sorted.extend((point, member) for point in self.points_for(*member))
+            # timsort merges the sorted run with the appended points
+            self._sorted.sort()
+            self._known |= new
+        self._ring = (tuple(point for point, _ in self._sorted), tuple(member[0] for _, member in self._sorted),
+                      tuple(self.backends))
+
+    def lookup(self, key):
+        # owner of key without bounded loads (used by the benchmark to count remapped keys)
+        hashes, owners, _ = self._ring
+        if not hashes:
+            return None
+        index = bisect.bisect(hashes, hash_key(key))
+        return owners[index % len(owners)]
+
+    def choose(self, request=None):
+        hashes, owners, backends = self._ring
+        if not hashes:
+            return None
+        key = self.extract(request) if request is not None else None
+        if key is None and request is not None:
+            key = request.client_ip
+        if key is None:
+            return random.choice(backends)
+        index = bisect.bisect(hashes, hash_key(key))
+        if self.load_factor is None:
+            return owners[index % len(owners)]
+
+        # bounded loads : walk clockwise till a backend below capacity, each backend is looked at once
+        count = len(backends)
+        capacity = self.load_factor * (self.tracker.total_inflight + 1) / count
+        seen = set()
+        size = len(owners)
+        for step in range(size):
+            backend = owners[(index + step) % size]
+            if backend in seen:
+                continue
+            if self.tracker.inflight(backend) < capacity:
+                return backend
+            seen.add(backend)
+            if len(seen) == count:
+                break
+        return owners[index % size]
@@ -0,0 +1,225 @@
+"""
+Health checking of the registered backends (PULL / heartbeat model).
+
+The old heartbeat loop probed every backend one after the other, inside server_lock and without a
+timeout : a single hung backend froze health checking for the whole fleet (and routing with it).
+HealthChecker is a small scheduler instead :
+    - concurrent   : probes run on a thread pool, the scheduler thread never waits for one.
+    - timeouts     : a probe still running after `timeout` counts as a failure, its late result is ignored.
+    - rise / fall  : a backend goes down after `fall` consecutive failures and comes back after `rise`
+                     consecutive successes, one lost heartbeat does not flap the routing table.
+                     While a healthy backend has a failure streak it is re-probed every `fast_interval`.
+    - jitter       : every backend has its own schedule, spread by +/- `jitter` of the interval, so the
+                     probes (and the backends answering them) do not all fire on the same tick.
+    - backoff      : a dead backend is probed less and less often (interval * 2^n, capped at `max_backoff`).
+    - passive      : the proxy path reports connection failures / timeouts with report_failure(). They count
+                     like failed probes and trigger an immediate active probe.
+
+Detection latency of a dead backend is bounded by about interval + fall * (timeout + fast_interval)
+whatever the fleet size.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from log import get_logger
+
+logger = get_logger("health")
+
+# longest sleep of the scheduler when nothing is due (it is woken up by add / report_failure anyway)
+MAX_TICK = 1.0
+
+
+class BackendHealth:
+    """Health state of one backend, only touched with HealthChecker._lock held."""
+
+    __slots__ = (
+        "healthy", "successes", "failures", "next_check", "deadline", "probe_id", "backoff",
+        "probes_ok", "probes_failed", "passive_failures",
+    )
+
+    def __init__(self, healthy, next_check):
+        self.healthy = healthy
+        self.successes = 0   # consecutive successes
+        self.failures = 0    # consecutive failures
+        self.next_check = next_check
+        self.deadline = None # end of the running probe, None when no probe is running
+        self.probe_id = 0    # results of older (timed out) probes are ignored
+        self.backoff = 1     # interval multiplier while the backend is down
+        # totals, for the metrics endpoint
+        self.probes_ok = 0
+        self.probes_failed = 0
+        self.passive_failures = 0
+
+    def as_dict(self):
+        return {
+            "healthy": self.healthy,
+            "successes": self.successes,
+            "failures": self.failures,
+            "backoff": self.backoff,
+            "probes_ok": self.probes_ok,
+            "probes_failed": self.probes_failed,
+            "passive_failures": self.passive_failures,
+        }
+
+
+class HealthChecker:
+
+    def __init__(self, probe, on_change, interval=5.0, timeout=2.0, rise=2, fall=3,
+                 fast_interval=1.0, jitter=0.2, max_backoff=60.0, max_workers=32, on_flipped=None):
+        # probe(server_addr) -> truthy when the backend is healthy, it should give up after `timeout` itself
+        # on_change(server_addr, healthy) is called when a backend flips, with the checker lock held so that
+        # flips are applied in order : it must not call back into the checker
+        # on_flipped(server_addr, healthy) is called for the same flip once the lock is released : notifications
+        # which may be slow or call back into the checker (health.stats() ...)
+        self.probe = probe
+        self.on_change = on_change
+        self.on_flipped = on_flipped
+        self.interval = interval
+        self.timeout = timeout
+        self.rise = rise
+        self.fall = fall
+        self.fast_interval = fast_interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self._states = {}  # server_addr -> BackendHealth
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="health")
+
+    def add(self, server_addr, healthy=True):
+        # (re)registration : trust what the backend says and probe it within one interval
+        with self._lock:
+            state = self._states.get(server_addr)
+            if state is None:
+                # first probe somewhere in the next interval, not all backends at once
+                self._states[server_addr] = BackendHealth(healthy, time.monotonic() + random.uniform(0, self.interval))
+            else:
+                state.healthy = healthy
+                state.successes = state.failures = 0
+                state.backoff = 1
+        self._wakeup.set()
+
+    def remove(self, server_addr):
+        with self._lock:
+            self._states.pop(server_addr, None)
+
+    def is_healthy(self, server_addr) -> bool:
+        state = self._states.get(server_addr)
+        return state is not None and state.healthy
+
+    def report_failure(self, server_addr):
+        # passive signal from the proxy path : connection refused / reset / timed out
+        with self._lock:
+            state = self._states.get(server_addr)
+            if state is None:
+                return
+            state.passive_failures += 1
+            flipped = self._record(state, False)
+            if flipped:
+                self.on_change(server_addr, False)
+            # confirm with an active probe right away instead of waiting for the next tick
+            state.next_check = time.monotonic()
+        self._wakeup.set()
+        if flipped and self.on_flipped is not None:
+            self.on_flipped(server_addr, False)
+
+    def report_success(self, server_addr):
+        # called for every proxied request : only take the lock when there is a failure streak to reset
+        state = self._states.get(server_addr)
+        if state is not None and state.failures:
+            with self._lock:
+                state.failures = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {server_addr: state.as_dict() for server_addr, state in self._states.items()}
+
+    def run(self, stop_event):
+        # scheduler loop : start the probes that are due, expire the ones past their deadline
+        while not stop_event.is_set():
+            self._wakeup.clear()
+            now = time.monotonic()
+            due = []
+            timed_out = []
+            next_wakeup = now + MAX_TICK
+            with self._lock:
+                for server_addr, state in self._states.items():
+                    if state.deadline is not None:
+                        if now >= state.deadline:
+                            timed_out.append(server_addr)
+                        else:
+                            next_wakeup = min(next_wakeup, state.deadline)
+                    elif now >= state.next_check:
+                        state.probe_id += 1
+                        state.deadline = now + self.timeout
+                        due.append((server_addr, state.probe_id))
+                        next_wakeup = min(next_wakeup, state.deadline)
+                    else:
+                        next_wakeup = min(next_wakeup, state.next_check)
+            for server_addr in timed_out:
+                logger.warning("heartbeat to %s timed out", server_addr)
+                self._finish(server_addr, None, False)
+            for server_addr, probe_id in due:
+                self._executor.submit(self._run_probe, server_addr, probe_id)
+            if stop_event.wait(0) or timed_out:
+                continue
+            self._wakeup.wait(max(0.0, next_wakeup - time.monotonic()))
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stop(self):
+        self._wakeup.set()
+
+    def _run_probe(self, server_addr, probe_id):
+        try:
+            healthy = bool(self.probe(server_addr))
+        except Exception as e:
+            logger.warning("heartbeat to %s failed : %s", server_addr, e)
+            healthy = False
+        self._finish(server_addr, probe_id, healthy)
+
+    def _finish(self, server_addr, probe_id, healthy):
+        # probe_id None : the scheduler expired the running probe
+        with self._lock:
+            state = self._states.get(server_addr)
+            if state is None or state.deadline is None or (probe_id is not None and probe_id != state.probe_id):
+                return
+            state.deadline = None
+            if healthy:
+                state.probes_ok += 1
+            else:
+                state.probes_failed += 1
+            flipped = self._record(state, healthy)
+            if flipped:
+                self.on_change(server_addr, healthy)
+            state.next_check = time.monotonic() + self._next_interval(state)
+        if flipped and self.on_flipped is not None:
+            self.on_flipped(server_addr, healthy)
+
+    def _record(self, state, healthy) -> bool:
+        # apply one result, returns True when the backend flipped. called with the lock held
+        if healthy:
+            state.successes += 1
+            state.failures = 0
+            state.backoff = 1
+            if not state.healthy and state.successes >= self.rise:
+                state.healthy = True
+                return True
+        else:
+            state.failures += 1
+            state.successes = 0
+            if not state.healthy:
+                # still dead : probe it less often
+                state.backoff = min(state.backoff * 2, max(1, int(self.max_backoff / self.interval)))
+            elif state.failures >= self.fall:
+                state.healthy = False
+                return True
+        return False
+
+    def _next_interval(self, state):
+        if state.healthy and state.failures:
+            # failing but not down yet : confirm quickly
+            return self.fast_interval
+        return self.interval * state.backoff * random.uniform(1 - self.jitter, 1 + self.jitter)
@@ -0,0 +1,325 @@
+"""
+Small HTTP/1.1 helpers shared by the threaded and the asyncio serving modes of the load balancer.
+
+The load balancer relays bodies without buffering them, so parsing is split in two parts :
+    - parse_head() parses the request / status line and the headers (bounded size).
+    - BodyFramer only tracks where a body ends (Content-Length, chunked or until close) while the
+      body bytes themselves are relayed untouched. Chunk data is skipped by counting, only the chunk
+      size lines and trailers are looked at.
+Nothing here does I/O, both serving modes feed it with whatever they read from their sockets.
+"""
+
+import json
+
+from log import get_logger
+
+logger = get_logger("http")
+
+# max size of request / status line + headers
+MAX_HEAD_SIZE = 64 * 1024
+# bodies up to this size may be read whole before forwarding (JSON hash key, cache key, retries)
+MAX_INSPECT_BODY = 64 * 1024
+# max size of a chunk size line or trailer line inside a chunked body
+MAX_LINE_SIZE = 8 * 1024
+
+# headers which only make sense for a single connection, never forwarded
+# (transfer-encoding is kept : bodies are relayed with their original framing)
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection", "keep-alive", "proxy-connection", "te", "trailer", "upgrade",
+    "proxy-authenticate", "proxy-authorization",
+})
+
+# the client connection is closed after one response
+CLIENT_RESPONSE_HEADERS = (("Connection", "close"),)
+
+# reason phrases for the status codes the load balancer itself produces
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    429: "Too Many Requests",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+class HTTPParseError(ValueError):
+    """Malformed HTTP message."""
+
+
+class IncompleteMessage(ConnectionError):
+    """Peer closed the connection in the middle of a message."""
+
+
+class MessageHead:
+    """Parsed request / status line and headers of one HTTP message."""
+
+    __slots__ = ("method", "target", "status", "reason", "version", "headers", "_index")
+
+    def __init__(self, version, headers, method=None, target=None, status=None, reason=None):
+        self.method = method
+        self.target = target
+        self.status = status
+        self.reason = reason
+        self.version = version
+        self.headers = headers  # list of (name, value) in received order
+        self._index = {name.lower(): value for name, value in headers}
+
+    def get(self, name, default=None):
+        # name must be lower-case
+        return self._index.get(name, default)
+
+    def get_all(self, name) -> list:
+        # every value of a repeated header, name must be lower-case
+        return [value for header, value in self.headers if header.lower() == name]
+
+    def remove(self, name):
+        # drop a header before the head is forwarded, name must be lower-case
+        self.headers = [(header, value) for header, value in self.headers if header.lower() != name]
+        self._index.pop(name, None)
+
+    def set(self, name, value):
+        # replace every value of a header with a single one
+        self.remove(name.lower())
+        self.headers.append((name, value))
+        self._index[name.lower()] = value
+
+    @property
+    def path(self):
+        return self.target.split('?', 1)[0]
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self._index.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return "keep-alive" in connection
+        return "close" not in connection
+
+    def serialize(self, extra_headers=()) -> bytes:
+        # start line + end to end headers + our own headers
+        if self.status is None:
+            start_line = f"{self.method} {self.target} {self.version}"
+        else:
+            start_line = f"{self.version} {self.status} {self.reason}"
+        lines = [start_line]
+        for name, value in self.headers:
+            if name.lower() not in HOP_BY_HOP_HEADERS:
+                lines.append(f"{name}: {value}")
+        for name, value in extra_headers:
+            lines.append(f"{name}: {value}")
+        lines.append("\r\n")
+        return "\r\n".join(lines).encode('latin-1')
+
+
+def parse_head(raw: bytes, kind="request") -> MessageHead:
+    """
+    Parse the head of a request (kind="request") or a response (kind="response").
+    raw holds everything up to and including the blank line.
+    """
+    try:
+        lines = raw.decode('latin-1').split('\r\n')
+        headers = []
+        for line in lines[1:]:
+            if not line:
+                break
+            name, sep, value = line.partition(':')
+            if not sep or not name or name != name.strip():
+                raise HTTPParseError(f"Invalid header line {line!r}")
+            headers.append((name, value.strip()))
+        if kind == "request":
+            method, target, version = lines[0].split(' ')
+            return MessageHead(version, headers, method=method, target=target)
+        version, status, *reason = lines[0].split(' ', 2)
+        return MessageHead(version, headers, status=int(status), reason=reason[0] if reason else "")
+    except ValueError as e:
+        if isinstance(e, HTTPParseError):
+            raise
+        raise HTTPParseError(f"Invalid {kind} line") from e
+
+
+class BodyFramer:
+    """
+    Tracks the end of a message body while its bytes are relayed as they are.
+        consume(buffer, start, end) -> index where the body ends inside buffer[start:end]
+        bulk_remaining              -> bytes that can be relayed blindly (no framing inside)
+        skip(n)                     -> account for n bulk bytes relayed without looking at them
+    """
+
+    NONE, LENGTH, CHUNKED, UNTIL_CLOSE = range(4)
+    # chunked states
+    _SIZE, _DATA, _DATA_END, _TRAILER = range(4)
+
+    __slots__ = ("mode", "remaining", "done", "_state", "_line")
+
+    def __init__(self, mode, length=0):
+        self.mode = mode
+        self.remaining = length
+        self.done = mode == BodyFramer.NONE or (mode == BodyFramer.LENGTH and length == 0)
+        self._state = BodyFramer._SIZE
+        self._line = bytearray()
+
+    @classmethod
+    def for_request(cls, head: MessageHead):
+        return cls._from_headers(head, default=cls.NONE)
+
+    @classmethod
+    def for_response(cls, head: MessageHead, request_method: str):
+        if request_method == "HEAD" or head.status in (204, 304) or 100 <= head.status < 200:
+            return cls(cls.NONE)
+        return cls._from_headers(head, default=cls.UNTIL_CLOSE)
+
+    @classmethod
+    def _from_headers(cls, head, default):
+        transfer_encoding = head.get("transfer-encoding")
+        if transfer_encoding is not None:
+            if transfer_encoding.lower().rsplit(',', 1)[-1].strip() != "chunked":
+                raise HTTPParseError(f"Unsupported transfer-encoding {transfer_encoding!r}")
+            # transfer-encoding wins : a content-length forwarded next to it could make the next hop frame the
+            # body differently (request smuggling)
+            if head.get("content-length") is not None:
+                head.remove("content-length")
+            return cls(cls.CHUNKED)
+        if head.get("content-length") is not None:
+            # repeated headers or "5, 5" : every value must be the same ASCII number
+            values = head.get_all("content-length")
+            lengths = {value.strip() for header in values for value in header.split(',')}
+            if len(lengths) != 1:
+                raise HTTPParseError(f"Conflicting content-length {sorted(lengths)!r}")
+            content_length = lengths.pop()
+            # isdigit() alone accepts "²" and other non ASCII digits
+            if not (content_length.isascii() and content_length.isdigit()):
+                raise HTTPParseError(f"Invalid content-length {content_length!r}")
+            if len(values) > 1 or ',' in values[0]:
+                # forwarded as one plain header
+                head.set("Content-Length", content_length)
+            return cls(cls.LENGTH, int(content_length))
+        return cls(default)
+
+    @property
+    def bulk_remaining(self) -> int:
+        if self.mode == BodyFramer.LENGTH or (self.mode == BodyFramer.CHUNKED and self._state == BodyFramer._DATA):
+            return self.remaining
+        return 0
+
+    def skip(self, n):
+        self.remaining -= n
+        if self.remaining == 0:
+            if self.mode == BodyFramer.LENGTH:
+                self.done = True
+            else:
+                self._state = BodyFramer._DATA_END
+                self.remaining = 2
+
+    def finish(self):
+        # the peer closed the connection : end of an until-close body
+        if self.mode != BodyFramer.UNTIL_CLOSE:
+            raise IncompleteMessage("connection closed before the end of the body")
+        self.done = True
+
+    def consume(self, buffer, start, end) -> int:
+        if self.done:
+            return start
+        if self.mode == BodyFramer.UNTIL_CLOSE:
+            return end
+        if self.mode == BodyFramer.LENGTH:
+            take = min(self.remaining, end - start)
+            if take:
+                self.skip(take)
+            return start + take
+        return self._consume_chunked(buffer, start, end)
+
+    def _consume_chunked(self, buffer, i, end):
+        while i < end and not self.done:
+            state = self._state
+            if state == BodyFramer._DATA or state == BodyFramer._DATA_END:
+                take = min(self.remaining, end - i)
+                i += take
+                self.remaining -= take
+                if self.remaining:
+                    continue
+                if state == BodyFramer._DATA:
+                    # chunk data is followed by CRLF
+                    self._state = BodyFramer._DATA_END
+                    self.remaining = 2
+                else:
+                    self._state = BodyFramer._SIZE
+                continue
+            # size line or trailer line : look for the end of line
+            newline = buffer.find(b'\n', i, end)
+            stop = end if newline < 0 else newline + 1
+            self._line += buffer[i:stop]
+            i = stop
+            if len(self._line) > MAX_LINE_SIZE:
+                raise HTTPParseError("Chunk line too long")
+            if newline < 0:
+                continue
+            line = bytes(self._line).strip()
+            self._line.clear()
+            if state == BodyFramer._SIZE:
+                try:
+                    size = int(line.split(b';', 1)[0], 16)
+                except ValueError:
+                    raise HTTPParseError(f"Invalid chunk size {line!r}") from None
+                if size == 0:
+                    self._state = BodyFramer._TRAILER
+                else:
+                    self._state = BodyFramer._DATA
+                    self.remaining = size
+            elif not line:
+                # empty line after the last chunk / trailers
+                self.done = True
+        return i
+
+
+def find_head_end(buffer, end, start=0) -> int:
+    """index just after the blank line ending the head, -1 if not received yet."""
+    index = buffer.find(b'\r\n\r\n', max(0, start - 3), end)
+    return -1 if index < 0 else index + 4
+
+
+def forwarding_headers(client_ip):
+    # headers added to every request relayed to a backend
+    return (("X-Forwarded-For", client_ip), ("Connection", "keep-alive"))
+
+
+def is_small_body(framer: BodyFramer) -> bool:
+    """body with a known, small length : cheap enough to read whole before forwarding it."""
+    return framer.mode == BodyFramer.LENGTH and 0 < framer.remaining <= MAX_INSPECT_BODY
+
+
+def is_json(head: MessageHead) -> bool:
+    return "json" in head.get("content-type", "")
+
+
+def parse_json_body(body: bytes):
+    """Decode a JSON body, returns None for empty or invalid payloads."""
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        logger.debug("Invalid JSON format")
+        return None
+
+
+def build_response(status: int, body: bytes = b"", content_type: str = "application/json", reason: str = None,
+                   headers=()) -> bytes:
+    """Build a complete HTTP/1.1 response which closes the connection after it is sent."""
+    reason = reason or REASONS.get(status, "Unknown")
+    extra = "".join(f"{name}: {value}\r\n" for name, value in headers)
+    head = (
+        f"HTTP/1.1 {status} {reason}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"{extra}"
+        "Connection: close\r\n"
+        "\r\n"
+    )
+    return head.encode('latin-1') + body
+
+
+def build_json_response(status: int, payload: dict) -> bytes:
+    return build_response(status, json.dumps(payload).encode('utf-8'))
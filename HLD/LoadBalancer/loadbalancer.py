@@ -1,7 +1,7 @@
 """
 Load Balancer Implementation in python 
 Here we will implement different Load balancing algorithms to route traffic .
-Load Balancer can configure your server in PULL (heartbeatModel) or PUSH .
+Load Balancer can configure your server in PULL (heartbeatModel, health.py) or PUSH (status frames, push.py) .
 Key points for reference
 1. Load Balancer can be implemented as a separate server which will route traffic. 
 2. Load Balancer can be implemented as a socket server connection also . 
@@ -10,206 +10,679 @@ Key points for reference
 # load balancer implementation in python using socket and threading 
 import threading
 import socket
-import requests
+import time
 import json 
+import random
+
+import consistent_hash  # noqa: F401  registers the ConsistentHash algorithm
+from admission import AdmissionControl, reject
+from algorithms import BalancingAlgorithmFactory, LoadTracker, RouteContext
+from cache import ResponseCache
+from connection_pool import ConnectionPool
+from health import HealthChecker
+from httputil import (
+    CLIENT_RESPONSE_HEADERS, BodyFramer, HTTPParseError, build_json_response, forwarding_headers,
+    is_json, is_small_body, parse_json_body,
+)
+from log import get_logger
+from relay import BUFFER_SIZE, open_splice_pipe, read_body, recv_head, relay_body, send_request, wait_readable
+from resilience import RETRYABLE_STATUSES, ResiliencePolicy, is_idempotent
+
+# leveled, queued logging (log.py) : per request messages are DEBUG, set LB_LOG_LEVEL=DEBUG to see them
+logger = get_logger("loadbalancer")
+
+# serving modes :
+# threaded -> one thread per accepted connection, blocking backend calls
+# async    -> single asyncio event loop, non blocking backend calls (see async_engine.py)
+SERVING_MODES = ("threaded", "async")
 
 class LoadBalancer:
 
-    def __init__(self,ip,port,algorithm="random"):
+    def __init__(self,ip,port,algorithm="random",mode="threaded",pool_size=10,pool_idle_timeout=4.0,health_options=None,
+                 algorithm_options=None,reuse_port=False,admin_port=None,cache_options=None,
+                 resilience_options=None,admission_options=None,push_port=None,push_options=None,
+                 events=None):
         # by default algorithm I am considering load balancing algo as random 
-        print("Initialising Load Balancer....")
+        if mode not in SERVING_MODES:
+            raise ValueError(f"Unknown serving mode {mode!r}, expected one of {SERVING_MODES}")
+        logger.info("Initialising Load Balancer....")
         self.ip = ip
         self.port = port
         self.algorithm = algorithm  
+        self.mode = mode
+        # SO_REUSEPORT : several worker processes bind the same port, the kernel spreads connections (multiworker.py)
+        self.reuse_port = reuse_port
         self.servers = {}  # Dictionary to store registered servers [shared Resource]
         self.server_lock= threading.Lock()
-        self.round_robin_index = 0 # for round robin algorithm
+        # snapshot of the healthy backends published to the algorithms : (alive tuple, weights)
+        self._refresh_lock = threading.Lock()
+        self._published = ((), {})
+        self.healthy_backends = ()
+        # live in-flight / latency counters per backend, maintained by the proxy path
+        self.tracker = LoadTracker()
+        # algorithm instances by name, kept in sync with the healthy backends (unknown name -> ValueError)
+        self.algorithm_factory = BalancingAlgorithmFactory()
+        # algorithm_options are passed to the configured algorithm, e.g. {"key": "json:user"} for ConsistentHash
+        self.balancers = {
+            algorithm: self.algorithm_factory.get_algorithm(algorithm, self.tracker, **(algorithm_options or {}))
+        }
+        # keep-alive connections to the backends, shared by request handlers, heartbeats and registration
+        self.pool = ConnectionPool(max_size=pool_size, idle_timeout=pool_idle_timeout)
+        # health checks : concurrent probes with timeouts, rise / fall thresholds, jitter and backoff.
+        # health_options are passed to HealthChecker (interval, timeout, rise, fall, jitter, max_backoff ...)
+        self.health = self.make_health_checker(health_options or {})
+        # probes get their own pool so that the socket timeout is the probe timeout
+        self.health_pool = ConnectionPool(max_size=1, idle_timeout=pool_idle_timeout, timeout=self.health.timeout)
+        # optional response cache : cache_options={} enables it with the defaults of ResponseCache
+        self.cache = ResponseCache(**cache_options) if cache_options is not None else None
+        # circuit breakers, retries and hedging of the forwarding path (resilience.py). Breakers and retries are
+        # on by default, resilience_options={"hedge": True} adds hedged requests, {"max_retries": 0} disables retries
+        self.resilience = ResiliencePolicy(self.refresh_backends, **(resilience_options or {}))
+        # optional admission control (admission.py) : per client rate limit and adaptive concurrency limit,
+        # checked right after accept. admission_options={} enables the adaptive limit, {"rate": 50} adds the rate limit
+        self.admission = AdmissionControl(**admission_options) if admission_options is not None else None
+        self.async_engine = None
+        # admin listener (/metrics, /stats, POST /register), only started when admin_port is given (0 = any free port)
+        self.admin_port = admin_port
+        self.admin_server = None
+        # PUSH heartbeat listener (push.py), only started when push_port is given (0 = any free port).
+        # push_options are passed to PushListener (batch_interval, dead_after)
+        self.push_port = push_port
+        self.push_options = push_options or {}
+        self.push_listener = None
+        # optional event bus (anything with publish(topic, event), e.g. EventBus of LLD/.../observer.py) :
+        # "backend.health" {server, healthy, source} and "backend.registered" {server, weight, source}.
+        # Events are published with no lock held : a SYNC subscriber may read the stats of the load balancer.
+        self.events = events
+        self._stop_event = threading.Event()
         self.start_load_balancer()
 
     def start_load_balancer(self):
         # create a new load balancer : IPV4 , TCP socket conenction
         try:
             self.lb_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if self.reuse_port:
+                self.lb_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             self.lb_socket.bind((self.ip,self.port))
             self.lb_socket.listen()
+            # port 0 means "any free port", keep the real one
+            self.port = self.lb_socket.getsockname()[1]
 
-            print(f"Load Balancer listening on {self.ip}:{self.port}")
+            logger.info("Load Balancer listening on %s:%s (%s mode)", self.ip, self.port, self.mode)
 
-            # start thread : to accept connections 
-            threading.Thread(target=self.accept_clients).start()
+            if self.mode == "async":
+                # start thread : event loop which accepts and serves every connection
+                from async_engine import AsyncProxyEngine
+                self.async_engine = AsyncProxyEngine(self)
+                threading.Thread(target=self.async_engine.run).start()
+            else:
+                # start thread : to accept connections 
+                threading.Thread(target=self.accept_clients).start()
 
             # start thread : heartbeat monitoring
             threading.Thread(target=self.heartbeat_monitoring).start()
 
+            if self.admin_port is not None:
+                from admin import AdminServer
+                self.admin_server = AdminServer(self, self.ip, self.admin_port).start()
+                self.admin_port = self.admin_server.port
+                logger.info("Admin endpoint on %s:%s (/metrics, /stats, /register)", self.ip, self.admin_port)
+
+            if self.push_port is not None:
+                from push import PushListener
+                self.push_listener = PushListener(self, self.ip, self.push_port, **self.push_options).start()
+                self.push_port = self.push_listener.port
+                logger.info("PUSH heartbeats on %s:%s", self.ip, self.push_port)
+
         except Exception as e:
-            print("Exception occured :"+str(e))
+            logger.error("Exception occured : %s", e)
+
+    def make_health_checker(self, health_options):
+        # overridden by the multi process workers which do not own the health checks
+        return HealthChecker(self.check_health, self.set_backend_health, on_flipped=self.backend_health_flipped,
+                             **health_options)
+
+    def stop(self):
+        # stop accepting connections and stop heartbeat monitoring
+        self._stop_event.set()
+        self.health.stop()
+        if self.async_engine is not None:
+            self.async_engine.stop()
+        else:
+            # shutdown wakes up the thread blocked in accept()
+            try:
+                self.lb_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.lb_socket.close()
+        if self.admin_server is not None:
+            self.admin_server.stop()
+        if self.push_listener is not None:
+            self.push_listener.stop()
+        self.pool.close()
+        self.health_pool.close()
+
+    def pool_stats(self) -> dict:
+        # hits / misses / open connections per backend, both serving modes added together
+        stats = self.pool.stats()
+        if self.async_engine is not None:
+            for backend, async_stats in self.async_engine.pool.stats().items():
+                merged = stats.setdefault(backend, {"hits": 0, "misses": 0, "open": 0, "idle": 0})
+                for key, value in async_stats.items():
+                    merged[key] += value
+        return stats
+
+    def evict_backend_connections(self, server_addr):
+        # backend is dead : do not keep connections to it around
+        self.pool.evict(server_addr)
+        self.health_pool.evict(server_addr)
+        if self.async_engine is not None:
+            self.async_engine.evict(server_addr)
 
     def accept_clients(self):
         try:
-            while True:
+            while not self._stop_event.is_set():
                 # accept the incoming connections 
                 # multithreaded as we can handle multiple connections request from different sources 
                 # no need to wait for connection to finish first. another thread will receive and parse the incoming data 
                 # from server or client app 
                 client_socket, client_address = self.lb_socket.accept()
-                print(f"Accepted connection from {client_address}")
+                logger.debug("Accepted connection from %s", client_address)
+                if self.admission is not None:
+                    # over the rate / concurrency limit : answered right here, no thread is started
+                    rejection = self.admission.admit(client_address[0])
+                    if rejection is not None:
+                        reject(client_socket, rejection)
+                        continue
                 # start : request handler 
                 threading.Thread(target=self.handle_client, args=(client_socket,)).start()
         except Exception as e:
-            print("Exception occured :"+str(e))
+            if not self._stop_event.is_set():
+                logger.error("Exception occured : %s", e)
 
     def handle_client(self,client_socket):
+        try:
+            self.process_request(client_socket)
+        except HTTPParseError as e:
+            logger.info("Malformed request : %s", e)
+            self.send_error(client_socket, 400, "Malformed request")
+        except Exception as e:
+            logger.warning("Exception occured while handling request : %s", e)
+            self.send_error(client_socket, 502, "Backend server failed")
+        finally:
+            # one request per connection, the client waits for the close to know the response is complete
+            client_socket.close()
+            if self.admission is not None:
+                self.admission.release()
+
+    def send_error(self, client_socket, status, message):
+        try:
+            client_socket.sendall(build_json_response(status, {"message": message}))
+        except OSError:
+            pass
+
+    def process_request(self,client_socket):
         # handle the incoming request 
-        # parse the request do some modifications
-        request = client_socket.recv(1024).decode('utf-8')
-        request_lines = request.split('\r\n')
-        
-        # Find the start of the body
-        body_start = request_lines.index('') + 1
-        
-        # Join the body lines to get the JSON payload
-        json_payload = '\r\n'.join(request_lines[body_start:])
-        
-        print(f"Received request: {request}")
-        
-        # parse it to json 
+        # one buffer per connection, reused for the request and the response whatever the payload size
+        buffer = bytearray(BUFFER_SIZE)
+        head, start, end = recv_head(client_socket, buffer, "request")
+        framer = BodyFramer.for_request(head)
+        logger.debug("Received request: %s %s", head.method, head.target)
+
+        body = None
+        json_data = None
+        read_body_whole, decode_json = self.classify(head, framer)
+        if read_body_whole:
+            body = read_body(client_socket, framer, buffer, start, end)
+            if decode_json:
+                json_data = parse_json_body(body)
+
+        cache_key = self.cache.key_for(head, framer, body) if self.cache is not None else None
+        flight = None
+        if cache_key is not None:
+            entry, flight, leader = self.cache.acquire(cache_key)
+            if entry is None and flight is not None and not leader:
+                # the same request is already on its way to a backend : wait for its response
+                entry = flight.wait(self.cache.coalesce_timeout)
+                if entry is not None:
+                    self.cache.served_from_flight(entry)
+                flight = cache_key = None
+            if entry is not None:
+                client_socket.sendall(entry.data)
+                return
+
         try:
-            json_data = json.loads(json_payload)
-        except json.JSONDecodeError:
-            print("Invalid JSON format")
-
-        # check server request 
-        # Check if it's a registration request
-        if self.is_registration_request(json_data):
-            """
-            {
-                server_ip: "127.0.0.1",
-                server_port: 3000,
-                request_type : "Register",
-                data:{
-                    isAlive:False/True
-                }
-            }
-            """
-            server_ip = json_data['server_ip']
-            server_port = json_data['server_port']
-            isAlive = json_data['isAlive']
-            # register server 
-            self.register_server(server_ip,server_port,isAlive)
-        else:
-            print("Choosing appropriate server...")
             # Choose a server based on the load balancing algorithm
-            server = self.choose_server(self.algorithm)
+            route = RouteContext(head, client_socket.getpeername()[0], json_data)
+            server = self.admit(self.choose_server(self.algorithm, route))
             # Send the request to the selected server
-            print(f"Server assigned: {server}")
+            logger.debug("Server assigned: %s", server)
             if server:
-                # suppose there is a signup request from the client side
-                # Modify the URL based on the server IP and port
-                server_url = f"http://{server}/signup"
-
-                # Send the request to the server
-                headers = {'Content-Type': 'application/json'}
-                response = requests.post(server_url, data=json_payload,headers=headers)
-                print(f"Received response from server: {response.text}")
+                self.forward_request(server, client_socket, head, framer, body, buffer, start, end, cache_key)
+            else:
+                client_socket.sendall(build_json_response(503, {"message": "No backend server available"}))
+        finally:
+            if flight is not None:
+                self.cache.complete(cache_key, flight)
+
+    def classify(self, head, framer):
+        # fast path : decided from the method, path and headers only, returns (read the body whole, decode it).
+        # proxied bodies are opaque bytes, streamed (or spliced) to the backend untouched. A small body is read
+        # first only when something needs it : a cacheable method (cache key), an idempotent method (retries /
+        # hedging send it again), an algorithm which reads_json (the only case where it is decoded)
+        if not is_small_body(framer):
+            return False, False
+        decode = self.balancers[self.algorithm].reads_json and is_json(head)
+        cacheable = self.cache is not None and head.method in self.cache.methods
+        return decode or cacheable or is_idempotent(head), decode
+
+    def forward_request(self, server, client_socket, head, framer, body, buffer, start, end, cache_key=None):
+        # relay the request to the server over a pooled keep-alive connection, then relay the response back.
+        # bodies are streamed through `buffer` (or spliced) with their original framing, never buffered whole.
+        # with a cache_key, a cacheable response is also recorded (never spliced) and stored in the cache.
+        # idempotent requests whose body we have are retried on another backend / hedged (see resilience.py).
+        request_head = head.serialize(forwarding_headers(client_socket.getpeername()[0]))
+        # a request can be sent again as long as its body was not streamed yet
+        if body is None and framer.done:
+            body = b""
+        retryable = body is not None and is_idempotent(head)
+        self.resilience.budget.deposit()
+        pipe = open_splice_pipe(framer) if body is None else None
+        tried = []
+        try:
+            while True:
+                tried.append(server)
+                try:
+                    if retryable and self.resilience.hedge:
+                        server, conn, response_head, start, end, latency = self.hedged_exchange(
+                            server, tried, request_head, body, buffer)
+                    else:
+                        conn, response_head, start, end, latency = self.exchange(
+                            server, client_socket, request_head, framer, body, buffer, start, end, pipe)
+                except (OSError, HTTPParseError) as e:
+                    retry = self.retry_target(tried) if retryable else None
+                    if retry is None:
+                        raise
+                    logger.debug("%s failed (%s), retrying on %s", server, e, retry)
+                    server = retry
+                    continue
+                self.health.report_success(server)
+                if response_head.status in RETRYABLE_STATUSES and retryable:
+                    retry = self.retry_target(tried)
+                    if retry is not None:
+                        # nothing was sent to the client yet : drop this response and ask another backend
+                        logger.debug("%s answered %s, retrying on %s", server, response_head.status, retry)
+                        self.pool.release(server, conn, reusable=False)
+                        self.finish_attempt(server, False, latency)
+                        server = retry
+                        continue
+                break
+
+            logger.debug("Received response from server: %s %s", response_head.status, response_head.reason)
+            response_framer = BodyFramer.for_response(response_head, head.method)
+            reusable = False
+            recorder = None
+            if cache_key is not None:
+                recorder = self.cache.recorder_for(response_head, client_socket, cache_key)
+            try:
                 # Forward the response back to the client
-                client_socket.send(response.text.encode('utf-8'))
+                if recorder is not None:
+                    recorder.sendall(response_head.serialize(CLIENT_RESPONSE_HEADERS))
+                    clean = relay_body(conn, recorder, response_framer, buffer, start, end)
+                    if response_framer.done:
+                        self.cache.store(cache_key, recorder)
+                else:
+                    client_socket.sendall(response_head.serialize(CLIENT_RESPONSE_HEADERS))
+                    pipe = pipe or open_splice_pipe(response_framer)
+                    clean = relay_body(conn, client_socket, response_framer, buffer, start, end, pipe)
+                reusable = clean and response_head.keep_alive and response_framer.mode != BodyFramer.UNTIL_CLOSE
+            except Exception as e:
+                # the response is already on its way, the client only sees the connection closing
+                logger.warning("Relaying response from %s failed : %s", server, e)
+            finally:
+                self.pool.release(server, conn, reusable)
+                self.finish_attempt(server, response_head.status < 500, latency)
+        finally:
+            if pipe is not None:
+                pipe.close()
+
+    def exchange(self, server, client_socket, request_head, framer, body, buffer, start, end, pipe=None):
+        # one attempt on one backend : send the request, receive the response head.
+        # returns (conn, response_head, start, end, latency), the caller relays the body, releases the connection
+        # and calls finish_attempt
+        started = self.begin_attempt(server)
+        for attempt in range(2):
+            try:
+                conn, reused = self.pool.acquire(server)
+            except OSError as e:
+                # refused / unreachable
+                self.attempt_failed(server, started, e)
+                raise
+            try:
+                send_request(conn, client_socket, request_head, framer, body, buffer, start, end, pipe)
+                response_head, start, end = recv_head(conn, buffer, "response")
+            except BaseException as e:
+                self.pool.release(server, conn, reusable=False)
+                # stale keep-alive connection : the backend closed it while it was idle
+                if isinstance(e, ConnectionError) and reused and body is not None and attempt == 0:
+                    continue
+                self.attempt_failed(server, started, e)
+                raise
+            return conn, response_head, start, end, time.monotonic() - started
 
+    def hedged_exchange(self, server, tried, request_head, body, buffer):
+        # exchange() sending the request to a second backend when the response head of the first one is later
+        # than its usual p95 : whichever answers first is kept, the other connection is dropped.
+        # returns (backend which answered, conn, response_head, start, end, latency)
+        delay = self.resilience.hedge_delay(self.tracker, server)
+        if delay is None:
+            return (server,) + self.exchange(server, None, request_head, None, body, buffer, 0, 0)
+        attempts = [self.open_attempt(server, request_head, body)]
+        if not wait_readable([attempts[0][1]], delay):
+            hedge = self.retry_target(tried)
+            if hedge is not None:
+                tried.append(hedge)
+                self.resilience.hedged()
+                try:
+                    attempts.append(self.open_attempt(hedge, request_head, body))
+                except OSError as e:
+                    logger.debug("hedged request to %s failed : %s", hedge, e)
+        ready = wait_readable([conn for _, conn, _ in attempts], self.pool.timeout)
+        # the backends which answered first, then the others (their recv_head waits for the socket timeout)
+        attempts.sort(key=lambda attempt: attempt[1].fileno() not in ready)
+        error = None
+        for index, (backend, conn, started) in enumerate(attempts):
+            try:
+                response_head, start, end = recv_head(conn, buffer, "response")
+            except (OSError, HTTPParseError) as e:
+                self.pool.release(backend, conn, reusable=False)
+                self.attempt_failed(backend, started, e)
+                error = e
+                continue
+            for loser, loser_conn, _ in attempts[index + 1:]:
+                # too late : its response is dropped along with the connection
+                self.pool.release(loser, loser_conn, reusable=False)
+                self.attempt_abandoned(loser)
+            if backend != server:
+                self.resilience.hedged(won=True)
+            return backend, conn, response_head, start, end, time.monotonic() - started
+        raise error
+
+    def open_attempt(self, server, request_head, body):
+        # first half of exchange() for the hedged path : returns (server, conn, started) once the request is sent
+        started = self.begin_attempt(server)
+        try:
+            conn, _ = self.pool.acquire(server)
+        except OSError as e:
+            self.attempt_failed(server, started, e)
+            raise
+        try:
+            send_request(conn, None, request_head, None, body, None, 0, 0)
+        except BaseException as e:
+            self.pool.release(server, conn, reusable=False)
+            self.attempt_failed(server, started, e)
+            raise
+        return server, conn, started
+
+    def begin_attempt(self, server):
+        self.tracker.begin(server)
+        return time.monotonic()
+
+    def attempt_failed(self, server, started, error):
+        # connection errors / timeouts are passive health signals, every failure counts for the breaker
+        if isinstance(error, OSError):
+            self.health.report_failure(server)
+        self.finish_attempt(server, False, time.monotonic() - started)
+
+    def attempt_abandoned(self, server):
+        # attempt given up without an outcome (hedge which lost, cancelled) : not a failure, but the half-open
+        # trial its breaker let through must be given back
+        self.tracker.end(server, None, True)
+        self.resilience.breakers.release(server)
+
+    def finish_attempt(self, server, ok, latency):
+        # upstream latency : until the response head, body transfer time depends on the payload size
+        self.tracker.end(server, latency if ok else None, ok)
+        self.resilience.breakers.record(server, ok, latency)
+        if self.admission is not None:
+            # the adaptive concurrency limit follows the upstream latency
+            self.admission.observe(latency if ok else None, ok)
+
+    def retry_target(self, tried):
+        # another backend for a retry / hedge : None when the request used its retries, no other backend is
+        # routable or the retry budget is spent
+        if len(tried) > self.resilience.max_retries:
+            return None
+        candidates = [backend for backend in self.healthy_backends if backend not in tried]
+        if not candidates:
+            return None
+        breakers = self.resilience.breakers
+        # the algorithm knows best (least loaded ...), it just must not pick a backend already tried
+        choice = self.choose_server(self.algorithm)
+        if choice not in candidates or not breakers.allow(choice):
+            # any other candidate its breaker lets through (closed, or a half-open trial left)
+            random.shuffle(candidates)
+            choice = next((backend for backend in candidates if breakers.allow(backend)), None)
+        if choice is None:
+            return None
+        if not self.resilience.budget.withdraw():
+            breakers.release(choice)
+            return None
+        return choice
+
+    def admit(self, server):
+        # half-open breakers let a few trial requests through, the others go to a backend with a closed breaker
+        if server is None or self.resilience.breakers.allow(server):
+            return server
+        closed = [backend for backend in self.healthy_backends if self.resilience.breakers.closed(backend)]
+        return random.choice(closed) if closed else None
 
     def heartbeat_monitoring(self):
         # PULL ---> heartbeat monitoring
         # regularly checks whether the server is alive or died. 
         # heartbeat messages should be only sent to registered servers 
-        # server list will always have registered servers
-        while True:
-            with self.server_lock:
-                print("checking health of servers from server list ......")
-                for server_addr ,server_obj in self.servers.items():
-                    heartbeat_payload = {}
-                    heartbeat_payload["server_address"] = server_addr
-                    heartbeat_payload["request_type"] = "heartbeat"
-                    heartbeat_payload["data"] = {}
-                    hearbeat_url = f"http://{server_addr}/heartbeat"
-                    response = requests.post(hearbeat_url,data=heartbeat_payload)
-                    
-                    # Accessing JSON content from the response
-                    json_response = response.json()
-
-                    if response.status_code == 200 :
-    
-                        # check for healthy or not
-                        if json_response["data"].get("isAlive") == 0:
-                            # means not alive remove from server list
-                            print(f"server is not alive . Making {server_addr} inactive from server list...")
-                            self.servers[server_addr]["isAlive"] = json_response["data"].get("isAlive")
-                            print(f"{server_addr} is inactive.")
-                        else:
-                            print(f"{server_addr} is alive.")
-                            self.servers[server_addr]["isAlive"] = json_response["data"].get("isAlive")
-                    else:
-                        # cannot send request to server 
-                        # server is not started or crashed or not found or any connection error 
-                        print("invalid response from server: " + str(response))
-                    
-                print("Server List : " + str(self.servers))
-            # delay
-            threading.Event().wait(5)
+        # probes are scheduled per server by HealthChecker (see health.py) : they run concurrently, time out,
+        # and a server only flips after `rise` / `fall` consecutive results. set_backend_health applies the flips.
+        self.health.run(self._stop_event)
+
+    def set_backend_health(self, server_addr, healthy):
+        # called by the health checker when a server goes down / comes back
+        with self.server_lock:
+            server_obj = self.servers.get(server_addr)
+            if server_obj is None:
+                return
+            server_obj["isAlive"] = 1 if healthy else 0
+            logger.info("Server List : %s", self.servers)
+        if healthy:
+            logger.info("%s is alive.", server_addr)
+        else:
+            logger.warning("server is not alive . Making %s inactive from server list...", server_addr)
+            self.evict_backend_connections(server_addr)
+        self.refresh_backends()
+
+    def backend_health_flipped(self, server_addr, healthy):
+        # after set_backend_health, with the health checker lock released : a SYNC subscriber may be slow or read
+        # health_stats() without stalling the checker / the request threads reporting failures
+        if server_addr in self.servers:
+            self.publish_event("backend.health", {"server": server_addr, "healthy": healthy, "source": "pull"})
+
+    def publish_event(self, topic, event):
+        if self.events is not None:
+            self.events.publish(topic, event)
+
+    def apply_push_batch(self, frames, gone):
+        # PUSH heartbeats (push.py) : latest status frame per backend since the last batch, and the backends which
+        # stopped reporting. One pass over the registry, at most one new routing snapshot for the whole batch.
+        registered, down, up = [], [], []
+        changed = False
+        with self.server_lock:
+            for server_address, frame in frames.items():
+                isAlive = 1 if frame.get("alive", 1) else 0
+                weight = frame.get("weight")
+                server_obj = self.servers.get(server_address)
+                if server_obj is None or not server_obj.get("isPushed"):
+                    # first frame : registers the backend, which from now on is not polled
+                    server_obj = self.servers.setdefault(server_address, {"isRegistered": 1, "isAlive": isAlive, "weight": 1})
+                    server_obj["isPushed"] = 1
+                    registered.append(server_address)
+                    changed = True
+                if server_obj["isAlive"] != isAlive:
+                    server_obj["isAlive"] = isAlive
+                    changed = True
+                    (up if isAlive else down).append(server_address)
+                if weight is not None and server_obj["weight"] != weight:
+                    server_obj["weight"] = weight
+                    changed = True
+            for server_address in gone:
+                server_obj = self.servers.get(server_address)
+                if server_obj is not None and server_obj["isAlive"]:
+                    server_obj["isAlive"] = 0
+                    down.append(server_address)
+                    changed = True
+        for server_address in registered:
+            self.health.remove(server_address)
+            logger.info("Registered %s (PUSH)", server_address)
+        for server_address, frame in frames.items():
+            if "inflight" in frame or "load" in frame:
+                self.tracker.report(server_address, frame.get("inflight"), frame.get("load"))
+        for server_address in gone:
+            # stale load reports must not keep steering traffic
+            self.tracker.report(server_address, 0, 0.0)
+        for server_address in down:
+            logger.warning("%s stopped reporting / reported itself down (PUSH)", server_address)
+            self.evict_backend_connections(server_address)
+        if changed:
+            self.refresh_backends()
+        if self.events is not None:
+            for server_address in registered:
+                self.events.publish("backend.registered", {"server": server_address,
+                                                           "weight": frames[server_address].get("weight", 1),
+                                                           "source": "push"})
+            for server_address in up:
+                self.events.publish("backend.health", {"server": server_address, "healthy": True, "source": "push"})
+            for server_address in down:
+                self.events.publish("backend.health", {"server": server_address, "healthy": False, "source": "push"})
+
+    def check_health(self, server_addr) -> bool:
+        # one heartbeat probe, True when the server answered and reported itself alive
+        heartbeat_payload = {}
+        heartbeat_payload["server_address"] = server_addr
+        heartbeat_payload["request_type"] = "heartbeat"
+        heartbeat_payload["data"] = {}
+        try:
+            # the health pool socket timeout bounds the probe
+            response = self.health_pool.request(
+                server_addr, "POST", "/heartbeat",
+                body=json.dumps(heartbeat_payload), headers={'Content-Type': 'application/json'},
+            )
+        except (OSError, HTTPParseError) as e:
+            # server is not started or crashed : connection error
+            logger.warning("heartbeat to %s failed : %s", server_addr, e)
+            self.health_pool.evict(server_addr)
+            return False
+
+        if response.status_code != 200:
+            # cannot send request to server 
+            # server is not started or crashed or not found or any connection error 
+            logger.warning("invalid response from server %s: %s", server_addr, response.status_code)
+            return False
+
+        # Accessing JSON content from the response
+        try:
+            isAlive = response.json()["data"].get("isAlive")
+        except (ValueError, KeyError, AttributeError):
+            logger.warning("invalid heartbeat payload from %s", server_addr)
+            return False
+        # check for healthy or not
+        return bool(isAlive)
 
     # choosing server 
-    def choose_server(self,algorithm)->str:
-        # implement load balancing algorithm 
-        if(algorithm == "RoundRobin"):
-            return self.round_robin()
+    def choose_server(self,algorithm,request=None)->str:
+        # load balancing algorithms live in algorithms.py, see BalancingAlgorithmFactory.
+        # no lock here : algorithms read the last published snapshot of healthy backends
+        balancer = self.balancers.get(algorithm)
+        if balancer is None:
+            balancer = self.algorithm_factory.get_algorithm(algorithm, self.tracker)
+            with self._refresh_lock:
+                balancer.update(*self._published)
+                self.balancers[algorithm] = balancer
+        return balancer.choose(request)
+
+    def refresh_backends(self):
+        # healthy set or weights changed : publish a new immutable snapshot to every algorithm.
+        # snapshots are tuples swapped with a single assignment, readers never see a half built list.
+        with self._refresh_lock:
+            with self.server_lock:
+                # backends with an open circuit breaker are left out until it goes half-open
+                alive = tuple(
+                    addr for addr, server_obj in self.servers.items()
+                    if server_obj["isAlive"] and self.resilience.breakers.routable(addr)
+                )
+                weights = {addr: server_obj.get("weight", 1) for addr, server_obj in self.servers.items()}
+            if (alive, weights) == self._published:
+                return
+            self._published = (alive, weights)
+            self.tracker.update(alive)
+            for balancer in list(self.balancers.values()):
+                balancer.update(alive, weights)
+            self.healthy_backends = alive
+
+    def backend_stats(self) -> dict:
+        # in-flight requests, EWMA latency, request and error counts per backend
+        return self.tracker.stats()
+
+    def health_stats(self) -> dict:
+        # healthy flag, success / failure streaks and backoff per backend
+        return self.health.stats()
+
+    def cache_stats(self) -> dict:
+        # hit ratio, bytes saved ... of the response cache, empty when it is disabled
+        return self.cache.stats() if self.cache is not None else {}
+
+    def resilience_stats(self) -> dict:
+        # circuit breaker states, retry budget, hedged requests
+        return self.resilience.stats()
+
+    def push_stats(self) -> dict:
+        # PUSH connections, reporting backends, frames and batches, empty when PUSH heartbeats are off
+        return self.push_listener.stats() if self.push_listener is not None else {}
+
+    def admission_stats(self) -> dict:
+        # admitted / rejected connections, current concurrency limit, empty when admission control is off
+        return self.admission.stats() if self.admission is not None else {}
     
     # register server 
-    def register_server(self, server_ip, server_port,isAlive):
+    def register_server(self, server_ip, server_port,isAlive,weight=1):
+        server_address = f"{server_ip}:{server_port}"
         with self.server_lock:
-            try:
-                server_address = f"{server_ip}:{server_port}"
-                server_obj = {
-                    "isRegistered":1,
-                    "isAlive":isAlive
-                }
-                self.servers[server_address] = server_obj
-            
-                # Notify the server about successful registration
-                server_url = f"http://{server_address}/registration-response"
-                register_response = {
-                    "statuscode": 200,
-                    "message": "Successfully registered with load balancer",
-                    "data": {
-                        "isRegistered": self.servers[server_address]["isRegistered"],
-                    }
-                }
-                # Send the response back to the server
-                res = requests.post(server_url, json=register_response)
-            except Exception as e:
-                print("Exception occured : " + str(e))
+            server_obj = {
+                "isRegistered":1,
+                "isAlive":isAlive,
+                "weight":weight,
+            }
+            self.servers[server_address] = server_obj
+        logger.info("Registered %s (isAlive %s, weight %s)", server_address, isAlive, weight)
+        self.health.add(server_address, bool(isAlive))
+        self.refresh_backends()
+        self.publish_event("backend.registered", {"server": server_address, "weight": weight, "source": "admin"})
 
-    # check registeration request 
-    def is_registration_request(self,register_data)->bool:
-        # check payload 
-        rStatus = False 
         try:
-            if register_data is not None:
-                if register_data.get("request_type") is not None and register_data.get("request_type") == "Register":
-                    # request type is registeration 
-                    rStatus = True
+            # Notify the server about successful registration
+            register_response = {
+                "statuscode": 200,
+                "message": "Successfully registered with load balancer",
+                "data": {
+                    "isRegistered": server_obj["isRegistered"],
+                }
+            }
+            # Send the response back to the server
+            res = self.pool.request(
+                server_address, "POST", "/registration-response",
+                body=json.dumps(register_response), headers={'Content-Type': 'application/json'},
+            )
         except Exception as e:
-            print(f"Error occured while parsing request : " + str(e))
-        return rStatus
+            logger.error("Exception occured : %s", e)
 
-    # round_robin 
-    def round_robin(self)->str:
-        with self.server_lock:
-            servers = list(self.servers.keys())
-            if not servers:
-                return None
-            # Round Robin selection
-            selected_server = servers[self.round_robin_index]
-            # to keep index in bound or rotate the index
-            self.round_robin_index = (self.round_robin_index + 1) % len(servers)
-            return selected_server
-        
-
-# start load balancer at port : 5000
-loadbalancer = LoadBalancer("localhost",5001,"RoundRobin")
+# start load balancer at port : 5001, backends register on the admin port : POST localhost:5002/register
+if __name__ == "__main__":
+    loadbalancer = LoadBalancer("localhost",5001,"RoundRobin",admin_port=5002)
@@ -0,0 +1,78 @@
+"""
+Leveled, buffered, asynchronous logging for the load balancer.
+
+A synchronous print per request (accepted / received / assigned / response) costs a write syscall and holds the
+stdout lock on the hot path. Here request threads / the event loop only put the record on a bounded queue
+(QueueHandler), a single QueueListener thread formats and writes them. Per-request messages are DEBUG, so with
+the default INFO level they are dropped before any formatting happens.
+
+When the queue is full (stdout slower than the traffic) records are dropped instead of blocking the proxy,
+`dropped` counts them.
+
+Level : LB_LOG_LEVEL environment variable (DEBUG, INFO, WARNING ...), INFO by default.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s : %(message)s"
+QUEUE_SIZE = 10000
+
+_listener = None
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler which drops records on a full queue instead of raising / blocking."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure(level=None, stream=None, queue_size=QUEUE_SIZE):
+    """(re)configure the "lb" logger tree, called once on first use of get_logger."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    root = logging.getLogger("lb")
+    root.setLevel(level or os.environ.get("LB_LOG_LEVEL", "INFO").upper())
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    log_queue = queue.Queue(queue_size)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    return root
+
+
+def get_logger(name) -> logging.Logger:
+    if _listener is None:
+        configure()
+    return logging.getLogger(f"lb.{name}")
+
+
+def dropped() -> int:
+    # records lost because the queue was full
+    return sum(getattr(handler, "dropped", 0) for handler in logging.getLogger("lb").handlers)
+
+
+def _flush():
+    # write what is still queued when the process exits
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_flush)
@@ -0,0 +1,180 @@
+"""
+Hot path metrics of the load balancer.
+
+Everything is preallocated and updated in place : a counter is an int attribute, a latency histogram is a fixed
+list of bucket counts indexed with bisect. Recording a request is a few integer increments done under the
+LoadTracker lock the proxy path already takes, nothing is allocated per request.
+
+render_prometheus(lb) turns the live counters into the Prometheus text exposition format (version 0.0.4),
+served on the admin listener at /metrics (see admin.py).
+"""
+
+import bisect
+import socket
+import struct
+
+from log import dropped as log_dropped
+from resilience import CLOSED, HALF_OPEN, OPEN
+
+# upper bounds (seconds) of the upstream latency histogram buckets, +Inf is implicit
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+# lb_circuit_breaker_state value is the index
+BREAKER_STATES = (CLOSED, HALF_OPEN, OPEN)
+
+# struct tcp_info (linux/tcp.h) : 8 one-byte fields, then u32 rto, ato, snd_mss, rcv_mss, unacked, sacked.
+# On a listening socket tcpi_unacked is the current accept queue length and tcpi_sacked its maximum (backlog).
+TCP_INFO_HEAD = struct.Struct("8B6I")
+
+
+class LatencyHistogram:
+    """Fixed bucket histogram, percentiles are the upper bound of the bucket they fall in."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, pct) -> float:
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+    def cumulative(self):
+        # (upper bound, cumulative count) pairs of the exposition format
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+def accept_queue_depth(sock):
+    """returns (connections waiting in the accept queue, queue size) of a listening socket, (None, None) if unknown"""
+    if not hasattr(socket, "TCP_INFO"):
+        return None, None
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, TCP_INFO_HEAD.size)
+    except OSError:
+        return None, None
+    fields = TCP_INFO_HEAD.unpack(info[:TCP_INFO_HEAD.size])
+    return fields[12], fields[13]
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def render_prometheus(lb) -> str:
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{labels} {value}")
+
+    with lb.server_lock:
+        servers = {addr: dict(server_obj) for addr, server_obj in lb.servers.items()}
+    backends = lb.tracker.stats(histograms=True)
+    health = lb.health_stats()
+    pool = lb.pool_stats()
+
+    metric("lb_backend_up", "gauge", "1 when the backend is routable",
+           [(_labels(backend=addr), 1 if server_obj["isAlive"] else 0) for addr, server_obj in servers.items()])
+    metric("lb_backend_requests_total", "counter", "requests forwarded to the backend",
+           [(_labels(backend=addr), stats["requests"]) for addr, stats in backends.items()])
+    metric("lb_backend_errors_total", "counter", "forwarded requests which failed or got a 5xx",
+           [(_labels(backend=addr), stats["errors"]) for addr, stats in backends.items()])
+    metric("lb_backend_inflight", "gauge", "requests currently forwarded to the backend",
+           [(_labels(backend=addr), stats["inflight"]) for addr, stats in backends.items()])
+
+    lines.append("# HELP lb_backend_upstream_latency_seconds time until the backend response head")
+    lines.append("# TYPE lb_backend_upstream_latency_seconds histogram")
+    for addr, stats in backends.items():
+        histogram = stats["latency"]
+        for bound, total in histogram.cumulative():
+            lines.append(f"lb_backend_upstream_latency_seconds_bucket{_labels(backend=addr, le=_format_bound(bound))} {total}")
+        lines.append(f"lb_backend_upstream_latency_seconds_sum{_labels(backend=addr)} {histogram.sum}")
+        lines.append(f"lb_backend_upstream_latency_seconds_count{_labels(backend=addr)} {histogram.count}")
+
+    metric("lb_heartbeat_probes_total", "counter", "active health probes by result",
+           [(_labels(backend=addr, result=result), state[f"probes_{result}"])
+            for addr, state in health.items() for result in ("ok", "failed")])
+    metric("lb_passive_failures_total", "counter", "connection failures / timeouts seen by the proxy path",
+           [(_labels(backend=addr), state["passive_failures"]) for addr, state in health.items()])
+
+    metric("lb_pool_connections_total", "counter", "backend connections taken from the pool, by outcome",
+           [(_labels(backend=addr, outcome=outcome), stats[key])
+            for addr, stats in pool.items() for outcome, key in (("reused", "hits"), ("opened", "misses"))])
+    metric("lb_pool_open_connections", "gauge", "open backend connections",
+           [(_labels(backend=addr), stats["open"]) for addr, stats in pool.items()])
+
+    cache = lb.cache_stats()
+    if cache:
+        metric("lb_cache_requests_total", "counter", "cacheable requests by outcome",
+               [(_labels(outcome=outcome), cache[key]) for outcome, key in (
+                   ("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced"))])
+        metric("lb_cache_hit_ratio", "gauge", "hits + coalesced hits over cacheable requests",
+               [("", cache["hit_ratio"])])
+        metric("lb_cache_bytes_saved_total", "counter", "response bytes served without calling a backend",
+               [("", cache["bytes_saved"])])
+        metric("lb_cache_bytes", "gauge", "size of the cached responses", [("", cache["bytes"])])
+        metric("lb_cache_evictions_total", "counter", "entries evicted by the LRU", [("", cache["evictions"])])
+
+    resilience = lb.resilience_stats()
+    metric("lb_circuit_breaker_state", "gauge", "0 closed, 1 half-open, 2 open",
+           [(_labels(backend=addr), BREAKER_STATES.index(breaker["state"]))
+            for addr, breaker in resilience["breakers"].items()])
+    metric("lb_circuit_breaker_trips_total", "counter", "times the circuit breaker opened",
+           [(_labels(backend=addr), breaker["trips"]) for addr, breaker in resilience["breakers"].items()])
+    metric("lb_retries_total", "counter", "requests sent again to another backend (retries and hedges)",
+           [("", resilience["retry_budget"]["retries"])])
+    metric("lb_retry_budget_exhausted_total", "counter", "retries / hedges refused by the retry budget",
+           [("", resilience["retry_budget"]["exhausted"])])
+    metric("lb_hedged_requests_total", "counter", "hedged requests sent", [("", resilience["hedges"])])
+    metric("lb_hedge_wins_total", "counter", "hedged requests which answered first", [("", resilience["hedge_wins"])])
+
+    admission = lb.admission_stats()
+    if admission:
+        metric("lb_admission_rejected_total", "counter", "connections rejected by admission control, by reason",
+               [(_labels(reason=reason), count) for reason, count in admission["rejected"].items()])
+        metric("lb_admission_admitted_total", "counter", "connections admitted", [("", admission["admitted"])])
+        if "limit" in admission:
+            metric("lb_concurrency_limit", "gauge", "current (adaptive) concurrency limit", [("", admission["limit"])])
+            metric("lb_concurrency_inflight", "gauge", "connections being served", [("", admission["inflight"])])
+
+    push = lb.push_stats()
+    if push:
+        metric("lb_push_connections", "gauge", "open PUSH heartbeat connections", [("", push["connections"])])
+        metric("lb_push_frames_total", "counter", "PUSH status frames received", [("", push["frames"])])
+        metric("lb_push_batches_total", "counter", "PUSH batches applied to the registry", [("", push["batches"])])
+    metric("lb_backend_reported_inflight", "gauge", "in-flight requests reported by the backend (PUSH)",
+           [(_labels(backend=addr), stats["reported_inflight"]) for addr, stats in backends.items()])
+
+    depth, backlog = accept_queue_depth(lb.lb_socket)
+    if depth is not None:
+        metric("lb_accept_queue_depth", "gauge", "connections waiting to be accepted", [("", depth)])
+        metric("lb_accept_queue_size", "gauge", "accept queue capacity (listen backlog)", [("", backlog)])
+    metric("lb_log_records_dropped_total", "counter", "log records dropped on a full log queue",
+           [("", log_dropped())])
+    lines.append("")
+    return "\n".join(lines)
@@ -0,0 +1,301 @@
+"""
+Multi process load balancer.
+
+One CPython process parses and forwards on a single core (GIL). Here N worker processes each run a
+LoadBalancer bound to the same port with SO_REUSEPORT, the kernel spreads incoming connections over them.
+
+Backend registry and health are shared through a fixed size table in shared memory (SharedBackendTable) :
+    - registration : whatever worker receives it writes the row, bumps its registration counter and the
+                     table version.
+    - health       : worker 0 is the health owner, it is the only one running HealthChecker and writes the
+                     up / down flips into the table. The other workers report their passive failures
+                     (connection refused / timeouts) by bumping the `suspect` counter of the row, the owner
+                     turns that into HealthChecker.report_failure.
+    - sync         : every worker polls the table version every `sync_interval` (0.5s by default, well under
+                     the 5s heartbeat interval) and reloads the rows when it changed, so a registration is
+                     visible to every worker within one heartbeat interval.
+
+usage : python multiworker.py  (LoadBalancer on localhost:5001 with one worker per CPU, registration on 5002)
+"""
+
+import multiprocessing
+import os
+import socket
+import struct
+import threading
+from multiprocessing import shared_memory
+
+from loadbalancer import LoadBalancer
+from log import get_logger
+
+logger = get_logger("multiworker")
+
+# version of the table, number of rows
+HEADER = struct.Struct("<QI4x")
+# "ip:port", isAlive, weight, suspect counter, registration counter
+ROW = struct.Struct("<64sBdII")
+MAX_BACKENDS = 1024
+
+
+class SharedBackendTable:
+    """
+    Backend registry in shared memory. Rows are only appended (servers are never unregistered), writers hold
+    `lock` (a multiprocessing.Lock shared by all workers), readers check the version first and only take the
+    lock to copy the rows when it moved.
+    """
+
+    def __init__(self, lock, name=None, capacity=MAX_BACKENDS):
+        self.lock = lock
+        self.capacity = capacity
+        size = HEADER.size + ROW.size * capacity
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.shm.buf[:size] = bytes(size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        self._index = {}  # address -> row number, cache of this process
+
+    def version(self) -> int:
+        return HEADER.unpack_from(self.buf, 0)[0]
+
+    def _bump(self, count):
+        version, _ = HEADER.unpack_from(self.buf, 0)
+        HEADER.pack_into(self.buf, 0, version + 1, count)
+
+    def _find(self, address):
+        # with the lock held
+        row = self._index.get(address)
+        if row is not None:
+            return row
+        _, count = HEADER.unpack_from(self.buf, 0)
+        encoded = address.encode('utf-8')
+        for row in range(count):
+            if ROW.unpack_from(self.buf, HEADER.size + row * ROW.size)[0].rstrip(b"\0") == encoded:
+                self._index[address] = row
+                return row
+        return None
+
+    def upsert(self, address, isAlive, weight=1):
+        with self.lock:
+            _, count = HEADER.unpack_from(self.buf, 0)
+            row = self._find(address)
+            suspect = registrations = 0
+            if row is None:
+                if count == self.capacity:
+                    raise ValueError(f"shared backend table is full ({self.capacity} backends)")
+                row = count
+                count += 1
+                self._index[address] = row
+            else:
+                _, _, _, suspect, registrations = ROW.unpack_from(self.buf, HEADER.size + row * ROW.size)
+            ROW.pack_into(self.buf, HEADER.size + row * ROW.size, address.encode('utf-8'), 1 if isAlive else 0,
+                          float(weight), suspect, (registrations + 1) & 0xFFFFFFFF)
+            self._bump(count)
+
+    def set_alive(self, address, isAlive):
+        with self.lock:
+            row = self._find(address)
+            if row is None:
+                return
+            offset = HEADER.size + row * ROW.size
+            encoded, _, weight, suspect, registrations = ROW.unpack_from(self.buf, offset)
+            ROW.pack_into(self.buf, offset, encoded, 1 if isAlive else 0, weight, suspect, registrations)
+            self._bump(HEADER.unpack_from(self.buf, 0)[1])
+
+    def suspect(self, address):
+        with self.lock:
+            row = self._find(address)
+            if row is None:
+                return
+            offset = HEADER.size + row * ROW.size
+            encoded, alive, weight, suspect, registrations = ROW.unpack_from(self.buf, offset)
+            ROW.pack_into(self.buf, offset, encoded, alive, weight, (suspect + 1) & 0xFFFFFFFF, registrations)
+            self._bump(HEADER.unpack_from(self.buf, 0)[1])
+
+    def rows(self):
+        """returns (version, [(address, isAlive, weight, suspect, registrations)])"""
+        with self.lock:
+            version, count = HEADER.unpack_from(self.buf, 0)
+            rows = []
+            for row in range(count):
+                encoded, alive, weight, suspect, registrations = ROW.unpack_from(self.buf, HEADER.size + row * ROW.size)
+                weight = int(weight) if weight.is_integer() else weight
+                rows.append((encoded.rstrip(b"\0").decode('utf-8'), alive, weight, suspect, registrations))
+            return version, rows
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class SharedHealthReporter:
+    """Health facade of the workers which do not own the health checks : passive failures go to the table."""
+
+    def __init__(self, table, timeout):
+        self.table = table
+        self.timeout = timeout
+
+    def add(self, server_addr, healthy=True):
+        pass
+
+    def remove(self, server_addr):
+        # PUSH backends are not probed, nothing to stop here
+        pass
+
+    def report_failure(self, server_addr):
+        self.table.suspect(server_addr)
+
+    def report_success(self, server_addr):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+    def stop(self):
+        pass
+
+
+class WorkerLoadBalancer(LoadBalancer):
+
+    def __init__(self, table, worker_id, ip, port, algorithm="random", sync_interval=0.5, **options):
+        self.table = table
+        self.worker_id = worker_id
+        self.health_owner = worker_id == 0
+        self.sync_interval = sync_interval
+        self._seen_version = -1
+        self._seen_suspects = {}
+        self._seen_registrations = {}
+        super().__init__(ip, port, algorithm, reuse_port=True, **options)
+
+    def make_health_checker(self, health_options):
+        if self.health_owner:
+            return super().make_health_checker(health_options)
+        return SharedHealthReporter(self.table, health_options.get("timeout", 2.0))
+
+    def heartbeat_monitoring(self):
+        # the owner runs the health checks, every worker keeps its registry in sync with the table
+        if self.health_owner:
+            threading.Thread(target=self.health.run, args=(self._stop_event,)).start()
+        while not self._stop_event.is_set():
+            try:
+                self.sync_from_table()
+            except Exception as e:
+                logger.error("[worker %s] sync with the backend table failed : %s", self.worker_id, e)
+            self._stop_event.wait(self.sync_interval)
+
+    def sync_from_table(self):
+        if self.table.version() == self._seen_version:
+            return
+        version, rows = self.table.rows()
+        registered = []
+        suspects = []
+        with self.server_lock:
+            for address, isAlive, weight, suspect, registrations in rows:
+                server_obj = self.servers.setdefault(address, {"isRegistered": 1, "isAlive": isAlive, "weight": weight})
+                server_obj["weight"] = weight
+                if registrations != self._seen_registrations.get(address):
+                    # (re)registered, possibly through another worker : trust what the backend said
+                    self._seen_registrations[address] = registrations
+                    server_obj["isAlive"] = isAlive
+                    registered.append((address, isAlive))
+                elif not self.health_owner:
+                    # flips come from the owner, which keeps its own state authoritative
+                    server_obj["isAlive"] = isAlive
+                if suspect != self._seen_suspects.get(address, 0):
+                    self._seen_suspects[address] = suspect
+                    suspects.append(address)
+        self._seen_version = version
+        if self.health_owner:
+            for address, isAlive in registered:
+                self.health.add(address, bool(isAlive))
+            for address in suspects:
+                self.health.report_failure(address)
+        self.refresh_backends()
+
+    def register_server(self, server_ip, server_port, isAlive, weight=1):
+        # the table first : the other workers pick it up on their next sync
+        self.table.upsert(f"{server_ip}:{server_port}", isAlive, weight)
+        super().register_server(server_ip, server_port, isAlive, weight)
+
+    def set_backend_health(self, server_addr, healthy):
+        # health owner only : publish the flip to every worker
+        self.table.set_alive(server_addr, healthy)
+        super().set_backend_health(server_addr, healthy)
+
+
+def _worker_main(table_name, lock, worker_id, ip, port, algorithm, options, stop_event):
+    table = SharedBackendTable(lock, name=table_name)
+    lb = WorkerLoadBalancer(table, worker_id, ip, port, algorithm, **options)
+    logger.info("[worker %s] pid %s serving on %s:%s", worker_id, os.getpid(), ip, lb.port)
+    stop_event.wait()
+    lb.stop()
+    table.close()
+
+
+class MultiProcessLoadBalancer:
+
+    def __init__(self, ip, port, algorithm="random", workers=None, **options):
+        # options are the LoadBalancer keyword arguments (mode, pool_size, health_options ...)
+        self.ip = ip
+        self.algorithm = algorithm
+        self.options = options
+        self.workers = workers or os.cpu_count() or 1
+        # spawn : the parent may already run threads (benchmarks), forking them is unsafe
+        self.context = multiprocessing.get_context("spawn")
+        self.table = SharedBackendTable(self.context.Lock())
+        self._stop_event = self.context.Event()
+        # resolve port 0 once so that every worker binds the same port, keep the socket till stop()
+        self._port_sockets = []
+        self.port = self._reserve_port(ip, port)
+        # the admin port (/register, /metrics) is shared the same way, registering through any worker is enough
+        self.admin_port = options.get("admin_port")
+        if self.admin_port is not None:
+            self.admin_port = options["admin_port"] = self._reserve_port(ip, self.admin_port)
+        self.processes = []
+
+    def _reserve_port(self, ip, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((ip, port))
+        self._port_sockets.append(sock)
+        return sock.getsockname()[1]
+
+    def start(self):
+        for worker_id in range(self.workers):
+            process = self.context.Process(
+                target=_worker_main,
+                args=(self.table.name, self.table.lock, worker_id, self.ip, self.port, self.algorithm,
+                      self.options, self._stop_event),
+            )
+            process.start()
+            self.processes.append(process)
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        for process in self.processes:
+            process.join(10)
+            if process.is_alive():
+                process.terminate()
+        for sock in self._port_sockets:
+            sock.close()
+        self.table.close()
+        self.table.unlink()
+
+    def servers(self) -> dict:
+        # registry as seen by the table
+        _, rows = self.table.rows()
+        return {address: {"isRegistered": 1, "isAlive": isAlive, "weight": weight}
+                for address, isAlive, weight, _, _ in rows}
+
+
+# start load balancer at port : 5001 with one worker per CPU
+if __name__ == "__main__":
+    loadbalancer = MultiProcessLoadBalancer("localhost", 5001, "RoundRobin", admin_port=5002).start()
+    for process in loadbalancer.processes:
+        process.join()
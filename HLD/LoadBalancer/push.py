@@ -0,0 +1,283 @@
+"""
+PUSH heartbeat model : backends report their own status over a persistent connection instead of being polled.
+
+    protocol : newline delimited JSON on `push_port`, one status frame per line :
+                   {"server": "127.0.0.1:3000", "alive": 1, "load": 0.35, "inflight": 12, "weight": 1}
+               alive / load / inflight / weight are optional. A connection may carry the frames of any number
+               of backends (an agent reporting for a whole host). Frames flow one way, nothing is answered.
+               A frame from an unknown server registers it : no register POST and /registration-response
+               round trip, no per backend HTTP probe every interval. A frame with a field of the wrong type or
+               out of range (parse_frame) is dropped whole and counted in invalid_frames.
+    batching : frames are parsed as they arrive, the last one of each backend is kept, and the batch is applied
+               every `batch_interval` seconds with one registry update (LoadBalancer.apply_push_batch) and at
+               most one new routing snapshot, whatever the number of frames.
+    liveness : a backend silent for `dead_after` seconds, or whose connection closed, is marked down. Pushed
+               backends are left out of the PULL health checks (which keep running for the others).
+    load     : inflight / load are live load signals for the dynamic algorithms (LoadTracker.report) : another
+               load balancer's traffic, or a backend busy with background work, is seen right away.
+
+usage : LoadBalancer(..., push_port=5003), then from the backend PushReporter(("lb", 5003), "ip:port").start()
+        (server1.js / server2.js : LB_PUSH_PORT=5003 node server1.js)
+The listener belongs to one load balancer process, multi process mode (multiworker.py) keeps PULL heartbeats.
+"""
+
+import json
+import math
+import selectors
+import socket
+import threading
+import time
+
+from log import get_logger
+
+logger = get_logger("push")
+
+# a frame line longer than this closes the connection
+MAX_FRAME_SIZE = 4096
+RECV_SIZE = 64 * 1024
+# weights above this are refused : a backend owns vnodes * weight points of the ConsistentHash ring
+MAX_WEIGHT = 1000
+
+
+def encode_frame(server, alive=1, load=None, inflight=None, weight=None) -> bytes:
+    frame = {"server": server, "alive": alive}
+    if load is not None:
+        frame["load"] = load
+    if inflight is not None:
+        frame["inflight"] = inflight
+    if weight is not None:
+        frame["weight"] = weight
+    return json.dumps(frame, separators=(",", ":")).encode('utf-8') + b"\n"
+
+
+def _number(value, minimum, maximum=None):
+    # finite JSON number (not a bool) within [minimum, maximum], ValueError otherwise
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"expected a number, got {value!r}")
+    if not math.isfinite(value) or value < minimum or (maximum is not None and value > maximum):
+        raise ValueError(f"{value!r} out of range")
+    return value
+
+
+def check_alive(alive) -> int:
+    # 0 / 1 (or a bool), ValueError otherwise
+    if alive not in (0, 1) or not isinstance(alive, (bool, int)):
+        raise ValueError(f"bad alive {alive!r}")
+    return int(alive)
+
+
+def check_weight(weight):
+    # number in (0, MAX_WEIGHT], ValueError otherwise : a weight is a number of ring points / smooth wrr credits
+    weight = _number(weight, 0, MAX_WEIGHT)
+    if weight == 0:
+        raise ValueError("weight must be positive")
+    return weight
+
+
+def parse_frame(line) -> dict:
+    """
+    One frame line -> frame with checked, coerced fields : server (non empty str), alive (0 / 1), weight (number
+    in (0, MAX_WEIGHT]), inflight (int >= 0), load (number >= 0). Raises ValueError for anything else, the
+    frame must not reach the registry (a string weight breaks every later routing update).
+    """
+    frame = json.loads(line)
+    if not isinstance(frame, dict):
+        raise ValueError("a frame is a JSON object")
+    server = frame.get("server")
+    if not isinstance(server, str) or not server:
+        raise ValueError(f"bad server {server!r}")
+    checked = {"server": server}
+    if "alive" in frame:
+        checked["alive"] = check_alive(frame["alive"])
+    if "weight" in frame:
+        checked["weight"] = check_weight(frame["weight"])
+    if "inflight" in frame:
+        checked["inflight"] = int(_number(frame["inflight"], 0))
+    if "load" in frame:
+        checked["load"] = float(_number(frame["load"], 0))
+    return checked
+
+
+class PushConnection:
+
+    __slots__ = ("sock", "pending", "servers")
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.pending = b""     # incomplete last line
+        self.servers = set()   # backends reported over this connection
+
+
+class PushListener:
+    """One thread : accepts the backend connections, reads frames, applies them in batches."""
+
+    def __init__(self, lb, ip, port, batch_interval=0.05, dead_after=3.0):
+        self.lb = lb
+        self.batch_interval = batch_interval
+        self.dead_after = dead_after
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((ip, port))
+        self.sock.listen()
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.sock, selectors.EVENT_READ)
+        self._batch = {}       # server -> latest frame since the last flush
+        self._gone = set()     # servers whose connection closed since the last flush
+        self._last_seen = {}   # server -> time of its last frame
+        self._owner = {}       # server -> PushConnection its last frame came from
+        self._stop = threading.Event()
+        self._thread = None
+        # totals, for stats
+        self.connections = 0
+        self.frames = 0
+        self.batches = 0
+        self.invalid_frames = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="push", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for key in list(self._selector.get_map().values()):
+            key.fileobj.close()
+        self._selector.close()
+
+    def run(self):
+        next_flush = time.monotonic() + self.batch_interval
+        while not self._stop.is_set():
+            for key, _ in self._selector.select(max(0.0, next_flush - time.monotonic())):
+                if key.fileobj is self.sock:
+                    self._accept()
+                else:
+                    self._read(key.data)
+            now = time.monotonic()
+            if now >= next_flush:
+                self._flush(now)
+                next_flush = now + self.batch_interval
+
+    def _accept(self):
+        try:
+            conn, address = self.sock.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        self._selector.register(conn, selectors.EVENT_READ, PushConnection(conn))
+        self.connections += 1
+        logger.info("push connection from %s", address)
+
+    def _read(self, connection):
+        try:
+            data = connection.sock.recv(RECV_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._close(connection)
+            return
+        lines = (connection.pending + data).split(b"\n")
+        connection.pending = lines.pop()
+        if len(connection.pending) > MAX_FRAME_SIZE:
+            logger.warning("push frame too large, closing the connection")
+            self._close(connection)
+            return
+        for line in lines:
+            if line.strip():
+                self._frame(connection, line)
+
+    def _frame(self, connection, line):
+        try:
+            # bad JSON, wrong types or out of range fields : the whole frame is dropped
+            frame = parse_frame(line)
+        except ValueError:
+            self.invalid_frames += 1
+            return
+        server = frame["server"]
+        self.frames += 1
+        connection.servers.add(server)
+        self._owner[server] = connection
+        self._last_seen[server] = time.monotonic()
+        self._gone.discard(server)
+        # fields missing from this frame keep the value of an earlier frame of the batch
+        previous = self._batch.get(server)
+        self._batch[server] = {**previous, **frame} if previous else frame
+
+    def _close(self, connection):
+        self._selector.unregister(connection.sock)
+        connection.sock.close()
+        self.connections -= 1
+        for server in connection.servers:
+            # a backend which reconnected already reports over its new connection
+            if self._owner.get(server) is connection:
+                del self._owner[server]
+                self._batch.pop(server, None)
+                self._last_seen.pop(server, None)
+                self._gone.add(server)
+
+    def _flush(self, now):
+        expired = [server for server, seen in self._last_seen.items() if now - seen > self.dead_after]
+        for server in expired:
+            del self._last_seen[server]
+            self._owner.pop(server, None)
+            self._gone.add(server)
+        if not self._batch and not self._gone:
+            return
+        batch, gone = self._batch, self._gone
+        self._batch, self._gone = {}, set()
+        self.batches += 1
+        try:
+            self.lb.apply_push_batch(batch, gone)
+        except Exception as e:
+            logger.error("applying push batch failed : %s", e)
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "backends": len(self._last_seen),
+            "frames": self.frames,
+            "batches": self.batches,
+            "invalid_frames": self.invalid_frames,
+        }
+
+
+class PushReporter:
+    """
+    Backend side of the protocol : a thread sending the status of `server` every `interval` seconds,
+    reconnecting when the load balancer goes away. status() returns the keyword arguments of encode_frame
+    (alive, load, inflight, weight).
+    """
+
+    def __init__(self, lb_address, server, status=None, interval=1.0):
+        self.lb_address = lb_address
+        self.server = server
+        self.status = status or (lambda: {"alive": 1})
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="push-reporter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                with socket.create_connection(self.lb_address, timeout=self.interval) as sock:
+                    while not self._stop.is_set():
+                        sock.sendall(encode_frame(self.server, **self.status()))
+                        self._stop.wait(self.interval)
+            except OSError as e:
+                logger.debug("push to %s failed : %s", self.lb_address, e)
+                self._stop.wait(self.interval)
@@ -0,0 +1,155 @@
+"""
+Blocking socket relay used by the threaded serving mode and the connection pool.
+
+Bodies are never materialized : bytes are received into one preallocated buffer per connection and
+sent from memoryview slices of it, so memory per connection stays the same whatever the payload size.
+Large Content-Length bodies / big chunks are moved with os.splice (socket -> pipe -> socket) on Linux,
+the bytes never reach user space at all.
+"""
+
+import os
+import select
+import socket
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+from httputil import MAX_HEAD_SIZE, BodyFramer, HTTPParseError, IncompleteMessage, find_head_end, parse_head
+
+BUFFER_SIZE = 64 * 1024
+# below this many bytes the two extra syscalls of splice are not worth it
+SPLICE_THRESHOLD = 64 * 1024
+PIPE_SIZE = 1024 * 1024
+HAVE_SPLICE = hasattr(os, "splice")
+
+
+def open_splice_pipe(framer):
+    # only large bodies are worth a kernel pipe
+    if HAVE_SPLICE and (framer.mode == BodyFramer.CHUNKED or framer.bulk_remaining >= SPLICE_THRESHOLD):
+        return SplicePipe()
+    return None
+
+
+def recv_head(sock, buffer, kind="request"):
+    """
+    Receive a message head into buffer.
+    returns (head, start, end) : buffer[start:end] holds the body bytes received along with the head.
+    """
+    view = memoryview(buffer)
+    filled = 0
+    while True:
+        if filled >= MAX_HEAD_SIZE or filled == len(buffer):
+            raise HTTPParseError("Head too large")
+        n = sock.recv_into(view[filled:MAX_HEAD_SIZE])
+        if n == 0:
+            raise IncompleteMessage("connection closed before the end of the head")
+        head_end = find_head_end(buffer, filled + n, filled)
+        filled += n
+        if head_end >= 0:
+            return parse_head(bytes(view[:head_end]), kind), head_end, filled
+
+
+def relay_body(src, dst, framer, buffer, start, end, pipe=None) -> bool:
+    """
+    Relay one body from src to dst, buffer[start:end] being body bytes already received.
+    returns False when src sent bytes past the end of the body (connection can not be reused).
+    """
+    view = memoryview(buffer)
+    while True:
+        if start < end:
+            stop = framer.consume(buffer, start, end)
+            dst.sendall(view[start:stop])
+            if framer.done:
+                return stop == end
+        if framer.done:
+            return True
+        bulk = framer.bulk_remaining
+        if pipe is not None and bulk >= SPLICE_THRESHOLD:
+            moved = pipe.splice(src, dst, bulk)
+            if moved == 0:
+                framer.finish()
+                return True
+            framer.skip(moved)
+            start = end = 0
+            continue
+        n = src.recv_into(buffer)
+        if n == 0:
+            framer.finish()
+            return True
+        start, end = 0, n
+
+
+class _BufferSink:
+    # stands for the destination socket when a body has to be kept
+    def __init__(self):
+        self.data = bytearray()
+
+    def sendall(self, data):
+        self.data += data
+
+
+def read_body(src, framer, buffer, start, end) -> bytes:
+    """Read a (small) body completely, used for registration / heartbeat payloads."""
+    sink = _BufferSink()
+    relay_body(src, sink, framer, buffer, start, end)
+    return bytes(sink.data)
+
+
+def send_request(conn, client_socket, request_head, framer, body, buffer, start, end, pipe=None):
+    """Send a request to a backend : head, then the body we already have or the one still coming from the client."""
+    conn.sendall(request_head)
+    if body is not None:
+        if body:
+            conn.sendall(body)
+    else:
+        relay_body(client_socket, conn, framer, buffer, start, end, pipe)
+
+
+def wait_readable(socks, timeout):
+    """file descriptors of the sockets with something to read (or closed) within timeout seconds"""
+    poller = select.poll()
+    for sock in socks:
+        poller.register(sock, select.POLLIN)
+    return [fd for fd, _ in poller.poll(timeout * 1000)]
+
+
+class SplicePipe:
+    """
+    Kernel pipe used as the intermediate buffer of os.splice.
+    Created lazily by the handler the first time a large body shows up.
+    """
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        if hasattr(fcntl, 'F_SETPIPE_SZ'):
+            try:
+                fcntl.fcntl(self.write_fd, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+            except OSError:
+                pass
+
+    def splice(self, src, dst, count) -> int:
+        """move up to count bytes src -> dst, returns 0 on end of stream."""
+        moved = _retry(src, False, os.splice, src.fileno(), self.write_fd, min(count, PIPE_SIZE))
+        left = moved
+        while left:
+            left -= _retry(dst, True, os.splice, self.read_fd, dst.fileno(), left)
+        return moved
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+def _retry(sock, for_write, func, *args):
+    # sockets with a timeout are non blocking at the fd level : wait for readiness like sock.recv does
+    timeout = sock.gettimeout()
+    while True:
+        try:
+            return func(*args)
+        except BlockingIOError:
+            poller = select.poll()
+            poller.register(sock, select.POLLOUT if for_write else select.POLLIN)
+            if not poller.poll(None if timeout is None else timeout * 1000):
+                raise socket.timeout("timed out")
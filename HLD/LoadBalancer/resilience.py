@@ -0,0 +1,300 @@
+"""
+Resilience of the forwarding path : circuit breakers, retries with a budget, hedged requests.
+
+Circuit breakers (one per backend) :
+    closed    : requests flow, outcomes go into a sliding window of the last `window` requests. When it holds at
+                least `min_requests` and the error rate reaches `error_threshold` (or the rate of calls slower
+                than `slow_call_duration` reaches `slow_call_threshold`) the breaker opens.
+    open      : the backend is taken out of the routing snapshot for `open_timeout` seconds (doubled every time
+                it opens again in a row, up to `max_open_timeout`), clients get another backend or a fast 503
+                instead of waiting on a sick one.
+    half-open : up to `half_open_requests` trial requests go through. All succeed -> closed, one fails -> open.
+
+Retries : an idempotent request (GET / HEAD / OPTIONS / PUT / DELETE) whose body we still have is sent again to
+a *different* backend when the first one fails before a response was relayed (connection error, timeout,
+502 / 503 / 504). At most `max_retries` per request, and retries as a whole are capped by a RetryBudget (a
+fraction of the recent traffic), so retries can not multiply the load on an already struggling fleet.
+
+Hedging : optional. When the response head of an idempotent request has not arrived after the backend's p95
+latency, the same request is sent to another backend and the first response wins, the other is dropped.
+Hedges are paid from the retry budget too.
+"""
+
+import threading
+import time
+from collections import deque
+
+from log import get_logger
+
+logger = get_logger("resilience")
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE")
+# statuses meaning "this backend could not serve it", worth trying another one
+RETRYABLE_STATUSES = (502, 503, 504)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+def is_idempotent(head) -> bool:
+    return head.method in IDEMPOTENT_METHODS
+
+
+class CircuitBreaker:
+
+    def __init__(self, window=20, min_requests=10, error_threshold=0.5, slow_call_duration=2.0,
+                 slow_call_threshold=0.8, open_timeout=5.0, max_open_timeout=60.0, half_open_requests=3):
+        self.window = window
+        self.min_requests = min_requests
+        self.error_threshold = error_threshold
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_threshold = slow_call_threshold
+        self.open_timeout = open_timeout
+        self.max_open_timeout = max_open_timeout
+        self.half_open_requests = half_open_requests
+        self.state = CLOSED
+        self.opened = 0            # times opened in a row, drives the open timeout
+        self.trips = 0             # total, for stats
+        self._outcomes = deque()   # (failed, slow) of the last `window` requests
+        self._errors = 0
+        self._slow = 0
+        self._trials = 0           # half-open requests let through
+        self._trial_successes = 0
+        self._open_until = 0.0
+
+    def allow(self, now) -> bool:
+        # with the registry lock held
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if now < self._open_until:
+                return False
+            self._half_open()
+        if self._trials < self.half_open_requests:
+            self._trials += 1
+            return True
+        return False
+
+    def release(self):
+        # a trial request let through by allow() was abandoned without an outcome (hedge which lost ...) : give the
+        # slot back, otherwise the breaker stays half-open with no trial left. with the registry lock held
+        if self.state == HALF_OPEN and self._trials > self._trial_successes:
+            self._trials -= 1
+
+    def record(self, ok, latency, now) -> bool:
+        # one outcome, returns True when the state changed. with the registry lock held
+        failed = not ok
+        slow = latency is not None and self.slow_call_duration is not None and latency > self.slow_call_duration
+        if self.state == HALF_OPEN:
+            if failed:
+                self._open(now)
+                return True
+            self._trial_successes += 1
+            if self._trial_successes >= self.half_open_requests:
+                self._close()
+                return True
+            return False
+        if self.state == OPEN:
+            # late outcome of a request sent before the breaker opened
+            return False
+        self._outcomes.append((failed, slow))
+        self._errors += failed
+        self._slow += slow
+        if len(self._outcomes) > self.window:
+            old_failed, old_slow = self._outcomes.popleft()
+            self._errors -= old_failed
+            self._slow -= old_slow
+        count = len(self._outcomes)
+        if count >= self.min_requests and (
+            self._errors / count >= self.error_threshold or self._slow / count >= self.slow_call_threshold
+        ):
+            self._open(now)
+            return True
+        return False
+
+    def open_remaining(self, now) -> float:
+        return max(0.0, self._open_until - now) if self.state == OPEN else 0.0
+
+    def _open(self, now):
+        self.state = OPEN
+        self.trips += 1
+        self._open_until = now + min(self.open_timeout * 2 ** self.opened, self.max_open_timeout)
+        self.opened += 1
+
+    def _half_open(self):
+        self.state = HALF_OPEN
+        self._trials = 0
+        self._trial_successes = 0
+
+    def _close(self):
+        self.state = CLOSED
+        self.opened = 0
+        self._outcomes.clear()
+        self._errors = self._slow = 0
+
+    def as_dict(self):
+        return {"state": self.state, "trips": self.trips, "window_errors": self._errors, "window_slow": self._slow}
+
+
+class CircuitBreakers:
+    """
+    Breakers of every backend. on_change() is called (without any lock held) when a breaker opens or closes,
+    the load balancer then republishes its routing snapshot without the open backends. Open breakers move to
+    half-open on a timer so that the backend comes back in the snapshot for its trial requests.
+    """
+
+    def __init__(self, on_change, **options):
+        self.on_change = on_change
+        self.options = options
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def _breaker(self, backend):
+        breaker = self._breakers.get(backend)
+        if breaker is None:
+            breaker = self._breakers[backend] = CircuitBreaker(**self.options)
+        return breaker
+
+    def routable(self, backend) -> bool:
+        # open breakers are left out of the routing snapshot
+        breaker = self._breakers.get(backend)
+        return breaker is None or breaker.state != OPEN
+
+    def closed(self, backend) -> bool:
+        breaker = self._breakers.get(backend)
+        return breaker is None or breaker.state == CLOSED
+
+    def allow(self, backend) -> bool:
+        # half-open breakers only let `half_open_requests` trial requests through
+        breaker = self._breakers.get(backend)
+        if breaker is None or breaker.state == CLOSED:
+            return True
+        with self._lock:
+            return breaker.allow(time.monotonic())
+
+    def release(self, backend):
+        # the request allowed to `backend` was abandoned : no outcome, its half-open trial slot is given back
+        breaker = self._breakers.get(backend)
+        if breaker is None or breaker.state != HALF_OPEN:
+            return
+        with self._lock:
+            breaker.release()
+
+    def record(self, backend, ok, latency=None):
+        now = time.monotonic()
+        with self._lock:
+            breaker = self._breaker(backend)
+            changed = breaker.record(ok, latency, now)
+            state = breaker.state
+            reopen_in = breaker.open_remaining(now)
+        if not changed:
+            return
+        logger.warning("circuit breaker of %s is %s", backend, state)
+        if state == OPEN:
+            timer = threading.Timer(reopen_in, self._reopen, args=(backend,))
+            timer.daemon = True
+            timer.start()
+        self.on_change()
+
+    def _reopen(self, backend):
+        # open timeout elapsed : half-open, the backend gets its trial requests
+        with self._lock:
+            breaker = self._breakers.get(backend)
+            if breaker is None or breaker.state != OPEN or not breaker.allow(time.monotonic()):
+                return
+            # allow() took one trial slot, give it back : trials are counted on real requests
+            breaker.release()
+        logger.info("circuit breaker of %s is %s", backend, HALF_OPEN)
+        self.on_change()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {backend: breaker.as_dict() for backend, breaker in self._breakers.items()}
+
+
+class RetryBudget:
+    """
+    Retries (and hedges) allowed : `ratio` of the requests seen, plus `min_per_second` so that low traffic can
+    still retry. Tokens are capped to what `window` seconds of traffic would give : `min_per_second` tokens per
+    second, or `ratio` of `expected_rate` requests per second when that is more. The cap is fixed, a long run of
+    requests never banks more retries than one window's worth.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=5.0, window=10.0, expected_rate=0.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._cap = max(min_per_second * window, ratio * expected_rate * window)
+        self._tokens = min_per_second * window
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.exhausted = 0
+
+    def deposit(self):
+        # one request
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self._cap)
+
+    def withdraw(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._tokens = min(self._cap, self._tokens + (now - self._last) * self.min_per_second)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.retries += 1
+                return True
+            self.exhausted += 1
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tokens": self._tokens, "retries": self.retries, "exhausted": self.exhausted}
+
+
+class ResiliencePolicy:
+    """
+    What the load balancer needs on its forwarding path, configured with LoadBalancer(resilience_options=...) :
+        max_retries        : other backends tried for one idempotent request (hedges included), 0 disables retries
+        hedge              : send a hedged request when the response head is later than the backend's
+                             `hedge_percentile` latency (needs `hedge_min_samples` latencies, at least
+                             `hedge_min_delay` seconds)
+        breaker            : CircuitBreaker options, e.g. {"error_threshold": 0.3, "open_timeout": 2.0}
+        retry_budget       : RetryBudget options, e.g. {"ratio": 0.1, "expected_rate": 500}
+    """
+
+    def __init__(self, on_change, max_retries=1, hedge=False, hedge_percentile=95, hedge_min_samples=20,
+                 hedge_min_delay=0.002, breaker=None, retry_budget=None):
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.breakers = CircuitBreakers(on_change, **(breaker or {}))
+        self.budget = RetryBudget(**(retry_budget or {}))
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def hedge_delay(self, tracker, backend):
+        # seconds to wait for the response head before hedging, None : do not hedge
+        if not self.hedge or not self.max_retries:
+            return None
+        delay = tracker.percentile(backend, self.hedge_percentile, self.hedge_min_samples)
+        if delay is None or delay == float("inf"):
+            return None
+        return max(delay, self.hedge_min_delay)
+
+    def hedged(self, won=False):
+        with self._lock:
+            if won:
+                self.hedge_wins += 1
+            else:
+                self.hedges += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            hedges = {"hedges": self.hedges, "hedge_wins": self.hedge_wins}
+        return {"breakers": self.breakers.stats(), "retry_budget": self.budget.stats(), **hedges}
@@ -4,12 +4,34 @@ const bodyParser = require("body-parser");
 const ApiRoutes = require("./routes/index.js");
 
 const axios = require("axios");
+const net = require("net");
 const router = express.Router();
 
 const PORT = 3001;
 let isRegistered = 0;
 let isAlive = 0; // based on usecase we can change this parameter
 
+// requests being served, reported to the load balancer in PUSH mode
+let inflight = 0;
+
+// PUSH heartbeat : status frames (one JSON object per line) over one persistent connection, every second.
+// the first frame registers the server, the load balancer stops polling /heartbeat (see push.py)
+const startPushReporter = (pushPort) => {
+  const socket = net.connect(pushPort, "127.0.0.1");
+  const timer = setInterval(() => {
+    const frame = { server: `127.0.0.1:${PORT}`, alive: isAlive, inflight: inflight };
+    socket.write(JSON.stringify(frame) + "\n");
+  }, 1000);
+  socket.on("error", (err) => {
+    console.log("server2 push connection failed : " + err);
+  });
+  socket.on("close", () => {
+    // load balancer restarted : reconnect
+    clearInterval(timer);
+    setTimeout(() => startPushReporter(pushPort), 1000);
+  });
+};
+
 // heart beat
 const heartbeat = async (req, res) => {
   try {
@@ -59,6 +81,11 @@ const server_setup = async () => {
   // initations body parser
   app.use(bodyParser.json());
   app.use(bodyParser.urlencoded({ extended: true }));
+  app.use((req, res, next) => {
+    inflight++;
+    res.on("close", () => inflight--);
+    next();
+  });
 
   app.use("/", ApiRoutes);
   app.post("/heartbeat", heartbeat);
@@ -67,15 +94,20 @@ const server_setup = async () => {
   // start server1
   app.listen(PORT, async () => {
     console.log("Server 1 started on PORT", PORT);
+    if (process.env.LB_PUSH_PORT) {
+      // PUSH mode : no register request, the status frames register the server
+      startPushReporter(Number(process.env.LB_PUSH_PORT));
+      return;
+    }
     console.log("Registering server2 with load balancer....");
     try {
       const payload = {
         server_ip: "127.0.0.1",
         server_port: PORT,
-        request_type: "Register",
         isAlive: isAlive,
       };
-      await axios.post("http://127.0.0.1:5001", payload);
+      // registration goes to the admin port, the proxy port (5001) only carries client traffic
+      await axios.post("http://127.0.0.1:5002/register", payload);
     } catch (err) {
       console.log("Failed to register server2." + err);
     }
@@ -0,0 +1,188 @@
+"""
+Buffered, asynchronous request logging for BufferedLoggingMiddleware (chain_of_responsiblity.py)
+
+A print per request holds the stdout lock and makes a write syscall on the request thread. Here the request
+thread only appends a compact record (a tuple : time, then the configured request fields) to a RingBuffer, one
+background LogWriter thread drains it in batches, formats them as JSON lines and writes each batch with a single
+write() to stdout or to a rotating file.
+
+    ring buffer : collections.deque, append / popleft are atomic under the GIL, no lock on either side. Bounded
+                  to `capacity` records (the bound is checked without a lock, so it may be passed by a few
+                  records when many threads append at once).
+    overload    : the request thread never blocks. Past `sample_above` of the capacity only one record in
+                  `sample_every` is kept (policy "sample"), on a full buffer records are dropped. Dropped and
+                  sampled out counts are in stats(), and the writer logs a {"dropped": n} record when they grow.
+    rotation    : RotatingFileSink renames app.log -> app.log.1 -> ... once the file passes `max_bytes`,
+                  keeping `backup_count` old files.
+"""
+
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+DROP = "drop"
+SAMPLE = "sample"
+
+
+class RingBuffer:
+
+    def __init__(self, capacity=10000, policy=SAMPLE, sample_above=0.5, sample_every=10):
+        if policy not in (DROP, SAMPLE):
+            raise ValueError(f"Unknown overload policy {policy!r}, expected {DROP!r} or {SAMPLE!r}")
+        self.capacity = capacity
+        self.sample_from = int(capacity * sample_above) if policy == SAMPLE else capacity
+        self.sample_every = sample_every
+        self._records = deque()
+        self._counter = itertools.count()
+        self.dropped = 0
+        self.sampled_out = 0
+
+    def push(self, record) -> bool:
+        """append without blocking, False when the record was dropped / sampled out"""
+        size = len(self._records)
+        if size >= self.sample_from:
+            if size >= self.capacity:
+                self.dropped += 1
+                return False
+            if next(self._counter) % self.sample_every:
+                self.sampled_out += 1
+                return False
+        self._records.append(record)
+        return True
+
+    def drain(self, max_records):
+        records = []
+        popleft = self._records.popleft
+        try:
+            for _ in range(max_records):
+                records.append(popleft())
+        except IndexError:
+            pass
+        return records
+
+    def __len__(self):
+        return len(self._records)
+
+
+class StdoutSink:
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def write(self, data):
+        self.stream.write(data)
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class RotatingFileSink:
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotations = 0
+        self._file = open(path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def write(self, data):
+        if self._size and self._size + len(data) > self.max_bytes:
+            self.rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+
+    def rotate(self):
+        self._file.close()
+        # app.log.4 -> app.log.5 ... app.log -> app.log.1, the oldest one is overwritten
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._size = 0
+        self.rotations += 1
+
+    def close(self):
+        self._file.close()
+
+
+class LogWriter:
+    """Background thread : drains the buffer every `flush_interval` seconds (or sooner when a batch is full)."""
+
+    def __init__(self, buffer, sink=None, fields=(), batch_size=1000, flush_interval=0.2):
+        self.buffer = buffer
+        self.sink = sink or StdoutSink()
+        # names of the record values after the time, for the JSON lines
+        self.fields = ("time",) + tuple(fields)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._reported_losses = 0
+        self.written = 0
+        self.batches = 0
+        # batches which could not be formatted / written, and their records : the thread keeps running
+        self.errors = 0
+        self.failed = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="log-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """write what is still buffered, then close the sink"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        while self.flush() == self.batch_size:
+            pass
+        self.sink.close()
+
+    def run(self):
+        while not self._stop.is_set():
+            # a full batch is written right away, otherwise wait for more records
+            if self.flush() < self.batch_size:
+                self._stop.wait(self.flush_interval)
+
+    def flush(self) -> int:
+        records = self.buffer.drain(self.batch_size)
+        try:
+            # default=str : bytes, datetimes ... of a record are written as text instead of failing the batch
+            lines = [json.dumps(dict(zip(self.fields, record)), separators=(",", ":"), default=str)
+                     for record in records]
+            losses = self.buffer.dropped + self.buffer.sampled_out
+            if losses != self._reported_losses:
+                lines.append(json.dumps({"time": time.time(), "dropped": self.buffer.dropped,
+                                         "sampled_out": self.buffer.sampled_out}))
+                self._reported_losses = losses
+            if lines:
+                self.sink.write("\n".join(lines) + "\n")
+                self.written += len(records)
+                self.batches += 1
+        except Exception as e:
+            # one bad batch (full disk, circular record ...) must not kill the writer thread
+            self.errors += 1
+            self.failed += len(records)
+            print(f"log writer : batch of {len(records)} records lost : {e!r}", file=sys.stderr)
+        return len(records)
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self.buffer),
+            "written": self.written,
+            "batches": self.batches,
+            "errors": self.errors,
+            "failed": self.failed,
+            "dropped": self.buffer.dropped,
+            "sampled_out": self.buffer.sampled_out,
+            "rotations": getattr(self.sink, "rotations", 0),
+        }
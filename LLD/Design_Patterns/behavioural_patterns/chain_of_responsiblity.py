@@ -15,17 +15,52 @@ Types of Chain of Responsibility:
 - Bidirectional Chain: Handlers can traverse the chain in both forward and backward directions.
 - Hierarchical Chain: Requests can be passed down the hierarchy or propagated back up if necessary.
 - Dynamic Chain: The chain's composition can change dynamically during runtime, enabling on-the-fly adjustments to handle different types of requests.
+
+Compiled Chain (hot path, e.g. in front of a load balancer's proxy path):
+- a middleware returns the request (the same object, or a replacement) to pass it on, None to stop the chain.
+- Chain.compile() turns the middleware list into ONE generated function : straight line code with every bound
+  handle_request resolved once, so a request costs no list iteration and no attribute lookup per middleware.
+- async middlewares (async def handle_request) are awaited by Chain.compile_async(), sync ones are called inline.
+- Parallel(auth, validation) groups independent checks : awaited concurrently in an async chain (or submitted to an
+  executor in a sync one), the first one stopping the request cancels the others.
+- the chain is recompiled when a middleware is added (Dynamic Chain), never per request.
+- DataValidationMiddleware(schema) : request bodies checked by a validator compiled once from the schema
+  (schema_validation.py), validate_batch() for lists of requests.
+- BufferedLoggingMiddleware : structured records into a ring buffer, written in batches by a background thread
+  to stdout or a rotating file, sampled / dropped (and counted) under overload (buffered_logging.py).
+- CachedAuthenticationMiddleware : the slow credential check memoized per token (TTL, LRU, negative caching,
+  single flight, invalidation, hit / miss metrics), see AuthCache.
 """
 
 # suppose you want to your request to pass through multiple layer of middleware before reaching to service layer. example : you want to authenticate, log, validate, security check, etc. So here there is a chain of responsibilities. 
 
 # define handler interface
+import asyncio
+import inspect
+import os
+import tempfile
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import as_completed
+
+from buffered_logging import LogWriter, RingBuffer, RotatingFileSink
+from schema_validation import compile_batch, compile_schema, first_error
 
 # interface 
 class Middleware(ABC):
     @abstractmethod
     def handle_request(self, request):
+        """return the request to pass it to the next middleware, None to stop the chain."""
+        pass
+
+
+class AsyncMiddleware(Middleware):
+    """Middleware whose work waits on I/O (credential store, remote validation ...) : awaited, never blocks the loop."""
+
+    @abstractmethod
+    async def handle_request(self, request):
         pass
 
 
@@ -38,7 +73,7 @@ class AuthenticationMiddleware(Middleware):
         if self.authenticate(request):
             print("Authentication middleware: Authenticated successfully")
             # Pass the request to the next middleware or handler in the chain.
-            return True
+            return request
         else:
             print("Authentication middleware: Authentication failed")
             # Stop the chain if authentication fails.
@@ -57,11 +92,41 @@ class LoggingMiddleware(Middleware):
         """Handle request logging and pass to the next middleware in the chain."""
         print("Logging middleware: Logging request")
         # Further we can provide enhances logging functionalities 
-        return True
+        return request
+
+
+class BufferedLoggingMiddleware(LoggingMiddleware):
+    """
+    Logging off the request thread (buffered_logging.py) : the request only appends a compact record
+    (time, then the `fields` of the request) to a ring buffer, a LogWriter thread writes them in batches.
+    Never blocks : under overload records are sampled / dropped and counted.
+    """
+
+    def __init__(self, sink=None, fields=("method", "path", "user"), buffer=None, **writer_options):
+        self.fields = tuple(fields)
+        self.buffer = buffer or RingBuffer()
+        self.writer = LogWriter(self.buffer, sink, self.fields, **writer_options).start()
+
+    def handle_request(self, request):
+        get = request.get
+        self.buffer.push((time.time(), *[get(field) for field in self.fields]))
+        return request
+
+    def close(self):
+        self.writer.stop()
+
+    def stats(self) -> dict:
+        return self.writer.stats()
 
 
 class DataValidationMiddleware(Middleware):
     """Middleware responsible for data validation."""
+
+    def __init__(self, schema=None):
+        # rules of the request body as a schema (schema_validation.py), compiled once into a validator function
+        self.schema = schema
+        self._validate = compile_schema(schema) if schema is not None else None
+        self._validate_batch = compile_batch(schema, self._validate) if schema is not None else None
     
     def handle_request(self, request):
         """Handle data validation or pass to the next middleware in the chain."""
@@ -69,7 +134,7 @@ class DataValidationMiddleware(Middleware):
             print("Data Validation middleware: Data is valid")
             # Pass the request to the next middleware or handler in the chain.
             # return super().handle_request(request) --> we can also pass the request to  parent middleware
-            return True
+            return request
         else:
             print("Data Validation middleware: Invalid data")
             # Stop the chain if data validation fails.
@@ -78,29 +143,412 @@ class DataValidationMiddleware(Middleware):
     def validate_data(self, request):
         """Implement data validation logic here."""
         # Return True if valid data, else False
+        if self._validate is not None:
+            return self._validate(request)
         print("Data Validation middleware: validity successful")
         return True
 
+    def validate_batch(self, requests):
+        """validate a list of requests in one call : (valid requests, [(invalid request, first error)])"""
+        if self._validate_batch is None:
+            return list(requests), []
+        valid, invalid = [], []
+        for request, ok in zip(requests, self._validate_batch(requests)):
+            if ok:
+                valid.append(request)
+            else:
+                invalid.append((request, first_error(self.schema, request)))
+        return valid, invalid
+
+
+class SchemaValidationMiddleware(DataValidationMiddleware):
+    """Quiet DataValidationMiddleware for the hot path : the compiled validator and nothing else."""
+
+    def __init__(self, schema):
+        super().__init__(schema)
+
+    def handle_request(self, request):
+        return request if self._validate(request) else None
+
+
+# independent checks, run concurrently
+class Parallel(Middleware):
+    """
+    Group of checks which do not depend on each other (e.g. authentication and data validation).
+    Every check gets the same request and must not replace it : the group passes the request on when all of
+    them did, stops it as soon as one returns None.
+    """
+
+    def __init__(self, *middlewares, executor=None):
+        self.middlewares = middlewares
+        # sync chains : concurrent.futures executor running blocking checks side by side (None -> one by one)
+        self.executor = executor
+        self._run_all = None
+
+    def handle_request(self, request):
+        # used outside of a compiled chain : compiled on first use, not per request
+        run_all = self._run_all
+        if run_all is None:
+            run_all = self._run_all = self.compile()
+        return run_all(request)
+
+    def compile(self):
+        calls = [middleware.handle_request for middleware in self.middlewares]
+        if any(is_async(call) for call in calls):
+            raise TypeError("Parallel group with async middlewares, use Chain.compile_async()")
+        executor = self.executor
+        if executor is None:
+            def run_all(request):
+                for call in calls:
+                    if call(request) is None:
+                        return None
+                return request
+            return run_all
+
+        def run_all(request):
+            futures = [executor.submit(call, request) for call in calls]
+            try:
+                # in completion order : a fast rejection does not wait for the slow checks submitted before it
+                for future in as_completed(futures):
+                    if future.result() is None:
+                        return None
+            finally:
+                # stopped early (or failed) : the checks not started yet are not needed anymore
+                for future in futures:
+                    future.cancel()
+            return request
+        return run_all
+
+    def compile_async(self):
+        calls = [as_coroutine(middleware.handle_request) for middleware in self.middlewares]
+
+        async def run_all(request):
+            tasks = [asyncio.ensure_future(call(request)) for call in calls]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    if await next_done is None:
+                        return None
+            finally:
+                # stopped early (or failed) : the other checks are not needed anymore
+                for task in tasks:
+                    task.cancel()
+            return request
+        return run_all
+
+
+def is_async(call) -> bool:
+    return inspect.iscoroutinefunction(call)
+
+
+def as_coroutine(call):
+    # sync middleware in an async group : called inline, it is expected to be cheap
+    if is_async(call):
+        return call
+
+    async def inline(request):
+        return call(request)
+    return inline
+
+
+def compile_pipeline(middlewares, handler=None, use_async=False):
+    """
+    Generate the source of one function calling every middleware in order, then exec it once :
+        def pipeline(request):
+            request = m0(request)
+            if request is None:
+                return None
+            ...
+            return handler(request)
+    m0, m1 ... are the bound handle_request methods (or compiled Parallel groups), looked up once here.
+    """
+    namespace = {}
+    lines = []
+    for index, middleware in enumerate(middlewares):
+        name = f"m{index}"
+        if isinstance(middleware, Parallel):
+            call = middleware.compile_async() if use_async else middleware.compile()
+        else:
+            call = middleware.handle_request
+        if is_async(call) and not use_async:
+            raise TypeError(f"{type(middleware).__name__} is async, use Chain.compile_async()")
+        namespace[name] = call
+        await_ = "await " if is_async(call) else ""
+        lines.append(f"    request = {await_}{name}(request)")
+        lines.append("    if request is None:")
+        lines.append("        return None")
+    if handler is not None:
+        namespace["handler"] = handler
+        await_ = "await " if is_async(handler) else ""
+        lines.append(f"    return {await_}handler(request)")
+    else:
+        lines.append("    return request")
+    source = ("async def" if use_async else "def") + " pipeline(request):\n" + "\n".join(lines) + "\n"
+    exec(compile(source, "<chain>", "exec"), namespace)
+    return namespace["pipeline"]
 
 
 # create chain 
 class Chain:
-    def __init__(self):
+    def __init__(self, handler=None):
         self.middlewares = []
+        # next layer (service / proxy), called with the request once every middleware passed it on
+        self.handler = handler
+        self._compiled = None
+        self._compiled_async = None
 
     def add_middleware(self, middleware):
         self.middlewares.append(middleware)
+        # recompiled on the next request
+        self._compiled = self._compiled_async = None
+
+    def compile(self):
+        """flat callable request -> handler result / request, None when a middleware stopped it"""
+        if self._compiled is None:
+            self._compiled = compile_pipeline(self.middlewares, self.handler)
+        return self._compiled
+
+    def compile_async(self):
+        """same as compile(), as a coroutine function : async middlewares and Parallel groups are awaited"""
+        if self._compiled_async is None:
+            self._compiled_async = compile_pipeline(self.middlewares, self.handler, use_async=True)
+        return self._compiled_async
 
     def handle_request(self, request):
-        for middleware in self.middlewares:
-            request = middleware.handle_request(request)
-            if request is None:
-                print("Request processing stopped.")
-                break
+        request = self.compile()(request)
+        if request is None:
+            print("Request processing stopped.")
+        else:
+            # add complex logic to pass to next layer
+            print("passing request to next layer")
+        return request
 
-        # add complex logic to pass to next layer
-        if request is not None:
+    async def handle_request_async(self, request):
+        request = await self.compile_async()(request)
+        if request is None:
+            print("Request processing stopped.")
+        else:
             print("passing request to next layer")
+        return request
+
+
+class RemoteAuthenticationMiddleware(AsyncMiddleware):
+    """Authentication against a remote credential store : the lookup is awaited."""
+
+    async def handle_request(self, request):
+        await asyncio.sleep(0.01)  # credential store round trip
+        if request.get("user") is None:
+            print("Remote authentication middleware: Authentication failed")
+            return None
+        print("Remote authentication middleware: Authenticated successfully")
+        return request
+
+
+# memoized authentication : the slow credential check runs once per token and TTL, not once per request
+class AuthCache:
+    """
+    Verification results per credential (token, or user when the request has no token) :
+    - TTL : a verified credential is trusted for `ttl` seconds, a rejected one for `negative_ttl` seconds
+      (negative caching : a client retrying a bad token does not hit the credential store every time).
+    - LRU : at most `max_entries` credentials, the least recently used one is evicted first.
+    - invalidation hooks : invalidate(credential) on logout / revocation, invalidate_identity(identity) for
+      every token of a user, clear() when the credential store changes. Each one bumps a generation : a verify
+      started before it passes the generation it read to put(), which then drops the stale result.
+    - metrics : stats() -> hits, negative hits, misses, coalesced lookups, evictions, expirations.
+    """
+
+    # get() when the credential is not cached
+    MISSING = object()
+
+    def __init__(self, ttl=300.0, negative_ttl=5.0, max_entries=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()   # credential -> (identity or None, expires at)
+        # credential -> times it was invalidated, and a generation of the whole cache (clear, invalidate_identity,
+        # or _generations growing past max_entries and being reset)
+        self._generations = {}
+        self._epoch = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def cached(self, credential):
+        """get() without metrics or LRU update, with the lock held : re-check before verifying"""
+        entry = self._entries.get(credential)
+        if entry is None or entry[1] <= self.clock():
+            return AuthCache.MISSING
+        return entry[0]
+
+    def generation(self, credential):
+        """read before verifying, passed to put() : changed when the credential was invalidated meanwhile"""
+        return self._epoch, self._generations.get(credential, 0)
+
+    def get(self, credential):
+        """identity, None for a cached failure, MISSING when it must be verified"""
+        with self.lock:
+            entry = self._entries.get(credential)
+            if entry is None:
+                self.misses += 1
+                return AuthCache.MISSING
+            identity, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[credential]
+                self.expirations += 1
+                self.misses += 1
+                return AuthCache.MISSING
+            self._entries.move_to_end(credential)
+            if identity is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return identity
+
+    def put(self, credential, identity, generation=None) -> bool:
+        """False (not cached) when `generation` is older than the credential's current one"""
+        ttl = self.ttl if identity is not None else self.negative_ttl
+        with self.lock:
+            if generation is not None and generation != self.generation(credential):
+                return False
+            self._entries[credential] = (identity, self.clock() + ttl)
+            self._entries.move_to_end(credential)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, credential):
+        with self.lock:
+            self._entries.pop(credential, None)
+            if len(self._generations) >= self.max_entries:
+                # bounded : a new epoch makes every generation read before it stale, like the entries dropped
+                self._generations.clear()
+                self._epoch += 1
+            self._generations[credential] = self._generations.get(credential, 0) + 1
+
+    def invalidate_identity(self, identity):
+        with self.lock:
+            for credential in [c for c, (i, _) in self._entries.items() if i == identity]:
+                del self._entries[credential]
+            # the in-flight verify of a token of this user is not in the entries yet
+            self._epoch += 1
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            self._epoch += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            }
+
+
+def credential_of(request):
+    return request.get("token") or request.get("user")
+
+
+class CachedAuthenticationMiddleware(Middleware):
+    """
+    Authentication with the result of `verify(credential) -> identity or None` memoized in an AuthCache.
+    Single flight : concurrent requests with the same uncached credential wait for one verify call.
+    """
+
+    def __init__(self, verify, cache=None):
+        self.verify = verify
+        self.cache = cache or AuthCache()
+        self._flights = {}   # credential -> AuthFlight of the verify call in progress
+
+    def handle_request(self, request):
+        credential = credential_of(request)
+        if credential is None:
+            return None
+        identity = self.cache.get(credential)
+        if identity is AuthCache.MISSING:
+            identity = self.lookup(credential)
+        return request if identity is not None else None
+
+    def lookup(self, credential):
+        with self.cache.lock:
+            # cached by a leader which finished between our get() and here : no second verify
+            identity = self.cache.cached(credential)
+            if identity is not AuthCache.MISSING:
+                return identity
+            flight = self._flights.get(credential)
+            leader = flight is None
+            if leader:
+                flight = self._flights[credential] = AuthFlight()
+                generation = self.cache.generation(credential)
+            else:
+                self.cache.coalesced += 1
+        if not leader:
+            flight.event.wait()
+            # the leader failed with an exception (nothing verified) : verify ourselves
+            return flight.identity if flight.verified else self.verify(credential)
+        try:
+            flight.identity = self.verify(credential)
+            flight.verified = True
+            # not cached when the credential was invalidated (revoked) while it was being verified
+            self.cache.put(credential, flight.identity, generation)
+            return flight.identity
+        finally:
+            with self.cache.lock:
+                del self._flights[credential]
+            flight.event.set()
+
+
+class AuthFlight:
+    """verify call in progress, shared by the requests waiting for the same credential"""
+
+    __slots__ = ("event", "identity", "verified")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.identity = None
+        self.verified = False
+
+
+class AsyncCachedAuthenticationMiddleware(AsyncMiddleware):
+    """Same as CachedAuthenticationMiddleware for `async def verify(credential)`, on one event loop."""
+
+    def __init__(self, verify, cache=None):
+        self.verify = verify
+        self.cache = cache or AuthCache()
+        self._flights = {}   # credential -> Future of the verify call in progress
+
+    async def handle_request(self, request):
+        credential = credential_of(request)
+        if credential is None:
+            return None
+        identity = self.cache.get(credential)
+        if identity is AuthCache.MISSING:
+            flight = self._flights.get(credential)
+            if flight is not None:
+                self.cache.coalesced += 1
+                identity = await asyncio.shield(flight)
+            else:
+                generation = self.cache.generation(credential)
+                flight = self._flights[credential] = asyncio.ensure_future(self.verify(credential))
+                try:
+                    identity = await asyncio.shield(flight)
+                    self.cache.put(credential, identity, generation)
+                finally:
+                    del self._flights[credential]
+        return request if identity is not None else None
+
 
 # client code 
 if __name__ == "__main__":
@@ -117,4 +565,49 @@ if __name__ == "__main__":
 
     # Simulate an HTTP request.
     http_request = {"user": "username", "data": "valid_data"}
-    chain.handle_request(http_request)
\ No newline at end of file
+    chain.handle_request(http_request)
+
+    # async chain : remote authentication and data validation are independent, run them concurrently
+    async_chain = Chain(handler=lambda request: f"served {request['user']}")
+    async_chain.add_middleware(logging_middleware)
+    async_chain.add_middleware(Parallel(RemoteAuthenticationMiddleware(), data_validation_middleware))
+    print(asyncio.run(async_chain.handle_request_async(http_request)))
+
+    # memoized authentication : one slow credential check per token, then cache hits
+    def verify(token):
+        time.sleep(0.05)  # credential store round trip
+        return token.split(":")[0] if token.endswith(":valid") else None
+
+    cached_auth = CachedAuthenticationMiddleware(verify, AuthCache(ttl=60, negative_ttl=5))
+    fast_chain = Chain()
+    fast_chain.add_middleware(cached_auth)
+    pipeline = fast_chain.compile()
+    for token in ("alice:valid", "alice:valid", "mallory:forged", "mallory:forged"):
+        print(token, "->", "passed" if pipeline({"token": token}) is not None else "stopped")
+    cached_auth.cache.invalidate_identity("alice")
+    print(cached_auth.cache.stats())
+
+    # schema validation : compiled once, then one generated function per request
+    signup_schema = {
+        "type": "object",
+        "required": ["user", "data"],
+        "properties": {
+            "user": {"type": "string", "min_length": 3, "max_length": 32},
+            "data": {"type": "string"},
+            "age": {"type": "integer", "minimum": 13},
+        },
+    }
+    validation = DataValidationMiddleware(signup_schema)
+    valid, invalid = validation.validate_batch([http_request, {"user": "ab", "data": "x"}, {"user": "carol"}])
+    print(f"{len(valid)} valid, invalid : {[error for _, error in invalid]}")
+
+    # buffered logging : 100k requests logged without a write on the request thread
+    log_path = os.path.join(tempfile.gettempdir(), "requests.log")
+    request_log = BufferedLoggingMiddleware(RotatingFileSink(log_path, max_bytes=1024 * 1024, backup_count=2))
+    logged_chain = Chain()
+    logged_chain.add_middleware(request_log)
+    pipeline = logged_chain.compile()
+    for i in range(100000):
+        pipeline({"method": "POST", "path": "/signup", "user": f"user-{i}"})
+    request_log.close()
+    print(log_path, request_log.stats())
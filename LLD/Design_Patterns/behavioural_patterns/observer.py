@@ -1,3 +1,411 @@
 """
-Observer design pattern 
-"""
\ No newline at end of file
+Observer design pattern
+
+Characteristics :
+- defines a one to many dependency between objects : when the subject (publisher) changes state, all its observers
+  (subscribers) are notified, without the subject knowing what they are or what they do with the event.
+- observers subscribe and unsubscribe at runtime, the subject only keeps the list of them.
+
+When to use :
+- a change in one object must be broadcast to others, and who listens changes over time : e.g. a load balancer
+  announcing that a backend went down / came back or registered, to the metrics, the alerting, the caches ...
+- Event driven systems : UI events, pub / sub messaging, webhooks.
+
+Event bus (publish / subscribe, the subject is a topic) :
+- topics are dotted names ("backend.health"), a subscription is for a topic, a prefix ("backend.*") or "*".
+  The subscribers of each topic are precomputed into a table (tuple per topic) on first publish and rebuilt only
+  when someone subscribes / unsubscribes : publishing is one dict lookup and a loop over a tuple.
+- subscribers are held through weak references by default for bound methods (an observer object that is gone
+  stops being called and is unsubscribed, the bus does not keep it alive). Plain functions are held strongly.
+- delivery modes :
+    sync   : called by publish(), in the publisher's thread (cheapest, but a slow subscriber slows the publisher)
+    thread : queued, a thread per subscriber delivers
+    async  : queued, a task on the subscriber's asyncio loop delivers (awaiting the callback when it is a coroutine)
+- queued subscribers have their own bounded queue (`max_queue`) : publish never blocks, when a slow subscriber
+  lets its queue fill up its OLDEST events are dropped (and counted), the publisher and other subscribers go on.
+- bursts : batch=True delivers the queued events as one list (up to `max_batch`), coalesce=key(topic, event)
+  keeps only the latest pending event per key (e.g. per backend : only the current health matters).
+
+usage :
+    bus = EventBus()
+    bus.subscribe("backend.*", alerts.on_backend_event, mode=THREAD, coalesce=lambda topic, event: event["server"])
+    bus.publish("backend.health", {"server": "127.0.0.1:3000", "healthy": False})
+"""
+
+import asyncio
+import inspect
+import threading
+import weakref
+from collections import deque
+
+SYNC = "sync"
+THREAD = "thread"
+ASYNC = "async"
+MODES = (SYNC, THREAD, ASYNC)
+
+
+class _Queue:
+    """bounded FIFO, deque append / popleft are atomic : no lock between publishers and the deliverer"""
+
+    def __init__(self, max_size):
+        self._events = deque(maxlen=max_size)
+        self.dropped = 0
+        self.coalesced = 0
+
+    def push(self, item) -> bool:
+        """True when the queue was empty : the deliverer may be sleeping and must be woken"""
+        events = self._events
+        if len(events) == events.maxlen:
+            # maxlen : the append drops the oldest event
+            self.dropped += 1
+        events.append(item)
+        return len(events) == 1
+
+    def drain(self, max_items):
+        events = []
+        popleft = self._events.popleft
+        try:
+            for _ in range(max_items):
+                events.append(popleft())
+        except IndexError:
+            pass
+        return events
+
+    def __len__(self):
+        return len(self._events)
+
+
+class _CoalescingQueue:
+    """latest pending event per key, in the order the keys first became pending"""
+
+    def __init__(self, max_size, key):
+        self.max_size = max_size
+        self.key = key
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.coalesced = 0
+
+    def push(self, item) -> bool:
+        key = self.key(*item)
+        with self._lock:
+            pending = self._pending
+            if key in pending:
+                self.coalesced += 1
+            elif len(pending) >= self.max_size:
+                del pending[next(iter(pending))]
+                self.dropped += 1
+            pending[key] = item
+            return len(pending) == 1
+
+    def drain(self, max_items):
+        with self._lock:
+            pending = self._pending
+            if len(pending) <= max_items:
+                self._pending = {}
+                return list(pending.values())
+            keys = list(pending)[:max_items]
+            return [pending.pop(key) for key in keys]
+
+    def __len__(self):
+        return len(self._pending)
+
+
+def _reference(callback, weak, on_dead):
+    """callable returning the callback, or None once a weakly held one is gone"""
+    if weak is None:
+        # bound methods : weak, the bus must not keep the observer alive. Plain functions / lambdas : strong,
+        # a weak reference to a lambda would die right away
+        weak = inspect.ismethod(callback)
+    if not weak:
+        return lambda: callback
+    if inspect.ismethod(callback):
+        return weakref.WeakMethod(callback, on_dead)
+    return weakref.ref(callback, on_dead)
+
+
+class Subscription:
+
+    def __init__(self, bus, pattern, callback, mode=SYNC, weak=None, max_queue=1024, batch=False, max_batch=256,
+                 coalesce=None, loop=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown delivery mode {mode!r}, expected one of {MODES}")
+        if mode == SYNC and (batch or coalesce is not None):
+            raise ValueError("batch / coalesce need a queued delivery mode (thread or async)")
+        self.bus = bus
+        self.pattern = pattern
+        self.mode = mode
+        self.batch = batch
+        self.max_batch = max_batch if batch else 1
+        self.target = _reference(callback, weak, lambda _: bus.unsubscribe(self))
+        self.queue = None
+        if mode != SYNC:
+            self.queue = _Queue(max_queue) if coalesce is None else _CoalescingQueue(max_queue, coalesce)
+        self.active = True
+        self.delivered = 0
+        self.errors = 0
+        self.last_error = None
+        self._wakeup = None
+        self._loop = loop
+        self._loop_thread = None
+        self._worker = None
+
+    def matches(self, topic) -> bool:
+        pattern = self.pattern
+        if pattern == "*" or pattern == topic:
+            return True
+        return pattern.endswith(".*") and topic.startswith(pattern[:-1])
+
+    def start(self):
+        if self.mode == THREAD:
+            self._wakeup = threading.Event()
+            self._worker = threading.Thread(target=self.run, name=f"observer-{self.pattern}", daemon=True)
+            self._worker.start()
+        elif self.mode == ASYNC:
+            loop = self._loop or asyncio.get_running_loop()
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.run_coroutine_threadsafe(self.run_async(), loop)
+        return self
+
+    # called by EventBus.publish
+
+    def deliver(self, topic, event):
+        callback = self.target()
+        if callback is None:
+            self.bus.unsubscribe(self)
+            return
+        try:
+            callback(topic, event)
+            self.delivered += 1
+        except Exception as e:
+            self.errors += 1
+            self.last_error = e
+
+    def enqueue(self, item):
+        if self.queue.push(item):
+            self.wake()
+
+    def wake(self):
+        if self.mode == THREAD:
+            self._wakeup.set()
+        elif threading.get_ident() == self._loop_thread:
+            self._wakeup.set()
+        else:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                # the loop is closed : nobody left to deliver to
+                pass
+
+    # deliverer side : drain, deliver, sleep only after seeing the queue empty
+
+    def _callback(self):
+        callback = self.target()
+        if callback is None:
+            self.bus.unsubscribe(self)
+        return callback
+
+    def run(self):
+        wakeup = self._wakeup
+        while self.active:
+            events = self.queue.drain(self.max_batch)
+            if events:
+                callback = self._callback()
+                if callback is None:
+                    return
+                try:
+                    if self.batch:
+                        callback(events)
+                    else:
+                        callback(*events[0])
+                    self.delivered += len(events)
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = e
+                continue
+            wakeup.clear()
+            # an event pushed between the drain and the clear did not wake us : look again before sleeping
+            if not len(self.queue):
+                wakeup.wait()
+
+    async def run_async(self):
+        self._loop_thread = threading.get_ident()
+        wakeup = self._wakeup
+        while self.active:
+            events = self.queue.drain(self.max_batch)
+            if events:
+                callback = self._callback()
+                if callback is None:
+                    return
+                try:
+                    result = callback(events) if self.batch else callback(*events[0])
+                    if inspect.isawaitable(result):
+                        await result
+                    self.delivered += len(events)
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = e
+                continue
+            wakeup.clear()
+            if not len(self.queue):
+                await wakeup.wait()
+
+    def stop(self):
+        self.active = False
+        if self._wakeup is not None:
+            self.wake()
+
+    def stats(self) -> dict:
+        return {
+            "pattern": self.pattern,
+            "mode": self.mode,
+            "delivered": self.delivered,
+            "pending": len(self.queue) if self.queue is not None else 0,
+            "dropped": self.queue.dropped if self.queue is not None else 0,
+            "coalesced": self.queue.coalesced if self.queue is not None else 0,
+            "errors": self.errors,
+        }
+
+
+class EventBus:
+
+    def __init__(self):
+        self._subscriptions = ()
+        # topic -> (sync subscriptions, queued subscriptions), filled on first publish of a topic
+        self._table = {}
+        # RLock : a weak reference dying (during a garbage collection) unsubscribes, maybe inside subscribe()
+        self._lock = threading.RLock()
+
+    def subscribe(self, pattern, callback, mode=SYNC, **options) -> Subscription:
+        """
+        callback(topic, event), or callback([(topic, event), ...]) with batch=True. options : weak, max_queue,
+        batch, max_batch, coalesce, loop (asyncio loop of an async subscriber, default the running one)
+        """
+        # deliverer started first : it is ready before the first event can be queued
+        subscription = Subscription(self, pattern, callback, mode, **options).start()
+        with self._lock:
+            self._subscriptions += (subscription,)
+            self._table = {}
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription not in self._subscriptions:
+                return
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
+            self._table = {}
+        subscription.stop()
+
+    def _resolve(self, topic):
+        with self._lock:
+            matching = [s for s in self._subscriptions if s.matches(topic)]
+            entry = (tuple(s for s in matching if s.mode == SYNC), tuple(s for s in matching if s.mode != SYNC))
+            # under the lock : a concurrent subscribe() cannot replace the table between resolving and storing
+            self._table[topic] = entry
+            return entry
+
+    def publish(self, topic, event) -> int:
+        """deliver / queue `event` to every subscriber of `topic`, returns how many"""
+        entry = self._table.get(topic)
+        if entry is None:
+            entry = self._resolve(topic)
+        sync, queued = entry
+        for subscription in sync:
+            # Subscription.deliver inlined : the hot loop of a fan-out
+            callback = subscription.target()
+            if callback is None:
+                self.unsubscribe(subscription)
+                continue
+            try:
+                callback(topic, event)
+                subscription.delivered += 1
+            except Exception as e:
+                subscription.errors += 1
+                subscription.last_error = e
+        if queued:
+            item = (topic, event)
+            for subscription in queued:
+                subscription.enqueue(item)
+        return len(sync) + len(queued)
+
+    def publish_many(self, topic, events) -> int:
+        """a burst of events of one topic : one table lookup, one wake up per queued subscriber"""
+        entry = self._table.get(topic)
+        if entry is None:
+            entry = self._resolve(topic)
+        sync, queued = entry
+        count = 0
+        for event in events:
+            count += 1
+            for subscription in sync:
+                subscription.deliver(topic, event)
+            for subscription in queued:
+                subscription.queue.push((topic, event))
+        for subscription in queued:
+            subscription.wake()
+        return count
+
+    def subscriptions(self) -> tuple:
+        return self._subscriptions
+
+    def close(self):
+        """stop every deliverer, events still queued are not delivered"""
+        with self._lock:
+            subscriptions, self._subscriptions = self._subscriptions, ()
+            self._table = {}
+        for subscription in subscriptions:
+            subscription.stop()
+
+    def stats(self) -> list:
+        return [subscription.stats() for subscription in self._subscriptions]
+
+
+# Example : the load balancer publishing backend health / registration events
+
+class BackendDashboard:
+    # an observer object : subscribed through a weak reference, unsubscribed once it is garbage collected
+    def __init__(self):
+        self.status = {}
+
+    def on_backend_event(self, topic, event):
+        self.status[event["server"]] = event.get("healthy", True)
+
+
+if __name__ == "__main__":
+    import gc
+    import time
+
+    bus = EventBus()
+    dashboard = BackendDashboard()
+    bus.subscribe("backend.*", dashboard.on_backend_event)
+    # slow alerting, on its own thread with a coalescing queue : only the latest health per backend is sent
+    alerts = []
+    bus.subscribe("backend.health", lambda batch: (time.sleep(0.05), alerts.append(batch)), mode=THREAD,
+                  batch=True, coalesce=lambda topic, event: event["server"])
+
+    bus.publish("backend.registered", {"server": "127.0.0.1:3000", "weight": 1})
+    for healthy in (False, True, False):
+        bus.publish("backend.health", {"server": "127.0.0.1:3000", "healthy": healthy})
+    time.sleep(0.2)
+    print(dashboard.status)  # Output: {'127.0.0.1:3000': False}
+    print(sum(len(batch) for batch in alerts) <= 3, alerts[-1][-1][1])  # Output: True {'server': ..., 'healthy': False}
+
+    # the dashboard is gone : it is unsubscribed, not kept alive by the bus
+    del dashboard
+    gc.collect()
+    print(bus.publish("backend.registered", {"server": "127.0.0.1:3001"}))  # Output: 0
+
+    # asyncio subscriber
+    async def main():
+        received = []
+
+        async def on_event(topic, event):
+            received.append(event["server"])
+        bus.subscribe("backend.*", on_event, mode=ASYNC)
+        bus.publish_many("backend.registered", [{"server": f"127.0.0.1:{port}"} for port in (3002, 3003)])
+        await asyncio.sleep(0.01)
+        print(received)  # Output: ['127.0.0.1:3002', '127.0.0.1:3003']
+
+    asyncio.run(main())
+    bus.close()
@@ -0,0 +1,226 @@
+"""
+Schema validation for DataValidationMiddleware (chain_of_responsiblity.py)
+
+Rules are declared as a schema (a small JSON schema like dict) and compiled ONCE into a specialized Python
+function : the schema is walked at compile time and turned into straight line checks (type(v) is str,
+len(v) <= 64, "user" in v ...), constants (enums, regexes, allowed keys) are bound once. Validating a request
+then never looks at the schema again, unlike an interpretive validator which walks the schema dict, dispatches
+on every keyword and builds paths for every value of every request.
+
+Supported keywords :
+    type                 : "object", "array", "string", "integer", "number", "boolean", "null"
+    object               : properties, required, additional_properties (False -> unknown keys are invalid)
+    array                : items, min_items, max_items
+    string               : min_length, max_length, pattern (regex, searched), enum
+    integer / number     : minimum, maximum, enum
+
+usage :
+    validate = compile_schema(SIGNUP_SCHEMA)
+    validate({"user": "alice", "email": "alice@example.com", "age": 30})  -> True / False
+    first_error(SIGNUP_SCHEMA, payload)                                     -> "$.age : expected integer" / None
+"""
+
+import re
+
+# type name -> python types accepted (bool is not an integer here, like JSON)
+TYPES = {
+    "object": (dict,),
+    "array": (list,),
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "null": (type(None),),
+}
+
+_MISSING = object()
+
+# python types each family of constraints applies to : a value of another type fails the constraint
+SIZED = frozenset({str, list, dict})
+NUMBERS = frozenset({int, float})
+STRINGS = frozenset({str})
+
+
+class SchemaError(ValueError):
+    """invalid schema, raised at compile time"""
+
+
+class _Compiler:
+    """generates the body of `def validate(v0)` from a schema, one `return False` per failed check"""
+
+    def __init__(self):
+        self.lines = []
+        self.constants = {"_MISSING": _MISSING}
+        self.counter = 0
+
+    def name(self, prefix):
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+    def constant(self, value):
+        name = self.name("c")
+        self.constants[name] = value
+        return name
+
+    def emit(self, indent, line):
+        self.lines.append("    " * indent + line)
+
+    def check(self, indent, condition):
+        self.emit(indent, f"if {condition}:")
+        self.emit(indent + 1, "return False")
+
+    def guard(self, kind, allowed, var, indent):
+        # type check before a comparison the declared type does not already make safe ({"minimum": 3}
+        # against "x" is invalid, not a TypeError)
+        if kind is None or not frozenset(TYPES[kind]) <= allowed:
+            self.check(indent, f"type({var}) not in {self.constant(allowed)}")
+
+    def node(self, schema, var, indent):
+        kind = schema.get("type")
+        if kind is not None:
+            if kind not in TYPES:
+                raise SchemaError(f"unknown type {kind!r}")
+            types = TYPES[kind]
+            if len(types) == 1:
+                self.check(indent, f"type({var}) is not {self.constant(types[0])}")
+            else:
+                self.check(indent, f"type({var}) not in {self.constant(frozenset(types))}")
+        if "enum" in schema:
+            # a list / dict value is not hashable : compared one by one unless the type rules it out
+            hashable = kind is not None and kind not in ("object", "array")
+            choices = frozenset(schema["enum"]) if hashable else tuple(schema["enum"])
+            self.check(indent, f"{var} not in {self.constant(choices)}")
+        if "min_length" in schema or "max_length" in schema:
+            self.guard(kind, SIZED, var, indent)
+            length = self.name("n")
+            self.emit(indent, f"{length} = len({var})")
+            if "min_length" in schema:
+                self.check(indent, f"{length} < {int(schema['min_length'])}")
+            if "max_length" in schema:
+                self.check(indent, f"{length} > {int(schema['max_length'])}")
+        if "pattern" in schema:
+            self.guard(kind, STRINGS, var, indent)
+            self.check(indent, f"{self.constant(re.compile(schema['pattern']).search)}({var}) is None")
+        if "minimum" in schema or "maximum" in schema:
+            self.guard(kind, NUMBERS, var, indent)
+        if "minimum" in schema:
+            self.check(indent, f"{var} < {schema['minimum']!r}")
+        if "maximum" in schema:
+            self.check(indent, f"{var} > {schema['maximum']!r}")
+        if kind == "object":
+            self.object_node(schema, var, indent)
+        elif kind == "array":
+            self.array_node(schema, var, indent)
+
+    def object_node(self, schema, var, indent):
+        properties = schema.get("properties", {})
+        required = set(schema.get("required", ()))
+        for key in sorted(required - set(properties)):
+            self.check(indent, f"{key!r} not in {var}")
+        if schema.get("additional_properties", True) is False:
+            self.check(indent, f"not {var}.keys() <= {self.constant(frozenset(properties))}")
+        for key, child in properties.items():
+            value = self.name("v")
+            if key in required:
+                self.emit(indent, f"{value} = {var}.get({key!r}, _MISSING)")
+                self.check(indent, f"{value} is _MISSING")
+                self.node(child, value, indent)
+            else:
+                self.emit(indent, f"{value} = {var}.get({key!r}, _MISSING)")
+                self.emit(indent, f"if {value} is not _MISSING:")
+                before = len(self.lines)
+                self.node(child, value, indent + 1)
+                if len(self.lines) == before:
+                    self.emit(indent + 1, "pass")
+
+    def array_node(self, schema, var, indent):
+        if "min_items" in schema or "max_items" in schema:
+            length = self.name("n")
+            self.emit(indent, f"{length} = len({var})")
+            if "min_items" in schema:
+                self.check(indent, f"{length} < {int(schema['min_items'])}")
+            if "max_items" in schema:
+                self.check(indent, f"{length} > {int(schema['max_items'])}")
+        if schema.get("items"):
+            item = self.name("v")
+            self.emit(indent, f"for {item} in {var}:")
+            before = len(self.lines)
+            self.node(schema["items"], item, indent + 1)
+            if len(self.lines) == before:
+                self.emit(indent + 1, "pass")
+
+
+def compile_schema(schema):
+    """schema -> validate(value) -> bool, generated once"""
+    compiler = _Compiler()
+    compiler.node(schema, "v0", 1)
+    compiler.emit(1, "return True")
+    source = "def validate(v0):\n" + "\n".join(compiler.lines) + "\n"
+    namespace = dict(compiler.constants)
+    exec(compile(source, "<schema>", "exec"), namespace)
+    validate = namespace["validate"]
+    validate.source = source
+    return validate
+
+
+def compile_batch(schema, validate=None):
+    """schema -> validate_batch(values) -> list of bools, one per value (`validate` : already compiled validator)"""
+    validate = validate or compile_schema(schema)
+
+    def validate_batch(values):
+        return [validate(value) for value in values]
+    return validate_batch
+
+
+def first_error(schema, value, path="$"):
+    """
+    Interpretive walk of the schema : message of the first failed rule, None when the value is valid.
+    Slow (dict lookups per keyword, paths built for every value) : for error messages on the cold path and
+    as the baseline of benchmarks/bench_validation.py.
+    """
+    kind = schema.get("type")
+    if kind is not None and not (type(value) in TYPES[kind]):
+        return f"{path} : expected {kind}"
+    if "enum" in schema and value not in schema["enum"]:
+        return f"{path} : not one of {schema['enum']}"
+    if ("min_length" in schema or "max_length" in schema) and type(value) not in SIZED:
+        return f"{path} : expected a string, array or object"
+    if "pattern" in schema and type(value) not in STRINGS:
+        return f"{path} : expected string"
+    if ("minimum" in schema or "maximum" in schema) and type(value) not in NUMBERS:
+        return f"{path} : expected number"
+    if "min_length" in schema and len(value) < schema["min_length"]:
+        return f"{path} : shorter than {schema['min_length']}"
+    if "max_length" in schema and len(value) > schema["max_length"]:
+        return f"{path} : longer than {schema['max_length']}"
+    if "pattern" in schema and re.search(schema["pattern"], value) is None:
+        return f"{path} : does not match {schema['pattern']}"
+    if "minimum" in schema and value < schema["minimum"]:
+        return f"{path} : less than {schema['minimum']}"
+    if "maximum" in schema and value > schema["maximum"]:
+        return f"{path} : more than {schema['maximum']}"
+    if kind == "object":
+        properties = schema.get("properties", {})
+        for key in schema.get("required", ()):
+            if key not in value:
+                return f"{path}.{key} : required"
+        if schema.get("additional_properties", True) is False:
+            for key in value:
+                if key not in properties:
+                    return f"{path}.{key} : unknown property"
+        for key, child in properties.items():
+            if key in value:
+                error = first_error(child, value[key], f"{path}.{key}")
+                if error is not None:
+                    return error
+    elif kind == "array":
+        if "min_items" in schema and len(value) < schema["min_items"]:
+            return f"{path} : fewer than {schema['min_items']} items"
+        if "max_items" in schema and len(value) > schema["max_items"]:
+            return f"{path} : more than {schema['max_items']} items"
+        if schema.get("items"):
+            for index, item in enumerate(value):
+                error = first_error(schema["items"], item, f"{path}[{index}]")
+                if error is not None:
+                    return error
+    return None
@@ -0,0 +1,127 @@
+"""
+Benchmark : building many orders (creational_patterns/builder.py), time and memory held by the result.
+
+`--orders` rows like an import job's (1 to 5 items out of `--catalog` SKUs, a few shipping / payment methods and
+discounts), built as :
+    builder      : the former Order (instance __dict__) through OrderBuilder, one chained call per field and item
+    slotted      : BulkOrderBuilder.orders(), slotted Orders, one constructor call per order
+    columnar     : BulkOrderBuilder.columns(), OrderColumns
+    columnar csv : the same rows streamed from a CSV file, in batches of `--batch` orders (memory of one batch)
+
+usage : python benchmarks/bench_builder.py [--orders 200000] [--catalog 1000] [--batch 10000]
+"""
+
+import argparse
+import csv
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "creational_patterns"))
+
+from builder import BulkOrderBuilder, OrderBuilder  # noqa: E402
+
+SHIPPING = ["Regular Shipping Method", "Express Shipping Method", "Store Pickup"]
+PAYMENT = ["COD", "CARD", "UPI", "NET BANKING"]
+DISCOUNTS = [None, None, "SUMMER50", "WELCOME10"]
+
+
+class DictOrder:
+    # Order before __slots__
+    def __init__(self):
+        self.items = []
+        self.shipping_method = None
+        self.payment_method = None
+        self.discount = None
+
+
+class DictOrderBuilder(OrderBuilder):
+    def __init__(self):
+        self.order = DictOrder()
+
+
+def make_rows(count, catalog):
+    rng = random.Random(7)
+    skus = [f"SKU-{i:05d}" for i in range(catalog)]
+    return [{
+        "items": rng.sample(skus, rng.randint(1, 5)),
+        "delivery_method": rng.choice(SHIPPING),
+        "payment_method": rng.choice(PAYMENT),
+        "discount": rng.choice(DISCOUNTS),
+    } for _ in range(count)]
+
+
+def with_builder(rows):
+    orders = []
+    for row in rows:
+        builder = DictOrderBuilder()
+        for item in row["items"]:
+            builder.set_items(item)
+        builder.set_shipping_method(row["delivery_method"]).set_payment_method(row["payment_method"]) \
+            .set_discount(row["discount"])
+        orders.append(builder.build())
+    return orders
+
+
+def from_csv(path, batch_size):
+    # a real import would write each batch somewhere, here only the last one is kept
+    with open(path, newline="") as csv_file:
+        batch = None
+        for batch in BulkOrderBuilder().columns(BulkOrderBuilder.csv_rows(csv_file), batch_size):
+            pass
+        return batch
+
+
+def measure(build):
+    gc.collect()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    del result
+    gc.collect()
+    tracemalloc.start()
+    # kept until measured : the memory held is the memory of the result
+    result = build()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return elapsed, held
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--catalog", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=10000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.orders, args.catalog)
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="", delete=False) as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["items", "delivery_method", "payment_method", "discount"])
+        for row in rows:
+            writer.writerow([";".join(row["items"]), row["delivery_method"], row["payment_method"], row["discount"] or ""])
+    bulk = BulkOrderBuilder()
+    variants = {
+        "builder": lambda: with_builder(rows),
+        "slotted": lambda: list(bulk.orders(rows)),
+        "columnar": lambda: bulk.columns(rows),
+        "columnar csv": lambda: from_csv(csv_file.name, args.batch),
+    }
+    try:
+        print(f"{args.orders} orders")
+        print(f"{'representation':<16}{'seconds':>9}{'orders/s':>12}{'held MB':>10}{'bytes/order':>13}")
+        for name, build in variants.items():
+            elapsed, held = measure(build)
+            print(f"{name:<16}{elapsed:>9.2f}{args.orders / elapsed:>12,.0f}{held / 2 ** 20:>10.1f}"
+                  f"{held / args.orders:>13.1f}")
+    finally:
+        os.unlink(csv_file.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark : carts of many concurrent sessions (creational_patterns/cart_store.py, get_cart_store() in singleton.py).
+
+    scaling : 1 .. `--threads` threads, each running `--ops` operations (add 50%, remove 25%, get 25%) on
+              random sessions out of `--sessions`, total operations per second for
+                  global lock : session -> list of items behind one lock (ShoppingCart made thread safe)
+                  1 shard     : CartStore(shards=1), counter based carts, still one lock
+                  N shards    : CartStore(shards=`--shards`), lock striped
+    remove  : ns to remove (then put back) one item of a cart holding n distinct items, list vs counter.
+
+With the GIL only one thread runs Python code at a time : striping saves the waits and hand-offs on a contended
+lock rather than running carts in parallel. On a free-threaded build the shards also run in parallel.
+
+usage : python benchmarks/bench_cart.py [--threads 32] [--ops 20000] [--sessions 10000] [--shards 64]
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "creational_patterns"))
+
+from cart_store import CartStore  # noqa: E402
+
+ITEMS = [f"sku-{i}" for i in range(50)]
+
+
+class GlobalLockCarts:
+    # the ShoppingCart list per session, one lock for the whole process
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._carts = {}
+
+    def add_item(self, session_id, item, quantity=1):
+        with self._lock:
+            self._carts.setdefault(session_id, []).extend([item] * quantity)
+
+    def remove_item(self, session_id, item, quantity=None):
+        with self._lock:
+            items = self._carts.get(session_id)
+            if items and item in items:
+                items.remove(item)
+
+    def get_items(self, session_id):
+        with self._lock:
+            return list(self._carts.get(session_id, ()))
+
+
+def operations(ops, sessions, seed):
+    rng = random.Random(seed)
+    return [(rng.random(), f"session-{rng.randrange(sessions)}", rng.choice(ITEMS)) for _ in range(ops)]
+
+
+def throughput(store, threads, ops, sessions) -> float:
+    plans = [operations(ops, sessions, seed) for seed in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def work(plan):
+        add, remove, get = store.add_item, store.remove_item, store.get_items
+        barrier.wait()
+        for draw, session_id, item in plan:
+            if draw < 0.5:
+                add(session_id, item)
+            elif draw < 0.75:
+                remove(session_id, item, 1)
+            else:
+                get(session_id)
+
+    workers = [threading.Thread(target=work, args=(plan,)) for plan in plans]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return threads * ops / (time.perf_counter() - start)
+
+
+def remove_cost(store, size, repeat=2000) -> float:
+    for item in range(size):
+        store.add_item("session", f"sku-{item}")
+    # the oldest item : the worst case of a list scan
+    item = "sku-0"
+    start = time.perf_counter()
+    for _ in range(repeat):
+        store.remove_item("session", item, 1)
+        store.add_item("session", item)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--shards", type=int, default=64)
+    args = parser.parse_args()
+
+    counts = [n for n in (1, 2, 4, 8, 16, 32, 64, 128) if n <= args.threads]
+    stores = {
+        "global lock": GlobalLockCarts,
+        "1 shard": lambda: CartStore(shards=1),
+        f"{args.shards} shards": lambda: CartStore(shards=args.shards),
+    }
+    print(f"{args.ops} ops per thread over {args.sessions} sessions, ops/s")
+    print(f"{'threads':>8}" + "".join(f"{name:>16}" for name in stores))
+    for threads in counts:
+        rates = [throughput(make(), threads, args.ops, args.sessions) for make in stores.values()]
+        print(f"{threads:>8}" + "".join(f"{rate:>16,.0f}" for rate in rates))
+
+    print("\nremove + add of one item, ns")
+    print(f"{'items':>8}{'list':>12}{'counter':>12}")
+    for size in (10, 100, 1000, 10000):
+        listed = remove_cost(GlobalLockCarts(), size)
+        counted = remove_cost(CartStore(shards=1), size)
+        print(f"{size:>8}{listed * 1e9:>12.0f}{counted * 1e9:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark : per request overhead of the middleware chain (behavioural_patterns/chain_of_responsiblity.py).
+
+    overhead : `--sizes` no-op middlewares, ns per request and per middleware for
+                 loop     : the former Chain.handle_request, a for loop over the list calling middleware.handle_request
+                 compiled : Chain.compile(), one generated function with the bound methods resolved once
+                 async    : Chain.compile_async() awaited in a running loop (sync middlewares called inline)
+    parallel : two async checks waiting `--check-latency` seconds each (auth and validation), one after the
+               other vs in a Parallel group : latency per request.
+
+usage : python benchmarks/bench_chain.py [--sizes 1,4,16] [--requests 200000] [--check-latency 0.005]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "behavioural_patterns"))
+
+from chain_of_responsiblity import AsyncMiddleware, Chain, Middleware, Parallel  # noqa: E402
+
+
+class PassThrough(Middleware):
+
+    def handle_request(self, request):
+        return request
+
+
+class SlowCheck(AsyncMiddleware):
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def handle_request(self, request):
+        await asyncio.sleep(self.latency)
+        return request
+
+
+def loop_chain(middlewares):
+    # what Chain.handle_request used to do for every request
+    def handle(request):
+        for middleware in middlewares:
+            request = middleware.handle_request(request)
+            if request is None:
+                break
+        return request
+    return handle
+
+
+def per_request(call, requests) -> float:
+    request = {"user": "username", "data": "valid_data"}
+    start = time.perf_counter()
+    for _ in range(requests):
+        call(request)
+    return (time.perf_counter() - start) / requests
+
+
+async def per_request_async(call, requests) -> float:
+    request = {"user": "username", "data": "valid_data"}
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(request)
+    return (time.perf_counter() - start) / requests
+
+
+def overhead(size, requests):
+    chain = Chain()
+    for _ in range(size):
+        chain.add_middleware(PassThrough())
+    return {
+        "loop": per_request(loop_chain(chain.middlewares), requests),
+        "compiled": per_request(chain.compile(), requests),
+        "async": asyncio.run(per_request_async(chain.compile_async(), requests)),
+    }
+
+
+def parallel(latency, requests):
+    results = {}
+    for name in ("sequential", "parallel"):
+        chain = Chain()
+        checks = [SlowCheck(latency), SlowCheck(latency)]
+        if name == "parallel":
+            chain.add_middleware(Parallel(*checks))
+        else:
+            for check in checks:
+                chain.add_middleware(check)
+        results[name] = asyncio.run(per_request_async(chain.compile_async(), requests))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,4,16", help="middlewares in the chain, comma separated")
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--check-latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    print(f"{'middlewares':>12}{'chain':>10}{'ns/request':>12}{'ns/middleware':>15}")
+    for size in map(int, args.sizes.split(",")):
+        for name, seconds in overhead(size, args.requests).items():
+            print(f"{size:>12}{name:>10}{seconds * 1e9:>12.0f}{seconds * 1e9 / size:>15.0f}")
+
+    print(f"\ntwo async checks of {args.check_latency * 1000:.0f} ms each")
+    for name, seconds in parallel(args.check_latency, 100).items():
+        print(f"  {name:<12}{seconds * 1000:>8.2f} ms/request")
+
+
+if __name__ == "__main__":
+    main()
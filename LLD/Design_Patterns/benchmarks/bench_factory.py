@@ -0,0 +1,112 @@
+"""
+Benchmark : lazy providers and pooled / cached products (creational_patterns/providers.py).
+
+    import time : startup of a program with `--providers` payment providers whose SDKs are heavy to import
+                  (stand-ins : stdlib modules), which then uses one of them. Fresh interpreter per run.
+                    eager : every SDK imported and every provider built at import time (the former
+                            PaymentFactoryMethod.payment_providers dict)
+                    lazy  : ProviderRegistry with "module:attribute" providers, only the used one is imported
+    per call    : create_button() `--calls` times on a request path, ns per call and products constructed
+                    fresh  : DarkUIFactory, a new product per call
+                    cached : CachingUIFactory, one shared product
+                    pooled : PooledUIFactory, acquire + release
+
+usage : python benchmarks/bench_factory.py [--runs 5] [--calls 200000]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+PATTERNS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "creational_patterns")
+sys.path.insert(0, PATTERNS_DIR)
+
+from abstract_factory import CachingUIFactory, DarkUIFactory, PooledUIFactory  # noqa: E402
+
+# stand-ins for provider SDKs : heavy to import, cheap to build
+SDKS = [
+    "argparse:ArgumentParser", "asyncio:Event", "decimal:Context", "difflib:SequenceMatcher",
+    "email.message:EmailMessage", "fractions:Fraction", "http.cookiejar:CookieJar", "json:JSONDecoder",
+    "tarfile:TarInfo", "unittest:TestSuite", "xml.dom.minidom:Document", "zipfile:ZipInfo",
+]
+
+EAGER = """
+import importlib
+providers = {}
+for target in %(sdks)r:
+    module, _, attribute = target.partition(":")
+    providers[target] = getattr(importlib.import_module(module), attribute)()
+providers[%(used)r]
+"""
+
+LAZY = """
+from providers import ProviderRegistry
+registry = ProviderRegistry()
+for target in %(sdks)r:
+    registry.register(target, target)
+registry.get(%(used)r)
+"""
+
+
+def startup(code, runs) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=PATTERNS_DIR, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class CountingFactory(DarkUIFactory):
+    constructed = 0
+
+    def create_button(self):
+        CountingFactory.constructed += 1
+        return super().create_button()
+
+
+def per_call(name, calls):
+    CountingFactory.constructed = 0
+    if name == "fresh":
+        factory = CountingFactory()
+        call = factory.create_button
+    elif name == "cached":
+        call = CachingUIFactory(CountingFactory()).create_button
+    else:
+        factory = PooledUIFactory(CountingFactory(), max_size=8)
+        create, release = factory.create_button, factory.release
+
+        def call():
+            release(create())
+    start = time.perf_counter()
+    for _ in range(calls):
+        call()
+    seconds = (time.perf_counter() - start) / calls
+    return seconds, CountingFactory.constructed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="startups per variant, the fastest counts")
+    parser.add_argument("--providers", type=int, default=len(SDKS))
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    sdks = SDKS[:args.providers]
+    values = {"sdks": sdks, "used": sdks[0]}
+    bare = startup("pass", args.runs)
+    print(f"startup with {len(sdks)} providers, one used (bare interpreter {bare * 1000:.1f} ms subtracted)")
+    for name, code in (("eager", EAGER), ("lazy", LAZY)):
+        print(f"  {name:<8}{(startup(code % values, args.runs) - bare) * 1000:>8.1f} ms")
+
+    print(f"\ncreate_button() x {args.calls}")
+    print(f"{'factory':<10}{'ns/call':>10}{'constructed':>13}")
+    for name in ("fresh", "cached", "pooled"):
+        seconds, constructed = per_call(name, args.calls)
+        print(f"{name:<10}{seconds * 1e9:>10.0f}{constructed:>13}")
+
+
+if __name__ == "__main__":
+    main()
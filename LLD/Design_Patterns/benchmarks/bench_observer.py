@@ -0,0 +1,172 @@
+"""
+Benchmark : fan-out of the event bus (behavioural_patterns/observer.py).
+
+    dispatch  : ns per publish() to `n` sync subscribers of "backend.health" among as many subscribers of other
+                topics, a naive subject (matches every subscription's pattern on every publish) vs EventBus
+                (precomputed subscriber table per topic).
+    queued    : `--events` events to n thread subscribers, publisher ns per event and end to end events/s,
+                delivered one by one vs batch=True (one call per drained batch).
+    async     : the same with n async subscribers on one asyncio loop.
+    slow      : one subscriber taking 1 ms per event next to a fast one, time for the publisher to publish 2000
+                events : sync (the publisher waits for it) vs thread with a bounded queue (its oldest events are
+                dropped instead).
+    burst     : `--events` (at most 5000) health events over 10 backends to a subscriber taking 0.1 ms per
+                call, calls made without / with coalescing per backend.
+
+usage : python benchmarks/bench_observer.py [--events 20000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "behavioural_patterns"))
+
+from observer import ASYNC, SYNC, THREAD, EventBus  # noqa: E402
+
+BACKENDS = [f"10.0.0.{i}:3000" for i in range(10)]
+
+
+class NaiveSubject:
+    # the textbook subject : a list of (pattern, callback), every pattern matched on every notify
+    def __init__(self):
+        self._observers = []
+
+    def subscribe(self, pattern, callback):
+        self._observers.append((pattern, callback))
+
+    def publish(self, topic, event):
+        for pattern, callback in self._observers:
+            if pattern == "*" or pattern == topic or (pattern.endswith(".*") and topic.startswith(pattern[:-1])):
+                callback(topic, event)
+
+
+def noop(topic, event):
+    pass
+
+
+def noop_batch(batch):
+    pass
+
+
+def dispatch(subject, n, events) -> float:
+    for i in range(n):
+        subject.subscribe("backend.health", noop)
+        subject.subscribe(f"other.topic{i}", noop)
+    event = {"server": BACKENDS[0], "healthy": True}
+    start = time.perf_counter()
+    for _ in range(events):
+        subject.publish("backend.health", event)
+    return (time.perf_counter() - start) / events
+
+
+def wait_delivered(subscriptions, total, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while sum(s.delivered for s in subscriptions) < total and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def queued(n, events, batch):
+    bus = EventBus()
+    options = {"batch": True, "max_batch": 256} if batch else {}
+    callback = noop_batch if batch else noop
+    subscriptions = [bus.subscribe("backend.health", callback, mode=THREAD, max_queue=events, **options)
+                     for _ in range(n)]
+    event = {"server": BACKENDS[0], "healthy": True}
+    start = time.perf_counter()
+    for _ in range(events):
+        bus.publish("backend.health", event)
+    published = time.perf_counter() - start
+    wait_delivered(subscriptions, n * events)
+    total = time.perf_counter() - start
+    bus.close()
+    return published / events, n * events / total
+
+
+def queued_async(n, events, batch):
+    async def run():
+        bus = EventBus()
+        options = {"batch": True, "max_batch": 256} if batch else {}
+        callback = noop_batch if batch else noop
+        subscriptions = [bus.subscribe("backend.health", callback, mode=ASYNC, max_queue=events, **options)
+                         for _ in range(n)]
+        event = {"server": BACKENDS[0], "healthy": True}
+        start = time.perf_counter()
+        for _ in range(events):
+            bus.publish("backend.health", event)
+        published = time.perf_counter() - start
+        while sum(s.delivered for s in subscriptions) < n * events:
+            await asyncio.sleep(0)
+        total = time.perf_counter() - start
+        bus.close()
+        return published / events, n * events / total
+    return asyncio.run(run())
+
+
+def slow(mode) -> float:
+    bus = EventBus()
+    bus.subscribe("backend.health", lambda topic, event: time.sleep(0.001), mode=mode, max_queue=100)
+    bus.subscribe("backend.health", noop)
+    start = time.perf_counter()
+    for i in range(2000):
+        bus.publish("backend.health", {"server": BACKENDS[i % 10], "healthy": True})
+    elapsed = time.perf_counter() - start
+    bus.close()
+    return elapsed
+
+
+def burst(events, coalesce) -> int:
+    bus = EventBus()
+    calls = []
+
+    def on_health(batch):
+        time.sleep(0.0001)
+        calls.append(len(batch))
+    options = {"coalesce": lambda topic, event: event["server"]} if coalesce else {}
+    subscription = bus.subscribe("backend.health", on_health, mode=THREAD, batch=True, max_batch=1, max_queue=events,
+                                 **options)
+    for i in range(events):
+        bus.publish("backend.health", {"server": BACKENDS[i % 10], "healthy": i % 3 != 0})
+    while len(subscription.queue):
+        time.sleep(0.001)
+    time.sleep(0.01)
+    bus.close()
+    return len(calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000)
+    args = parser.parse_args()
+
+    print("dispatch : ns per publish, sync subscribers")
+    print(f"{'subscribers':>12}{'naive':>12}{'EventBus':>12}")
+    for n in (1, 10, 100, 1000):
+        events = max(args.events // n, 100)
+        naive = dispatch(NaiveSubject(), n, events)
+        table = dispatch(EventBus(), n, events)
+        print(f"{n:>12}{naive * 1e9:>12.0f}{table * 1e9:>12.0f}")
+
+    for name, run in (("thread", queued), ("async", queued_async)):
+        print(f"\nqueued ({name}) : publisher ns per event, delivered events/s")
+        print(f"{'subscribers':>12}{'publish':>12}{'one by one':>14}{'publish':>12}{'batch':>14}")
+        for n in (1, 4, 16):
+            one_publish, one_rate = run(n, args.events, False)
+            batch_publish, batch_rate = run(n, args.events, True)
+            print(f"{n:>12}{one_publish * 1e9:>12.0f}{one_rate:>14,.0f}"
+                  f"{batch_publish * 1e9:>12.0f}{batch_rate:>14,.0f}")
+
+    print("\nslow subscriber (1 ms per event) : seconds to publish 2000 events")
+    print(f"  {'sync':<8}{slow(SYNC):>8.3f}")
+    print(f"  {'thread':<8}{slow(THREAD):>8.3f}")
+
+    events = min(args.events, 5000)
+    print(f"\nburst : {events} health events over {len(BACKENDS)} backends, subscriber calls")
+    print(f"  {'queued':<10}{burst(events, False):>8}")
+    print(f"  {'coalesced':<10}{burst(events, True):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark : settlement run throughput, one payment at a time vs the batch API (creational_patterns/batch_payments.py).
+
+Stand-in provider endpoints (one per provider, in their own process) : POST /charges answered after `--latency`
+seconds, `--failure-rate` of the calls fail with a 503 (the client retries with the same idempotency key),
+charges are deduplicated by Idempotency-Key like a real payment API.
+
+`--payments` payments over Stripe and Razorpay, `--duplicate-rate` of them repeat an earlier key (a retried
+settlement line). The payments are a generator, the results are consumed as they stream back.
+
+    sequential : provider.charge() for each payment in turn, the former one call per payment
+    batch xN   : PaymentFactoryMethod.make_payments(..., max_concurrency=N)
+
+Reported : payments per second, results by status, charges the providers recorded (must equal the succeeded
+payments : retries and duplicates are never charged twice).
+
+usage : python benchmarks/bench_payments.py [--payments 5000] [--latency 0.002] [--concurrency 1,8,32]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "creational_patterns"))
+
+from factory import PaymentFactoryMethod, PaymentRequest, Razorpay, Stripe  # noqa: E402
+from batch_payments import PaymentError  # noqa: E402
+from providers import ProviderRegistry  # noqa: E402
+
+
+class StandInProviderHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    # head and body are two writes : without TCP_NODELAY the body waits for the delayed ACK of the head
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(server.latency)
+        if server.random.random() < server.failure_rate:
+            self.reply(503, {"message": "try again"})
+            return
+        key = self.headers.get("Idempotency-Key")
+        with server.lock:
+            if key in server.charges:
+                replay = True
+            else:
+                server.charges[key] = json.loads(body)["amount"]
+                replay = False
+        self.reply(200, {"status": "succeeded", "replayed": replay})
+
+    def reply(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def providers_main(conn, count, latency, failure_rate):
+    # stand-in provider APIs process
+    servers = []
+    for i in range(count):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StandInProviderHandler)
+        server.daemon_threads = True
+        server.latency, server.failure_rate = latency, failure_rate
+        server.random, server.lock, server.charges = random.Random(i), threading.Lock(), {}
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    conn.send([server.server_address[1] for server in servers])
+    while conn.recv() == "charges":
+        conn.send(sum(len(server.charges) for server in servers))
+        for server in servers:
+            server.charges.clear()
+
+
+def payment_stream(count, duplicate_rate, run):
+    rng = random.Random(42)
+    for i in range(count):
+        key = f"{run}-{rng.randrange(i)}" if i and rng.random() < duplicate_rate else f"{run}-{i}"
+        yield PaymentRequest("Stripe" if i % 2 else "Razorpay", 100 + i % 900, key)
+
+
+def sequential(factory, payments):
+    # one payment at a time, the same retries, keys remembered the same way
+    seen = set()
+    for provider_name, amount, key in payments:
+        if key in seen:
+            yield "duplicate"
+            continue
+        provider = factory.get_payment_provider(provider_name)
+        for _ in range(3):
+            try:
+                provider.charge(amount, key)
+                seen.add(key)
+                yield "succeeded"
+                break
+            except PaymentError:
+                pass
+        else:
+            yield "failed"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payments", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.002, help="provider API latency in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--duplicate-rate", type=float, default=0.01)
+    parser.add_argument("--concurrency", default="1,8,32", help="max_concurrency of the batch runs")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    conn, child = context.Pipe()
+    process = context.Process(target=providers_main, args=(child, 2, args.latency, args.failure_rate), daemon=True)
+    process.start()
+    stripe_port, razorpay_port = conn.recv()
+
+    factory = PaymentFactoryMethod()
+    # providers pointed at the stand-ins instead of the print only defaults
+    factory.payment_providers = ProviderRegistry()
+    factory.payment_providers.register("Stripe", Stripe, endpoint=("127.0.0.1", stripe_port))
+    factory.payment_providers.register("Razorpay", Razorpay, endpoint=("127.0.0.1", razorpay_port))
+
+    runs = [("sequential", lambda payments: sequential(factory, payments))]
+    for n in map(int, args.concurrency.split(",")):
+        runs.append((f"batch x{n}", lambda payments, n=n: (
+            result.status for result in factory.make_payments(payments, max_concurrency=n))))
+
+    print(f"{args.payments} payments, {args.latency * 1000:.1f} ms per provider call, "
+          f"{args.failure_rate:.0%} transient failures, {args.duplicate_rate:.0%} repeated keys")
+    print(f"{'run':<14}{'payments/s':>12}{'succeeded':>11}{'duplicate':>11}{'failed':>8}{'charged':>9}")
+    try:
+        for index, (name, run) in enumerate(runs):
+            start = time.perf_counter()
+            statuses = Counter(run(payment_stream(args.payments, args.duplicate_rate, index)))
+            elapsed = time.perf_counter() - start
+            conn.send("charges")
+            charged = conn.recv()
+            print(f"{name:<14}{args.payments / elapsed:>12.0f}{statuses['succeeded']:>11}{statuses['duplicate']:>11}"
+                  f"{statuses['failed']:>8}{charged:>9}")
+    finally:
+        conn.send("stop")
+        process.join(5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark : getting a shared instance from many threads (creational_patterns/singleton.py).
+
+    contention : `--threads` threads each get the instance `--calls` times, ns per call and calls per second for
+                   locked        : the former ThreadSafeSingleton, the lock is taken on every call
+                   double-checked: ThreadSafeSingleton, lock only while the instance does not exist
+                   metaclass     : SingletonMeta (double-checked locking)
+                   multiton      : MultitonMeta, 8 keys
+                   weak multiton : MultitonMeta(weak=True), 8 keys kept alive by the benchmark
+    race       : `--threads` threads released together on a class whose __init__ takes 1 ms, number of
+                 instances constructed : 1 when creation is thread safe.
+
+usage : python benchmarks/bench_singleton.py [--threads 32] [--calls 20000]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "creational_patterns"))
+
+from singleton import MultitonMeta, SingletonMeta, ThreadSafeSingleton  # noqa: E402
+
+KEYS = [f"10.0.0.{i}:3000" for i in range(8)]
+
+
+class LockedSingleton:
+    # ThreadSafeSingleton before double-checked locking
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+        return cls._instance
+
+
+class DoubleChecked(ThreadSafeSingleton):
+    _instance = None
+
+
+class MetaSingleton(metaclass=SingletonMeta):
+    pass
+
+
+class Multiton(metaclass=MultitonMeta):
+    def __init__(self, key):
+        self.key = key
+
+
+class WeakMultiton(metaclass=MultitonMeta, weak=True):
+    def __init__(self, key):
+        self.key = key
+
+
+class UnsafeMeta(type):
+    # SingletonMeta before the lock : check then create
+    _instances = {}
+
+    def __call__(cls, *args, **kwargs):
+        if cls not in cls._instances:
+            cls._instances[cls] = super().__call__(*args, **kwargs)
+        return cls._instances[cls]
+
+
+def run_threads(threads, target):
+    barrier = threading.Barrier(threads)
+    workers = [threading.Thread(target=target, args=(barrier,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def contention(get, threads, calls) -> float:
+    def work(barrier):
+        barrier.wait()
+        for i in range(calls):
+            get(i)
+    return run_threads(threads, work) / (threads * calls)
+
+
+def race(metaclass, threads) -> int:
+    constructed = []
+
+    class Slow(metaclass=metaclass):
+        def __init__(self):
+            time.sleep(0.001)
+            constructed.append(self)
+
+    def work(barrier):
+        barrier.wait()
+        Slow()
+    run_threads(threads, work)
+    return len(constructed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    # the weak instances stay while referenced here
+    alive = [WeakMultiton(key) for key in KEYS]
+    cases = {
+        "locked": lambda i: LockedSingleton(),
+        "double-checked": lambda i: DoubleChecked(),
+        "metaclass": lambda i: MetaSingleton(),
+        "multiton": lambda i: Multiton(KEYS[i & 7]),
+        "weak multiton": lambda i: WeakMultiton(KEYS[i & 7]),
+    }
+    print(f"{args.threads} threads x {args.calls} calls")
+    print(f"{'instance':<16}{'ns/call':>10}{'calls/s':>14}")
+    for name, get in cases.items():
+        seconds = contention(get, args.threads, args.calls)
+        print(f"{name:<16}{seconds * 1e9:>10.0f}{1 / seconds:>14,.0f}")
+    # every weak multiton call above found its instance : none was dropped and rebuilt
+    assert all(WeakMultiton(key) is instance for key, instance in zip(KEYS, alive))
+
+    print(f"\ninstances constructed by {args.threads} racing threads")
+    print(f"  {'unsafe metaclass':<18}{race(UnsafeMeta, args.threads):>4}")
+    print(f"  {'SingletonMeta':<18}{race(SingletonMeta, args.threads):>4}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark : schema compiled validators vs an interpretive walk of the schema (schema_validation.py).
+
+Realistic request bodies :
+    signup : flat object, string lengths, email pattern, integer range, enum
+    order  : nested object with an array of `--items` line items, each an object with its own rules
+Valid payloads (every rule is checked) and invalid ones (fail on the last line item : worst case for both).
+
+    interpretive : first_error(schema, payload), dict lookups per keyword and per value
+    compiled     : compile_schema(schema)(payload), generated straight line checks
+    batch        : compile_batch(schema)(payloads), per payload cost of validating a list of `--batch`
+
+usage : python benchmarks/bench_validation.py [--requests 20000] [--items 20] [--batch 1000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "behavioural_patterns"))
+
+from schema_validation import compile_batch, compile_schema, first_error  # noqa: E402
+
+SIGNUP_SCHEMA = {
+    "type": "object",
+    "required": ["user", "email", "password"],
+    "additional_properties": False,
+    "properties": {
+        "user": {"type": "string", "min_length": 3, "max_length": 32},
+        "email": {"type": "string", "max_length": 254, "pattern": r"^[^@\s]+@[^@\s]+\.[a-z]+$"},
+        "password": {"type": "string", "min_length": 8},
+        "age": {"type": "integer", "minimum": 13, "maximum": 150},
+        "plan": {"type": "string", "enum": ["free", "pro", "team"]},
+    },
+}
+
+ORDER_SCHEMA = {
+    "type": "object",
+    "required": ["order_id", "customer", "items"],
+    "properties": {
+        "order_id": {"type": "string", "min_length": 1},
+        "customer": {
+            "type": "object",
+            "required": ["id", "country"],
+            "properties": {
+                "id": {"type": "integer", "minimum": 1},
+                "country": {"type": "string", "enum": ["IN", "US", "DE"]},
+            },
+        },
+        "items": {
+            "type": "array",
+            "min_items": 1,
+            "max_items": 100,
+            "items": {
+                "type": "object",
+                "required": ["sku", "quantity", "price"],
+                "properties": {
+                    "sku": {"type": "string", "pattern": r"^[A-Z]{3}-\d+$"},
+                    "quantity": {"type": "integer", "minimum": 1, "maximum": 1000},
+                    "price": {"type": "number", "minimum": 0},
+                },
+            },
+        },
+        "coupon": {"type": "string", "max_length": 16},
+    },
+}
+
+
+def payloads(items):
+    signup = {"user": "alice", "email": "alice@example.com", "password": "correct horse", "age": 30, "plan": "pro"}
+    order = {
+        "order_id": "o-1001",
+        "customer": {"id": 42, "country": "IN"},
+        "items": [{"sku": f"ABC-{i}", "quantity": 1 + i % 5, "price": 9.99} for i in range(items)],
+    }
+    bad_order = {**order, "items": order["items"][:-1] + [{"sku": "ABC-1", "quantity": 0, "price": 9.99}]}
+    return [
+        ("signup", SIGNUP_SCHEMA, signup, {**signup, "plan": "gold"}),
+        ("order", ORDER_SCHEMA, order, bad_order),
+    ]
+
+
+def per_call(call, payload, requests) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        call(payload)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=20, help="line items per order")
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'payload':<9}{'valid':<7}{'interpretive us':>17}{'compiled us':>13}{'batch us':>10}{'speedup':>9}")
+    for name, schema, good, bad in payloads(args.items):
+        validate = compile_schema(schema)
+        validate_batch = compile_batch(schema)
+        for valid, payload in ((True, good), (False, bad)):
+            assert validate(payload) is valid and (first_error(schema, payload) is None) is valid
+            interpretive = per_call(lambda p: first_error(schema, p), payload, args.requests)
+            compiled = per_call(validate, payload, args.requests)
+            batch = per_call(validate_batch, [payload] * args.batch, max(1, args.requests // args.batch)) / args.batch
+            print(f"{name:<9}{str(valid):<7}{interpretive * 1e6:>17.2f}{compiled * 1e6:>13.2f}{batch * 1e6:>10.2f}"
+                  f"{interpretive / compiled:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,17 @@ Abstract factory method -
         -  creational design pattern 
         -  provides an interface for creating families of related or dependent objects without specifying their concrete classes.
         - Factory of Factories: The abstract factory pattern is essentially a factory that creates other factories. These factories then produce objects of related classes.
-        - 
+        - On a request path, allocating a fresh product per call is wasted work :
+            CachingUIFactory : stateless products are built once (lazily) and shared.
+            PooledUIFactory  : products with state are borrowed from a bounded pool and reset when given back.
 
 """
 # consider example of UI: Dark theme , Light Theme. Though this is mostly handled from frontend iteself. Consider this as an example only.
 
 from abc import abstractmethod
 
+from providers import LazyProvider, ObjectPool
+
 # Abstract Product: Button
 class Button():
     @abstractmethod
@@ -67,6 +71,35 @@ class LightUIFactory(UIFactory):
     def create_checkbox(self) -> Checkbox:
         return LightCheckbox()
     
+# precomputed products : one shared instance per product, for stateless products
+class CachingUIFactory(UIFactory):
+    def __init__(self, factory: UIFactory):
+        self._button = LazyProvider(factory.create_button)
+        self._checkbox = LazyProvider(factory.create_checkbox)
+
+    def create_button(self) -> Button:
+        return self._button.get()
+
+    def create_checkbox(self) -> Checkbox:
+        return self._checkbox.get()
+
+# pooled products : borrowed with create_*, given back with release()
+class PooledUIFactory(UIFactory):
+    def __init__(self, factory: UIFactory, max_size=64, reset=None):
+        # reset(product) : clear the state of a product before it is handed out again
+        self.buttons = ObjectPool(factory.create_button, max_size, reset)
+        self.checkboxes = ObjectPool(factory.create_checkbox, max_size, reset)
+
+    def create_button(self) -> Button:
+        return self.buttons.acquire()
+
+    def create_checkbox(self) -> Checkbox:
+        return self.checkboxes.acquire()
+
+    def release(self, product):
+        pool = self.buttons if isinstance(product, Button) else self.checkboxes
+        pool.release(product)
+
 # for client usage 
 def build_ui(factory: UIFactory):
     button = factory.create_button()
@@ -86,4 +119,13 @@ if __name__ == "__main__":
     # User selects the light theme
     light_factory = LightUIFactory()
     print("\nBuilding Light Theme UI:")
-    build_ui(light_factory)
\ No newline at end of file
+    build_ui(light_factory)
+
+    # request path : the same products again and again
+    cached_factory = CachingUIFactory(dark_factory)
+    print("\nshared button :", cached_factory.create_button() is cached_factory.create_button())  # True
+
+    pooled_factory = PooledUIFactory(light_factory, max_size=8)
+    button = pooled_factory.create_button()
+    pooled_factory.release(button)
+    print("pooled button reused :", pooled_factory.create_button() is button, pooled_factory.buttons.stats())
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+Bulk payment dispatch for the payment providers of factory.py (settlement runs : hundreds of thousands of payments)
+
+    stream      : make_payments() takes any iterable (a generator reading a file, a DB cursor ...) and is itself a
+                  generator of PaymentResult : at most `chunk_size` payments plus the in-flight groups are in
+                  memory, never the whole run or a list of every result.
+    grouping    : each chunk is grouped by provider, a group of up to `group_size` payments goes to one worker
+                  which sends them one after the other over its keep-alive connection to that provider.
+    concurrency : a thread pool of `max_concurrency` workers, at most `max_concurrency` groups in flight.
+    idempotency : every payment carries an idempotency key (generated when missing). The provider is sent the key
+                  (Idempotency-Key header) so a retry after a timeout is never charged twice, and the dispatcher
+                  remembers the keys it completed (for a day, at most `max_keys` of them, see IdempotencyStore) :
+                  the same key again is reported "duplicate" without calling the provider. Failed attempts
+                  (connection errors, 5xx, 408 / 429) are retried `retries` times with the same key.
+
+Results come back as groups complete, not in input order (match them by idempotency key).
+
+usage :
+    for result in PaymentFactoryMethod().make_payments(PaymentRequest("Stripe", amount) for amount in amounts):
+        ...
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+PaymentRequest = namedtuple("PaymentRequest", ["provider", "amount", "idempotency_key"], defaults=[None])
+# status : "succeeded", "declined", "failed" (retries exhausted, unknown provider, provider error), "duplicate"
+# (key already completed)
+PaymentResult = namedtuple("PaymentResult", ["idempotency_key", "provider", "amount", "status", "attempts"])
+
+
+class PaymentError(Exception):
+    """transient failure of a provider call (connection error, 5xx, 408 / 429) : retried with the same key"""
+
+
+class IdempotencyStore:
+    """
+    keys being processed or completed. claim() is atomic, so one key is only ever sent by one worker.
+    Bounded : a key is forgotten `ttl` seconds after it was claimed (providers keep idempotency keys about a day)
+    and past `max_keys` the oldest keys go first, so a long run does not keep every key it ever saw.
+    `max_keys` must stay well above the payments in flight (max_concurrency * group_size).
+    """
+
+    def __init__(self, max_keys=1_000_000, ttl=24 * 3600.0, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self._claimed = OrderedDict()  # key -> claim time, oldest first
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.clock = clock
+        self.evicted = 0
+
+    def claim(self, key) -> bool:
+        now = self.clock()
+        with self._lock:
+            claimed = self._claimed
+            if key in claimed:
+                if now - claimed[key] <= self.ttl:
+                    return False
+                del claimed[key]
+            claimed[key] = now
+            # oldest first : expired keys, then whatever is over the bound
+            while claimed:
+                oldest, claimed_at = next(iter(claimed.items()))
+                if len(claimed) <= self.max_keys and now - claimed_at <= self.ttl:
+                    break
+                del claimed[oldest]
+                self.evicted += 1
+            return True
+
+    def release(self, key):
+        # failed for good : a later run may try the key again
+        with self._lock:
+            self._claimed.pop(key, None)
+
+    def __len__(self):
+        return len(self._claimed)
+
+
+class BatchPaymentDispatcher:
+
+    def __init__(self, get_provider, max_concurrency=16, chunk_size=1000, group_size=50, retries=2, store=None):
+        # get_provider(name) -> Payment, e.g. PaymentFactoryMethod().get_payment_provider
+        self.get_provider = get_provider
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+        self.group_size = group_size
+        self.retries = retries
+        self.store = store or IdempotencyStore()
+
+    def make_payments(self, payments):
+        """generator of PaymentResult, one per payment of the iterable `payments`"""
+        payments = iter(payments)
+        with ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="payments") as executor:
+            in_flight = set()
+            while True:
+                chunk = list(islice(payments, self.chunk_size))
+                if not chunk:
+                    break
+                groups = defaultdict(list)
+                for payment in chunk:
+                    groups[payment.provider].append(payment)
+                for provider, group in groups.items():
+                    for start in range(0, len(group), self.group_size):
+                        while len(in_flight) >= self.max_concurrency:
+                            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                yield from future.result()
+                        in_flight.add(executor.submit(self.run_group, provider, group[start:start + self.group_size]))
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+
+    def run_group(self, provider_name, payments):
+        # worker : the payments of one provider, one after the other over the worker's connection.
+        # never raises : an exception here would end make_payments() and lose the results of the other groups
+        try:
+            provider = self.get_provider(provider_name)
+        except Exception:
+            # unknown provider (KeyError) or one failing to build : nothing of the group is sent
+            return [PaymentResult(key or uuid.uuid4().hex, provider_name, amount, "failed", 0)
+                    for _, amount, key in payments]
+        results = []
+        for provider_name, amount, key in payments:
+            key = key or uuid.uuid4().hex
+            if not self.store.claim(key):
+                results.append(PaymentResult(key, provider_name, amount, "duplicate", 0))
+                continue
+            status = "failed"
+            attempts = 0
+            while attempts <= self.retries:
+                attempts += 1
+                try:
+                    status = "succeeded" if provider.charge(amount, key) else "declined"
+                    break
+                except PaymentError:
+                    continue
+                except Exception:
+                    # not transient (bad amount, bug in the provider) : not retried
+                    break
+            if status == "failed":
+                self.store.release(key)
+            results.append(PaymentResult(key, provider_name, amount, status, attempts))
+        return results
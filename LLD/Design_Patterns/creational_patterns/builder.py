@@ -9,12 +9,24 @@ Benefits :
     - Flexibility: Different types of orders (e.g., standard, express) can be built using the same builder process but with different configurations.
     - Readability: The order-building process is easy to read and maintain with method chaining, as opposed to a large constructor with many parameters.
     - Extendability: Adding new order components (e.g., new shipping methods, payment methods) only requires adding new methods in the builder without changing the core construction logic.
+
+High volume (import jobs building millions of orders):
+    - Order is slotted : no per instance __dict__, about half the memory of a dict backed object.
+    - BulkOrderBuilder builds orders from an iterable of dicts or CSV rows as a stream (one row in memory at a time),
+      one constructor call per order instead of one chained builder call per field / item.
+    - OrderColumns keeps many orders as columns : typed arrays of codes into one table of distinct strings
+      (shipping / payment methods, discounts and item names repeat across orders), items flattened with offsets.
+      A few bytes per order instead of a few hundred, Order objects only built when one is looked at.
 """
+import csv
+from array import array
 
 # consider an example of ecommerce application where you have a order which should have properties and items , shipping method, payment_method, discount.
 
 class Order:
 
+    __slots__ = ("items", "shipping_method", "payment_method", "discount")
+
     def __init__(self):
         self.items = []
         self.shipping_method = None
@@ -61,6 +73,109 @@ class OrderBuilderDirector:
         discount = order_details.get('discount')
         self.builder.set_items(items).set_shipping_method(delivery_method).set_payment_method(payment_method).set_discount(discount)
 
+# bulk construction 
+def make_order(items, shipping_method, payment_method, discount) -> Order:
+    order = Order.__new__(Order)
+    order.items = items
+    order.shipping_method = shipping_method
+    order.payment_method = payment_method
+    order.discount = discount
+    return order
+
+class OrderColumns:
+    """Many orders stored column wise, order i is rebuilt on access (orders[i], iteration)."""
+
+    def __init__(self):
+        self.strings = []           # distinct values, code -> string (None included)
+        self._codes = {}            # string -> code
+        self.items = array('I')     # item codes of every order, one after the other
+        self.item_offsets = array('I', [0])  # items of order i : items[item_offsets[i]:item_offsets[i + 1]]
+        self.shipping_methods = array('I')
+        self.payment_methods = array('I')
+        self.discounts = array('I')
+
+    def code(self, value) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+    def append(self, items, shipping_method, payment_method, discount):
+        code = self.code
+        self.items.extend([code(item) for item in items])
+        self.item_offsets.append(len(self.items))
+        self.shipping_methods.append(code(shipping_method))
+        self.payment_methods.append(code(payment_method))
+        self.discounts.append(code(discount))
+
+    def __len__(self):
+        return len(self.shipping_methods)
+
+    def __getitem__(self, index) -> Order:
+        strings = self.strings
+        size = len(self)
+        if index < 0:
+            index += size
+        # checked here : a negative index past -len would silently wrap into the columns of another order
+        if not 0 <= index < size:
+            raise IndexError("order index out of range")
+        items = [strings[code] for code in self.items[self.item_offsets[index]:self.item_offsets[index + 1]]]
+        return make_order(items, strings[self.shipping_methods[index]], strings[self.payment_methods[index]],
+                          strings[self.discounts[index]])
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+class BulkOrderBuilder:
+    """
+    Builds orders from rows shaped like the director's order_details :
+        {"items": ["t-shirt", "jeans"] or "t-shirt;jeans", "delivery_method": ..., "payment_method": ..., "discount": ...}
+    Rows are read one at a time, so a CSV file of any size streams through.
+    """
+
+    def __init__(self, item_separator=";"):
+        self.item_separator = item_separator
+
+    def fields(self, row):
+        items = row.get('items') or []
+        # a list of its own : the order must not share the caller's row
+        items = items.split(self.item_separator) if isinstance(items, str) else list(items)
+        # CSV rows have "" for empty cells
+        return (items, row.get('delivery_method') or None, row.get('payment_method') or None,
+                row.get('discount') or None)
+
+    def orders(self, rows):
+        """generator of slotted Orders, one per row"""
+        fields = self.fields
+        for row in rows:
+            yield make_order(*fields(row))
+
+    def columns(self, rows, batch_size=None):
+        """all the rows in one OrderColumns, or a generator of OrderColumns of batch_size orders"""
+        if batch_size is not None:
+            return self._column_batches(rows, batch_size)
+        batch = OrderColumns()
+        append, fields = batch.append, self.fields
+        for row in rows:
+            append(*fields(row))
+        return batch
+
+    def _column_batches(self, rows, batch_size):
+        batch = OrderColumns()
+        for row in rows:
+            batch.append(*self.fields(row))
+            if len(batch) == batch_size:
+                yield batch
+                batch = OrderColumns()
+        if len(batch):
+            yield batch
+
+    @staticmethod
+    def csv_rows(csv_file):
+        """rows of a CSV file with a header line (items, delivery_method, payment_method, discount), read lazily"""
+        return csv.DictReader(csv_file)
+
 if __name__ == "__main__":
     # Demonstrate form generation using the Builder Pattern
     order_builder = OrderBuilder()
@@ -75,6 +190,17 @@ if __name__ == "__main__":
     order = order_builder.build()
     print(order.items, order.shipping_method, order.payment_method,  order.discount)
 
+    # import job : orders streamed from CSV rows
+    import io
+    csv_file = io.StringIO(
+        "items,delivery_method,payment_method,discount\n"
+        "t-shirt;jeans,Regular Shipping Method,COD,SUMMER50\n"
+        "shoes,Express Shipping Method,CARD,\n"
+    )
+    orders = BulkOrderBuilder().columns(BulkOrderBuilder.csv_rows(csv_file))
+    for order in orders:
+        print(order.items, order.shipping_method, order.payment_method, order.discount)
+
 # so here creation of complex object is still same we are just adding properties.
 # order = OrderBuilder().set_items('t-shirt').set_items('jeans').set_shipping_method('standard_delivery').set_payment_method('COD').set_discount('SUMMER50').build()
 # print(order.items, order.shipping_method, order.payment_method,  order.discount)
\ No newline at end of file
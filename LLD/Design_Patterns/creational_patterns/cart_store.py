@@ -0,0 +1,283 @@
+"""
+Shopping carts of many concurrent sessions, for get_cart_store() (singleton.py)
+
+The ShoppingCart singleton holds one list for the whole process : every session shares it, threads append to it
+without a lock and remove_item is a list scan. Here one process-wide store holds one cart per session id.
+
+    carts       : a cart is item -> quantity (dict) plus its total, so add / remove / set_quantity / count are
+                  O(1) whatever the size of the cart.
+    sharding    : the carts are spread over `shards` shards (hash of the session id), each with its own lock and
+                  dict. Two sessions only wait for each other when they land on the same shard, a whole shard is
+                  locked only by evict_idle() and snapshot(), one shard at a time.
+    ttl         : a cart not used for `ttl` seconds is expired. Expired carts are dropped when their session
+                  comes back and by evict_idle(), run every `interval` seconds by start_janitor().
+    persistence : snapshot(path) writes every cart to a JSON file (written to a temp file then renamed) or, for a
+                  .db / .sqlite path, to a SQLite table in one transaction. restore(path) loads it back.
+    keys        : session ids and items must be str (TypeError otherwise) : JSON and SQLite would give any other
+                  key back as a string, which hashes to another shard and misses the cart after a restore.
+
+usage :
+    store = CartStore(shards=16, ttl=1800)
+    store.add_item(session_id, "Laptop")
+    store.add_item(session_id, "Mouse", 2)
+    store.get_items(session_id)            -> {"Laptop": 1, "Mouse": 2}
+    store.snapshot("carts.db")
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+class Cart:
+    __slots__ = ("items", "count", "last_access")
+
+    def __init__(self, now):
+        self.items = {}
+        # total quantity, kept up to date instead of summing the items
+        self.count = 0
+        self.last_access = now
+
+
+class _Shard:
+    __slots__ = ("lock", "carts", "evicted")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.carts = {}
+        # counted under the shard lock, summed by CartStore.evicted
+        self.evicted = 0
+
+
+def _check_keys(session_id, item):
+    if type(session_id) is not str or type(item) is not str:
+        raise TypeError(f"session id and item must be str, got {type(session_id).__name__} "
+                        f"and {type(item).__name__}")
+
+
+class CartStore:
+
+    def __init__(self, shards=16, ttl=1800.0, clock=time.monotonic):
+        # rounded up to a power of two : the shard is hash & mask
+        size = 1
+        while size < shards:
+            size *= 2
+        self._shards = [_Shard() for _ in range(size)]
+        self._mask = size - 1
+        # None : carts never expire
+        self.ttl = ttl
+        self._ttl = float("inf") if ttl is None else ttl
+        self.clock = clock
+        self._stop = threading.Event()
+        self._janitor = None
+
+    @property
+    def evicted(self) -> int:
+        """expired carts dropped so far"""
+        return sum(shard.evicted for shard in self._shards)
+
+    def _renew(self, shard, session_id, now, create):
+        # slow path, shard lock held : the cart is missing or expired
+        if shard.carts.pop(session_id, None) is not None:
+            shard.evicted += 1
+        if not create:
+            return None
+        cart = shard.carts[session_id] = Cart(now)
+        return cart
+
+    def add_item(self, session_id, item, quantity=1) -> int:
+        """quantity of `item` in the cart after adding"""
+        # exact ints like restore() : 1.5 or True would make a snapshot which cannot be restored
+        if type(quantity) is not int or quantity <= 0:
+            raise ValueError(f"quantity must be a positive int, got {quantity!r}")
+        _check_keys(session_id, item)
+        shard = self._shards[hash(session_id) & self._mask]
+        now = self.clock()
+        with shard.lock:
+            cart = shard.carts.get(session_id)
+            if cart is None or now - cart.last_access > self._ttl:
+                cart = self._renew(shard, session_id, now, True)
+            cart.last_access = now
+            items = cart.items
+            total = items[item] = items.get(item, 0) + quantity
+            cart.count += quantity
+        return total
+
+    def remove_item(self, session_id, item, quantity=None) -> int:
+        """remove `quantity` of `item` (all of it when None), quantity left in the cart"""
+        if quantity is not None and (type(quantity) is not int or quantity < 0):
+            raise ValueError(f"quantity must be None or an int >= 0, got {quantity!r}")
+        shard = self._shards[hash(session_id) & self._mask]
+        now = self.clock()
+        with shard.lock:
+            cart = shard.carts.get(session_id)
+            if cart is None or now - cart.last_access > self._ttl:
+                self._renew(shard, session_id, now, False)
+                return 0
+            cart.last_access = now
+            items = cart.items
+            current = items.get(item)
+            if current is None:
+                return 0
+            left = 0 if quantity is None else max(current - quantity, 0)
+            if left:
+                items[item] = left
+            else:
+                del items[item]
+            cart.count -= current - left
+        return left
+
+    def set_quantity(self, session_id, item, quantity):
+        if type(quantity) is not int or quantity < 0:
+            raise ValueError(f"quantity must be an int >= 0, got {quantity!r}")
+        _check_keys(session_id, item)
+        shard = self._shards[hash(session_id) & self._mask]
+        now = self.clock()
+        with shard.lock:
+            cart = shard.carts.get(session_id)
+            if cart is None or now - cart.last_access > self._ttl:
+                cart = self._renew(shard, session_id, now, quantity > 0)
+                if cart is None:
+                    return
+            cart.last_access = now
+            current = cart.items.pop(item, 0)
+            if quantity:
+                cart.items[item] = quantity
+            cart.count += quantity - current
+
+    def get_items(self, session_id) -> dict:
+        """copy of the cart, item -> quantity"""
+        shard = self._shards[hash(session_id) & self._mask]
+        now = self.clock()
+        with shard.lock:
+            cart = shard.carts.get(session_id)
+            if cart is None or now - cart.last_access > self._ttl:
+                self._renew(shard, session_id, now, False)
+                return {}
+            cart.last_access = now
+            return cart.items.copy()
+
+    def count(self, session_id) -> int:
+        shard = self._shards[hash(session_id) & self._mask]
+        now = self.clock()
+        with shard.lock:
+            cart = shard.carts.get(session_id)
+            if cart is None or now - cart.last_access > self._ttl:
+                self._renew(shard, session_id, now, False)
+                return 0
+            cart.last_access = now
+            return cart.count
+
+    def discard(self, session_id):
+        # checkout / logout
+        shard = self._shards[hash(session_id) & self._mask]
+        with shard.lock:
+            shard.carts.pop(session_id, None)
+
+    def __len__(self):
+        return sum(len(shard.carts) for shard in self._shards)
+
+    def evict_idle(self) -> int:
+        """drop the carts idle for more than ttl seconds, returns how many"""
+        if self.ttl is None:
+            return 0
+        evicted = 0
+        for shard in self._shards:
+            deadline = self.clock() - self._ttl
+            with shard.lock:
+                expired = [session_id for session_id, cart in shard.carts.items() if cart.last_access < deadline]
+                for session_id in expired:
+                    del shard.carts[session_id]
+                shard.evicted += len(expired)
+            evicted += len(expired)
+        return evicted
+
+    def start_janitor(self, interval=60.0):
+        """evict idle carts every `interval` seconds on a background thread"""
+        def run():
+            while not self._stop.wait(interval):
+                self.evict_idle()
+        self._stop.clear()
+        self._janitor = threading.Thread(target=run, name="cart-janitor", daemon=True)
+        self._janitor.start()
+        return self
+
+    def stop_janitor(self):
+        self._stop.set()
+        if self._janitor is not None:
+            self._janitor.join()
+            self._janitor = None
+
+    def carts(self) -> dict:
+        """session id -> copy of the cart, consistent per shard (one shard locked at a time)"""
+        snapshot = {}
+        for shard in self._shards:
+            with shard.lock:
+                for session_id, cart in shard.carts.items():
+                    snapshot[session_id] = dict(cart.items)
+        return snapshot
+
+    def snapshot(self, path) -> int:
+        """write every cart to `path` (JSON, or SQLite for a .db / .sqlite path), returns the number of carts"""
+        carts = self.carts()
+        if path.endswith(SQLITE_SUFFIXES):
+            connection = sqlite3.connect(path)
+            try:
+                with connection:
+                    connection.execute("CREATE TABLE IF NOT EXISTS carts "
+                                       "(session_id TEXT, item TEXT, quantity INTEGER, PRIMARY KEY (session_id, item))")
+                    connection.execute("DELETE FROM carts")
+                    connection.executemany("INSERT INTO carts VALUES (?, ?, ?)",
+                                           ((session_id, item, quantity) for session_id, items in carts.items()
+                                            for item, quantity in items.items()))
+            finally:
+                connection.close()
+        else:
+            # a crash while writing leaves the previous snapshot in place
+            temporary = f"{path}.tmp"
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(carts, file, separators=(",", ":"))
+            os.replace(temporary, path)
+        return len(carts)
+
+    def restore(self, path) -> int:
+        """
+        load the carts of a snapshot (replacing the carts of the same sessions), returns how many.
+        The whole snapshot is checked before any cart is replaced : ValueError on a key that is not a string or a
+        quantity that is not a positive int.
+        """
+        if path.endswith(SQLITE_SUFFIXES):
+            connection = sqlite3.connect(path)
+            try:
+                carts = {}
+                for session_id, item, quantity in connection.execute("SELECT session_id, item, quantity FROM carts"):
+                    carts.setdefault(session_id, {})[item] = quantity
+            finally:
+                connection.close()
+        else:
+            with open(path, encoding="utf-8") as file:
+                carts = json.load(file)
+        if not isinstance(carts, dict):
+            raise ValueError(f"{path} : expected an object of carts, got {type(carts).__name__}")
+        restored = []
+        for session_id, items in carts.items():
+            if type(session_id) is not str or not isinstance(items, dict):
+                raise ValueError(f"{path} : bad cart {session_id!r}")
+            for item, quantity in items.items():
+                # bool is an int, 1.5 or "2" would break the counters
+                if type(item) is not str or type(quantity) is not int or quantity <= 0:
+                    raise ValueError(f"{path} : bad quantity {quantity!r} of {item!r} in cart {session_id!r}")
+            restored.append((session_id, dict(items), sum(items.values())))
+        now = self.clock()
+        for session_id, items, count in restored:
+            shard = self._shards[hash(session_id) & self._mask]
+            cart = Cart(now)
+            cart.items = items
+            cart.count = count
+            with shard.lock:
+                shard.carts[session_id] = cart
+        return len(carts)
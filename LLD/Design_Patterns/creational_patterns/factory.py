@@ -14,26 +14,81 @@ Benefits :
 Applications :
     - Library Frameworks: It’s commonly used in library frameworks, allowing developers to extend and customize the behavior of a library.
     - Plug-in Architectures: When building applications with extensible plug-in architectures, the Factory Method pattern simplifies the addition of new plug-ins without modifying existing code.
+
+On a request path (see providers.py):
+    - providers are built lazily, on first use, once (thread safe) : importing this module builds nothing.
+    - more providers can be installed as plugins, entry point group "system_design.payment_providers"
+      (e.g. paypal = "paypal_provider:Paypal"). They are only discovered when an unknown provider is asked for,
+      and only the one asked for is imported.
+
+Settlement runs (see batch_payments.py) :
+    - make_payments(payments) : a stream of PaymentRequest in, a generator of PaymentResult out, grouped by
+      provider, bounded concurrency, idempotency keys so that retries are never charged twice.
+    - a provider with an `endpoint` charges over HTTP (POST /charges, Idempotency-Key header, keep-alive
+      connection per worker thread), without one it only prints like make_payment.
 """
+import http.client
+import json
+import threading
 from abc import abstractmethod
 
+from batch_payments import BatchPaymentDispatcher, PaymentError, PaymentRequest  # noqa: F401  PaymentRequest re-exported
+from providers import ProviderRegistry
+
+PAYMENT_PROVIDERS_GROUP = "system_design.payment_providers"
+# answers of a provider that did not process the charge (timed out / rate limited) : retried, not a decline
+RETRYABLE_STATUSES = frozenset({408, 429})
+
 class Payment:
+    # (host, port) of the provider API, None : make_payment only prints
+    endpoint = None
+    timeout = 5.0
+
     @abstractmethod
     def make_payment(self,amount):
         pass
 
+    def charge(self, amount, idempotency_key) -> bool:
+        """
+        One payment, safe to retry with the same idempotency key : True when charged (any 2xx), False when
+        declined (other 4xx), PaymentError on a transient failure (connection error, 5xx, 408, 429).
+        """
+        if self.endpoint is None:
+            self.make_payment(amount)
+            return True
+        # one keep-alive connection per worker thread
+        local = self.__dict__.get("_local") or self.__dict__.setdefault("_local", threading.local())
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(*self.endpoint, timeout=self.timeout)
+        try:
+            conn.request("POST", "/charges", body=json.dumps({"amount": amount}),
+                         headers={"Content-Type": "application/json", "Idempotency-Key": idempotency_key})
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as e:
+            # the connection may be half used : open a new one for the retry
+            conn.close()
+            local.conn = None
+            raise PaymentError(str(e)) from e
+        if response.status >= 500 or response.status in RETRYABLE_STATUSES:
+            raise PaymentError(f"{getattr(self, 'name', type(self).__name__)} answered {response.status}")
+        return 200 <= response.status < 300
+
 class Stripe(Payment):
 
-    def __init__(self):
+    def __init__(self, endpoint=None):
         self.name = 'razorpay'
+        self.endpoint = endpoint
 
     def make_payment(self, amount : float ):
         print(f"{self.name} initiating payment {amount} ")
 
 class Razorpay(Payment):
 
-    def __init__(self):
+    def __init__(self, endpoint=None):
         self.name = 'razorpay'
+        self.endpoint = endpoint
 
     def make_payment(self, amount : float):
         print(f"{self.name} initiating payment {amount} ")
@@ -41,18 +96,36 @@ class Razorpay(Payment):
 class PaymentFactoryMethod:
 
     # suppose you have multiple payment providers 
-    payment_providers ={
-        "Stripe": Stripe(),
-        "Razorpay": Razorpay(),
-        }
+    # registered, not instantiated : each one is built the first time it is asked for
+    payment_providers = ProviderRegistry()
+    payment_providers.register("Stripe", Stripe)
+    payment_providers.register("Razorpay", Razorpay)
+    _plugins_discovered = False
 
     def get_payment_provider(self, payment_service_provider):
-       payment_service_provider = self.payment_providers[payment_service_provider]
+       if payment_service_provider not in self.payment_providers and not PaymentFactoryMethod._plugins_discovered:
+           # unknown name : look for installed plugins once
+           PaymentFactoryMethod._plugins_discovered = True
+           self.payment_providers.discover(PAYMENT_PROVIDERS_GROUP)
+       payment_service_provider = self.payment_providers.get(payment_service_provider)
        return payment_service_provider
 
+    def make_payments(self, payments, **options):
+        """
+        Batch API : payments is an iterable / stream of PaymentRequest(provider, amount, idempotency_key),
+        returns a generator of PaymentResult. options : max_concurrency, chunk_size, group_size, retries.
+        """
+        return BatchPaymentDispatcher(self.get_payment_provider, **options).make_payments(payments)
+
 if __name__ == "__main__":
     # This helps :  no need to explicitly create object of razorpay or strip class 
     # Factory will return its creation. 
     payment_factory = PaymentFactoryMethod()
     payment_provider = payment_factory.get_payment_provider('Razorpay')
-    payment_provider.make_payment(1000)
\ No newline at end of file
+    payment_provider.make_payment(1000)
+
+    # settlement run : a stream of payments, results streamed back. The repeated key is not charged twice
+    payments = [PaymentRequest("Stripe", 10, "order-1"), PaymentRequest("Razorpay", 20, "order-2"),
+                PaymentRequest("Stripe", 10, "order-1")]
+    for result in payment_factory.make_payments(payments, max_concurrency=2):
+        print(result)
\ No newline at end of file
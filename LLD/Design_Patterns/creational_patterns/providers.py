@@ -0,0 +1,138 @@
+"""
+Generic factory layer shared by factory.py and abstract_factory.py
+
+    LazyProvider     : builds its product on first use only (thread safe, double-checked locking like
+                       singleton.py), then returns the same instance without taking a lock.
+    ObjectPool       : bounded pool of reusable products. acquire() hands out an idle one (or builds a new one),
+                       release() resets it with the `reset` hook and keeps it, unless `max_size` are idle already.
+    ProviderRegistry : name -> LazyProvider. A provider is a class / callable, or a "module:attribute" string
+                       which is only imported on first use. discover(group) registers the entry points of a
+                       group (installed plugins) the same way : listed at startup, imported when first asked for.
+
+usage :
+    registry = ProviderRegistry()
+    registry.register("Stripe", "factory:Stripe")      # nothing imported yet
+    registry.discover("system_design.payment_providers")
+    registry.get("Stripe").make_payment(100)            # imports factory, builds Stripe() once
+"""
+
+import importlib
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+def load_target(target):
+    """class / callable as is, "package.module:Class.attr" imported"""
+    if not isinstance(target, str):
+        return target
+    module_name, _, attribute = target.partition(":")
+    value = importlib.import_module(module_name)
+    for name in filter(None, attribute.split(".")):
+        value = getattr(value, name)
+    return value
+
+
+class LazyProvider:
+
+    def __init__(self, target, *args, **kwargs):
+        # target : class / callable building the product, or "module:attribute" string
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def get(self):
+        # fast path, lock free : built already
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = load_target(self.target)(*self.args, **self.kwargs)
+                instance = self._instance
+        return instance
+
+
+class ObjectPool:
+
+    def __init__(self, create, max_size=64, reset=None):
+        self.create = create
+        self.max_size = max_size
+        # called with the product when it comes back, before another caller gets it
+        self.reset = reset
+        self._idle = deque()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def acquire(self):
+        try:
+            product = self._idle.pop()
+        except IndexError:
+            self.created += 1
+            return self.create()
+        self.reused += 1
+        return product
+
+    def release(self, product):
+        if self.reset is not None:
+            self.reset(product)
+        # deque.append / pop are atomic : no lock, the bound may be passed by a few products under contention
+        if len(self._idle) < self.max_size:
+            self._idle.append(product)
+        else:
+            self.discarded += 1
+
+    @contextmanager
+    def lease(self):
+        product = self.acquire()
+        try:
+            yield product
+        finally:
+            self.release(product)
+
+    def stats(self) -> dict:
+        return {"idle": len(self._idle), "created": self.created, "reused": self.reused,
+                "discarded": self.discarded}
+
+
+class ProviderRegistry:
+
+    def __init__(self):
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, target, *args, **kwargs):
+        with self._lock:
+            self._providers[name] = LazyProvider(target, *args, **kwargs)
+
+    def discover(self, group) -> list:
+        """register the entry points of `group` (not imported until used), returns their names"""
+        # importlib.metadata is slow to import, only paid by the programs discovering plugins
+        from importlib import metadata
+        names = []
+        for entry_point in metadata.entry_points(group=group):
+            # value is "module:attribute", imported by the LazyProvider on first use
+            self.register(entry_point.name, entry_point.value)
+            names.append(entry_point.name)
+        return names
+
+    def get(self, name):
+        provider = self._providers.get(name)
+        if provider is None:
+            raise KeyError(f"Unknown provider {name!r}, expected one of {sorted(self._providers)}")
+        return provider.get()
+
+    def __contains__(self, name):
+        return name in self._providers
+
+    def names(self) -> list:
+        return list(self._providers)
+
+    def loaded(self) -> list:
+        return [name for name, provider in self._providers.items() if provider.loaded]
@@ -23,22 +23,40 @@ Applications:
     - Logger Services: Centralizing application logging through a single logger instance.
     - Configuration Management: Ensuring a solitary configuration manager instance oversees application settings.
     - Hardware Access: Controlling access to hardware resources, such as a printer or sensor, through a single instance.
+
+Thread safety (shared clients such as a connection pool, used from every request thread):
+    - Double-checked locking: the instance is read without a lock, the lock is only taken while it does not exist yet
+      and the check is repeated under it. Once created, getting the instance is one dict / attribute read, no lock.
+    - Multiton: one instance per key (e.g. per backend address or per config), optionally held through weak
+      references so that an instance nobody uses anymore is evicted.
+    - Carts of many sessions: get_cart_store() returns one process-wide store holding one cart per session id,
+      sharded with a lock per shard, counter based carts and idle carts evicted after a ttl (see cart_store.py).
 """
 import threading
+import weakref
+
 # 1. MetaClass Implementation -> 
 class SingletonMeta(type):
     """this class is responsible for managing instances."""
     _instances = {}
+    # only taken while an instance is created. RLock : a singleton may create another one in its __init__
+    _lock = threading.RLock()
 
     def __call__(cls, *args, **kwargs):
         """
         Possible changes to the value of the `__init__` argument
         do not affect the returned instance.
         """
-        if cls not in cls._instances:
-            instance = super().__call__(*args, **kwargs)
-            cls._instances[cls] = instance
-        return cls._instances[cls]
+        # fast path, lock free : the instance exists already
+        instance = SingletonMeta._instances.get(cls)
+        if instance is None:
+            with SingletonMeta._lock:
+                # check again : another thread may have created it while we waited for the lock
+                instance = SingletonMeta._instances.get(cls)
+                if instance is None:
+                    instance = super().__call__(*args, **kwargs)
+                    SingletonMeta._instances[cls] = instance
+        return instance
 
 class Singleton(metaclass=SingletonMeta):
     """
@@ -73,12 +91,61 @@ class ThreadSafeSingleton:
     _lock = threading.Lock()
 
     def __new__(cls):
-        # a threading lock is used to ensure that only one thread can create the instance at a time, preventing race conditions
-        with cls._lock:
-            if cls._instance is None:
-                cls._instance = super().__new__(cls)
+        # double-checked locking : the lock is only taken while the instance does not exist yet
+        if cls._instance is None:
+            # a threading lock is used to ensure that only one thread can create the instance at a time, preventing race conditions
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
         return cls._instance
 
+# 3b. Multiton : one instance per key, e.g. one connection pool per backend address
+class MultitonMeta(type):
+    """
+    class Pool(metaclass=MultitonMeta)              -> Pool("10.0.0.1:3000") is Pool("10.0.0.1:3000")
+    class Pool(metaclass=MultitonMeta, weak=True)   -> instances are evicted once nobody references them
+    The key is the constructor arguments, or what the classmethod `instance_key(*args, **kwargs)` returns.
+    """
+
+    def __new__(mcs, name, bases, namespace, weak=False):
+        return super().__new__(mcs, name, bases, namespace)
+
+    def __init__(cls, name, bases, namespace, weak=False):
+        super().__init__(name, bases, namespace)
+        cls._multiton_instances = weakref.WeakValueDictionary() if weak else {}
+        cls._multiton_lock = threading.RLock()
+        # looked up once here, not on every call
+        cls._multiton_key = getattr(cls, "instance_key", None)
+
+    def __call__(cls, *args, **kwargs):
+        if cls._multiton_key is not None:
+            key = cls._multiton_key(*args, **kwargs)
+        else:
+            key = (args, frozenset(kwargs.items())) if kwargs else args
+        # same double-checked locking as SingletonMeta, per key
+        instance = cls._multiton_instances.get(key)
+        if instance is None:
+            with cls._multiton_lock:
+                instance = cls._multiton_instances.get(key)
+                if instance is None:
+                    instance = super().__call__(*args, **kwargs)
+                    cls._multiton_instances[key] = instance
+        return instance
+
+    def instances(cls) -> dict:
+        return dict(cls._multiton_instances)
+
+class BackendClient(metaclass=MultitonMeta, weak=True):
+    """one client per backend address, shared by every request thread while someone uses it"""
+    def __init__(self, address, timeout=2.0):
+        self.address = address
+        self.timeout = timeout
+
+    @classmethod
+    def instance_key(cls, address, timeout=2.0):
+        # the timeout does not make another client
+        return address
+
 # 4. Real world example :  Managing a Shopping Cart - In an eCommerce system, the shopping cart could be implemented as a Singleton to ensure that there is only one cart per user session.
 class ShoppingCart:
     _instance = None 
@@ -98,6 +165,32 @@ class ShoppingCart:
 
     def get_items(self):
         return self.items
+
+# 5. One cart per session : the store is the singleton, not the cart. Safe to use from every request thread.
+_cart_store = None
+_cart_store_options = {}
+_cart_store_lock = threading.Lock()
+
+def get_cart_store(**options):
+    """
+    the process-wide CartStore, created by the first call with `options` (shards, ttl ...). A later call passing
+    other options raises ValueError instead of silently ignoring them.
+    """
+    global _cart_store, _cart_store_options
+    # double-checked locking like SingletonMeta. cart_store is imported on first use only, so the other
+    # singletons of this module do not depend on it
+    store = _cart_store
+    if store is None:
+        with _cart_store_lock:
+            if _cart_store is None:
+                from cart_store import CartStore
+                _cart_store = CartStore(**options)
+                _cart_store_options = options
+                return _cart_store
+            store = _cart_store
+    if options and options != _cart_store_options:
+        raise ValueError(f"the cart store already exists with options {_cart_store_options}, got {options}")
+    return store
     
 # Usage
 if __name__ == "__main__":
@@ -110,4 +203,27 @@ if __name__ == "__main__":
     cart2.add_item("Smartphone")
 
     print(cart1.get_items())  # Output: ['Laptop', 'Smartphone']
-    print(cart1 is cart2)  # Output: True, both are the same instance
\ No newline at end of file
+    print(cart1 is cart2)  # Output: True, both are the same instance
+
+    # multiton : one client per backend, evicted when no longer referenced
+    client = BackendClient("127.0.0.1:3000")
+    print(client is BackendClient("127.0.0.1:3000", timeout=5.0))  # Output: True
+    print(BackendClient("127.0.0.1:3001") is client)  # Output: False
+    print(list(BackendClient.instances()))  # Output: ['127.0.0.1:3000'], the 3001 client was not kept
+
+    # one cart per session, shared by all the request threads
+    store = get_cart_store(shards=16, ttl=1800)
+    store.add_item("session-1", "Laptop")
+    store.add_item("session-2", "Smartphone")
+    get_cart_store().add_item("session-1", "Mouse", 2)
+    print(store.get_items("session-1"))  # Output: {'Laptop': 1, 'Mouse': 2}
+    print(store.remove_item("session-1", "Mouse", 1), store.count("session-1"))  # Output: 1 2
+
+    import os
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), "carts.db")
+    print(store.snapshot(path))  # Output: 2
+    from cart_store import CartStore
+    restored = CartStore()
+    restored.restore(path)
+    print(restored.get_items("session-2"))  # Output: {'Smartphone': 1}
\ No newline at end of file